@@ -0,0 +1,244 @@
+"""
+准入控制
+
+原来 handle_message 把每一帧都放进无界的 send_queue，一个客户端可以提交几个小时的RPA操作，
+执行到时早已过时，内存也没有上限。AdmissionController 在入队前检查：
+- 每个客户端一个令牌桶，限制提交请求的速率
+- 全局和每个客户端的在途任务量上限（已接受、尚未执行完的工作量）
+- 后台任务（批量发送，一次上千条）单独计量和限制，不占用交互任务的额度，
+  只在其他任务都执行完后执行，也不会挤占交互任务
+- 请求带超时时间且预计等不到执行时直接拒绝
+接受时返回排队位置和预计完成时间，预计时间由实测的各任务类型服务时间（指数移动平均）
+和排在前面的工作量计算。工作量的单位：文本消息按条，收藏转发按对话框次数。
+"""
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from scheduler import BACKGROUND_CLASSES, CLASS_ORDER, TASK_CLASSES
+
+# 还没有实测数据时使用的服务时间（秒/单位）
+DEFAULT_SERVICE_TIMES = {
+    'send_text': 2.0,
+    'send_favorite': 6.0,
+    'send_bulk': 1.0,
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        """
+        :param rate: 每秒补充的令牌数
+        :param burst: 桶容量
+        """
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def full(self) -> bool:
+        """令牌已补满，与新建的桶等价"""
+        self._refill()
+        return self.tokens >= self.burst
+
+    def retry_after(self, n: float = 1.0) -> float:
+        """还需要等待多少秒才有 n 个令牌"""
+        self._refill()
+        return max(0.0, (n - self.tokens) / self.rate) if self.rate > 0 else float('inf')
+
+
+@dataclass
+class Admission:
+    accepted: bool
+    reason: Optional[str] = None  # 拒绝原因：rate_limited / overloaded / client_limit / deadline
+    position: int = 0  # 接受时排在前面的工作量（含本次）
+    eta: float = 0.0  # 预计多少秒后执行完
+    retry_after: Optional[float] = None  # 拒绝时建议多少秒后重试
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = 500, max_client_in_flight: int = 200,
+                 rate: float = 5.0, burst: float = 20.0, alpha: float = 0.2, max_buckets: int = 10000,
+                 max_background_in_flight: int = 100000, max_client_background_in_flight: int = 20000,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param max_in_flight: 全局在途工作量上限
+        :param max_client_in_flight: 单个客户端的在途工作量上限
+        :param rate: 每个客户端每秒可提交的请求数
+        :param burst: 每个客户端可以突发提交的请求数
+        :param alpha: 服务时间指数移动平均的权重
+        :param max_buckets: 最多保留的令牌桶数，超出时丢弃最久未使用的
+        :param max_background_in_flight: 后台任务（批量发送）的全局在途工作量上限
+        :param max_client_background_in_flight: 单个客户端后台任务的在途工作量上限
+        """
+        self.max_in_flight = max_in_flight
+        self.max_client_in_flight = max_client_in_flight
+        self.max_background_in_flight = max_background_in_flight
+        self.max_client_background_in_flight = max_client_background_in_flight
+        self.rate = rate
+        self.burst = burst
+        self.alpha = alpha
+        self.clock = clock
+        self.in_flight: Counter = Counter()  # 任务类型 -> 在途工作量
+        self.client_in_flight: Counter = Counter()  # 客户端 -> 交互任务的在途工作量
+        self.client_background_in_flight: Counter = Counter()  # 客户端 -> 后台任务的在途工作量
+        self.service_times: Dict[str, float] = dict(DEFAULT_SERVICE_TIMES)
+        self.measured: Counter = Counter()  # 任务类型 -> 已记录的服务时间样本数
+        self.rejected: Counter = Counter()
+        self.max_buckets = max_buckets
+        # 客户端断开后令牌桶保留到补满为止，断开重连不能绕过速率限制；按最近使用排序
+        self._buckets: Dict[str, TokenBucket] = OrderedDict()
+        self._rank = {cls: i for i, cls in enumerate(CLASS_ORDER)}
+
+    @staticmethod
+    def is_background(task_type: str) -> bool:
+        return TASK_CLASSES.get(task_type) in BACKGROUND_CLASSES
+
+    @property
+    def total_in_flight(self) -> int:
+        """交互任务的在途工作量"""
+        return sum(count for task_type, count in self.in_flight.items() if not self.is_background(task_type))
+
+    @property
+    def background_in_flight(self) -> int:
+        return sum(count for task_type, count in self.in_flight.items() if self.is_background(task_type))
+
+    def _client_counter(self, task_type: str) -> Counter:
+        return self.client_background_in_flight if self.is_background(task_type) else self.client_in_flight
+
+    def _bucket(self, client_id: Optional[str]) -> TokenBucket:
+        key = client_id or ''
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._evict()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, self.clock)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self):
+        """丢弃最久未使用且已补满的令牌桶；数量达到 max_buckets 时不论是否补满都丢弃"""
+        while self._buckets:
+            key, oldest = next(iter(self._buckets.items()))
+            if len(self._buckets) < self.max_buckets and not oldest.full():
+                break
+            del self._buckets[key]
+
+    def forget(self, client_id: str):
+        """客户端断开：令牌桶已补满时释放，否则保留到补满后由 _evict 清理"""
+        bucket = self._buckets.get(client_id)
+        if bucket is not None and bucket.full():
+            del self._buckets[client_id]
+
+    def service_time(self, task_type: str) -> float:
+        return self.service_times.get(task_type, 1.0)
+
+    def estimate(self, task_type: str, units: int = 1) -> Tuple[int, float]:
+        """
+        排队位置和预计完成时间：优先级不低于该类型的在途工作量都排在前面
+        :return: (position, eta)
+        """
+        rank = self._rank[TASK_CLASSES.get(task_type, 'read')]
+        position, eta = units, units * self.service_time(task_type)
+        for other, count in self.in_flight.items():
+            if count and self._rank[TASK_CLASSES.get(other, 'read')] <= rank:
+                position += count
+                eta += count * self.service_time(other)
+        return position, eta
+
+    def admit(self, client_id: Optional[str], task_type: str, units: int = 1,
+              timeout: Optional[float] = None) -> Admission:
+        """
+        检查一个请求能否进入队列，接受时计入在途工作量
+        :param units: 请求的工作量
+        :param timeout: 请求的超时时间（秒），预计完成时间超过它时拒绝
+        """
+        bucket = self._bucket(client_id)
+        if not bucket.try_take():
+            return self._reject('rate_limited', bucket.retry_after())
+        if self.is_background(task_type):
+            return self._admit_background(client_id, task_type, units, timeout)
+        total = self.total_in_flight
+        if total + units > self.max_in_flight:
+            # 按当前排在最前的工作量估算腾出空间需要的时间
+            return self._reject('overloaded', self.estimate(task_type, total + units - self.max_in_flight)[1])
+        if self.client_in_flight[client_id] + units > self.max_client_in_flight:
+            return self._reject('client_limit', units * self.service_time(task_type))
+        position, eta = self.estimate(task_type, units)
+        if timeout is not None and eta > timeout:
+            return self._reject('deadline', None)
+        self.track(client_id, task_type, units)
+        return Admission(True, position=position, eta=eta)
+
+    def _admit_background(self, client_id: Optional[str], task_type: str, units: int,
+                          timeout: Optional[float]) -> Admission:
+        """
+        后台任务只和后台任务比较额度，不占用交互任务的额度。
+        工作量超过上限本身的任务永远无法接受，不给重试时间
+        """
+        if units > min(self.max_background_in_flight, self.max_client_background_in_flight):
+            return self._reject('too_large', None)
+        total = self.background_in_flight
+        if total + units > self.max_background_in_flight:
+            return self._reject('overloaded', (total + units - self.max_background_in_flight) * self.service_time(task_type))
+        if self.client_background_in_flight[client_id] + units > self.max_client_background_in_flight:
+            return self._reject('client_limit', units * self.service_time(task_type))
+        position, eta = self.estimate(task_type, units)
+        if timeout is not None and eta > timeout:
+            return self._reject('deadline', None)
+        self.track(client_id, task_type, units)
+        return Admission(True, position=position, eta=eta)
+
+    def _reject(self, reason: str, retry_after: Optional[float]) -> Admission:
+        self.rejected[reason] += 1
+        return Admission(False, reason=reason, retry_after=retry_after)
+
+    def track(self, client_id: Optional[str], task_type: str, units: int = 1):
+        """不经检查直接计入在途工作量（如从任务日志恢复的任务）"""
+        self.in_flight[task_type] += units
+        self._client_counter(task_type)[client_id] += units
+
+    def release(self, client_id: Optional[str], task_type: str, units: int = 1,
+                duration: Optional[float] = None):
+        """
+        工作完成或被丢弃
+        :param duration: 实际执行耗时（秒），用于更新该类型每单位的服务时间
+        """
+        if self.in_flight[task_type] <= 0:
+            return
+        clients = self._client_counter(task_type)
+        self.in_flight[task_type] = max(0, self.in_flight[task_type] - units)
+        clients[client_id] = max(0, clients[client_id] - units)
+        if not self.in_flight[task_type]:
+            del self.in_flight[task_type]
+        if not clients[client_id]:
+            del clients[client_id]
+        if duration is not None and units > 0:
+            sample = duration / units
+            if self.measured[task_type] == 0:
+                self.service_times[task_type] = sample
+            else:
+                self.service_times[task_type] += self.alpha * (sample - self.service_times[task_type])
+            self.measured[task_type] += 1
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'in_flight': dict(self.in_flight),
+            'clients': len(self.client_in_flight.keys() | self.client_background_in_flight.keys()),
+            'service_times': dict(self.service_times),
+            'rejected': dict(self.rejected),
+        }
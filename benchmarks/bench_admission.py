@@ -0,0 +1,126 @@
+"""
+准入控制基准测试
+
+多个客户端以远超处理能力的速度提交 send_text，对比不做限制（原来的无界队列）与准入控制：
+接受/拒绝的请求数、任务队列的最大深度、被接受的请求从接受到发送完成的时间（succeeded 事件的 total_ms），
+以及 accepted 事件中预计完成时间(eta)与实际完成时间的误差：
+    python -m benchmarks.bench_admission --clients 5 --requests 200 --interval 5
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+
+from admission import AdmissionController
+from benchmarks.common import print_table, summarize
+from main import WeChatRPA, WsServer
+from subscriptions import Subscription
+from ui_backend import FakeWeChatBackend
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.replies = []
+
+    async def send_text(self, message: str):
+        self.replies.append(json.loads(message))
+
+
+async def run_mode(mode: str, args) -> dict:
+    fake = FakeWeChatBackend.synthetic(n_sessions=args.receivers, n_favorites=1, history=1,
+                                       latency=args.latency / 1000)
+    rpa = WeChatRPA(ui=fake)
+    await rpa.find_wechat_window()
+    if mode == 'unbounded':
+        rpa.admission = AdmissionController(max_in_flight=10 ** 9, max_client_in_flight=10 ** 9,
+                                            rate=10 ** 9, burst=10 ** 9)
+    else:
+        rpa.admission = AdmissionController(max_in_flight=args.max_in_flight,
+                                            max_client_in_flight=args.max_in_flight // 2,
+                                            rate=args.rate, burst=args.burst)
+    # 只测排队，不合并同一接收者的消息
+    rpa.max_send_batch = 1
+    server = WsServer(rpa)
+    sockets = {}
+    for c in range(args.clients):
+        sockets[f"c{c}"] = RecordingSocket()
+        server.manager.register(sockets[f"c{c}"], f"c{c}", Subscription(types=frozenset({'none'})))
+
+    workers = [asyncio.create_task(rpa.process_send_queue()),
+               asyncio.create_task(rpa.process_task_queue()),
+               asyncio.create_task(server.send_replies())]
+    max_depth = 0
+
+    async def client(client_id: str):
+        nonlocal max_depth
+        for i in range(args.requests):
+            await server.handle_message(json.dumps({'type': 'send_text', 'task_id': f"{client_id}-{i}",
+                                                    'content': f"消息 {i}",
+                                                    'receiver': f"联系人{i % args.receivers}号"}), client_id)
+            max_depth = max(max_depth, rpa.task_queue.qsize())
+            await asyncio.sleep(args.interval / 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(client_id) for client_id in sockets))
+    await rpa.send_queue.join()
+    await rpa.task_queue.join()
+    await rpa.reply_queue.join()
+    await server.manager.flush()
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.cancel()
+
+    rejected = Counter()
+    events = defaultdict(dict)  # task_id -> {status: 事件}
+    for socket in sockets.values():
+        for reply in socket.replies:
+            if reply['type'] == 'error':
+                rejected[reply['error']] += 1
+            else:
+                events[reply['task_id']][reply['status']] = reply
+    waits, eta_errors = [], []
+    for task_events in events.values():
+        if 'succeeded' in task_events:
+            actual = task_events['succeeded']['total_ms'] / 1000
+            waits.append(actual * 1000)
+            eta_errors.append(abs(task_events['accepted']['eta'] - actual))
+    wait_stats = summarize(waits)
+    return {
+        'mode': mode,
+        'accepted': len(waits),
+        'rejected': sum(rejected.values()),
+        'reasons': ','.join(f"{k}:{v}" for k, v in sorted(rejected.items())),
+        'max_depth': max_depth,
+        'wait_p95_ms': wait_stats['p95'],
+        'wait_max_ms': wait_stats['max'],
+        # 最初几个请求还没有实测的服务时间，使用默认值，误差看中位数
+        'eta_err_p50_s': summarize(eta_errors)['p50'],
+        'wall_ms': elapsed * 1000,
+    }
+
+
+async def run(args):
+    return [await run_mode('unbounded', args), await run_mode('admission', args)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='准入控制基准测试')
+    parser.add_argument('--clients', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=200, help='每个客户端提交的请求数')
+    parser.add_argument('--interval', type=float, default=5, help='同一客户端两次提交的间隔(毫秒)')
+    parser.add_argument('--receivers', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.2, help='每次UIA调用的延迟(毫秒)')
+    parser.add_argument('--max-in-flight', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=50, help='每个客户端每秒可提交的请求数')
+    parser.add_argument('--burst', type=float, default=20)
+    args = parser.parse_args(argv)
+    rows = asyncio.run(run(args))
+    print_table(rows, ['mode', 'accepted', 'rejected', 'reasons', 'max_depth', 'wait_p95_ms', 'wait_max_ms',
+                       'eta_err_p50_s', 'wall_ms'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
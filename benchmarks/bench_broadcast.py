@@ -0,0 +1,122 @@
+"""
+广播基准测试
+
+N 个客户端各订阅一个联系人（另有一部分不限制），其中一个客户端每帧发送要等待 --slow-ms 毫秒。
+对比原来的逐客户端序列化、依次 await 发送给全部客户端，与序列化一次、按订阅过滤、
+放入各客户端发送队列的广播：每条消息的广播耗时、其他客户端收到消息的延迟、
+json.dumps 次数、实际发送的帧数和慢客户端被丢弃的消息数：
+    python -m benchmarks.bench_broadcast --clients 1000 --messages 200 --slow-ms 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+from benchmarks.common import print_table, summarize
+from main import ConnectionManager, WsRecvMsg
+from subscriptions import Subscription
+
+
+class RecordingSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.received = []
+
+    async def send_text(self, message: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received.append((message, time.perf_counter()))
+
+
+async def legacy_broadcast(manager: ConnectionManager, recv_msg: WsRecvMsg):
+    """改造前的实现：每个客户端都序列化一次，依次等待发送完成"""
+    for client_id, connection in manager.active_connections.items():
+        msg_json = json.dumps({
+            "type": "receive",
+            "sender": recv_msg.sender,
+            "content": recv_msg.content
+        })
+        logging.info(f"Broadcasted message to {client_id}: {recv_msg.sender} -> {recv_msg.content}")
+        await connection.send_text(msg_json)
+
+
+async def run_mode(mode: str, args) -> dict:
+    manager = ConnectionManager(max_pending=args.max_pending)
+    sockets = []
+    for i in range(args.clients):
+        slow = i == 0 and args.slow_ms > 0
+        socket = RecordingSocket(args.slow_ms / 1000 if slow else 0.0)
+        if not slow:
+            sockets.append(socket)
+        if slow or i % 100 < args.wildcard_percent:
+            subscription = Subscription()
+        else:
+            subscription = Subscription(senders=frozenset({f"联系人{i % args.contacts}号"}))
+        manager.register(socket, f"c{i}", subscription)
+
+    dumps_calls = 0
+    original_dumps = json.dumps
+
+    def counting_dumps(*a, **kw):
+        nonlocal dumps_calls
+        dumps_calls += 1
+        return original_dumps(*a, **kw)
+
+    broadcast = legacy_broadcast if mode == 'legacy' else ConnectionManager.broadcast
+    durations = []
+    broadcast_at = {}
+    json.dumps = counting_dumps
+    try:
+        for i in range(args.messages):
+            recv_msg = WsRecvMsg(sender=f"联系人{i % args.contacts}号", content=f"消息 {i}")
+            started = time.perf_counter()
+            broadcast_at[recv_msg.content] = started
+            await broadcast(manager, recv_msg)
+            durations.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(0)
+    finally:
+        json.dumps = original_dumps
+    # 只等其他客户端收完，慢客户端的队列不影响结果
+    await asyncio.gather(*(outbox.drain() for client_id, outbox in manager.outboxes.items() if client_id != 'c0'))
+    delivery = [(at - broadcast_at[json.loads(message)['content']]) * 1000
+                for socket in sockets for message, at in socket.received]
+    slow_stats = manager.client_stats().get('c0', {})
+    for client_id in list(manager.outboxes):
+        manager.disconnect(client_id)
+    stats = summarize(durations)
+    delivery_stats = summarize(delivery)
+    return {
+        'mode': mode,
+        'broadcast_ms': stats['mean'],
+        'delivery_p95_ms': delivery_stats['p95'],
+        'delivery_max_ms': delivery_stats['max'],
+        'dumps': dumps_calls,
+        'frames': len(delivery),
+        'slow_dropped': slow_stats.get('dropped', 0) if mode != 'legacy' else 0,
+    }
+
+
+async def run(args):
+    return [await run_mode('legacy', args), await run_mode('outbox', args)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='广播基准测试')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--contacts', type=int, default=100, help='消息发送者的数量')
+    parser.add_argument('--wildcard-percent', type=int, default=5, help='不限制订阅的客户端比例(%%)')
+    parser.add_argument('--slow-ms', type=float, default=20, help='慢客户端每帧的发送耗时，0表示没有慢客户端')
+    parser.add_argument('--max-pending', type=int, default=100, help='每个客户端发送队列的容量')
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+    rows = asyncio.run(run(args))
+    print_table(rows, ['mode', 'broadcast_ms', 'delivery_p95_ms', 'delivery_max_ms', 'dumps', 'frames',
+                       'slow_dropped'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
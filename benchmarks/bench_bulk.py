@@ -0,0 +1,101 @@
+"""
+批量发送基准测试
+
+把 N 条消息发给 M 个接收者（接收者交错排列），对比逐帧提交 send_text 与一次提交 send_text_bulk：
+总耗时、打开聊天窗口的次数和客户端收到的进度事件数。批量模式使用默认的准入限制，
+1000 条的任务超过单个客户端交互任务的额度，检查它作为后台任务被接受且全部发出：
+    python -m benchmarks.bench_bulk --messages 1000 --receivers 50
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks.common import print_table
+from admission import AdmissionController
+from main import WeChatRPA, WsServer
+from subscriptions import Subscription
+from ui_backend import FakeWeChatBackend
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.events = []
+
+    async def send_text(self, message: str):
+        self.events.append(json.loads(message))
+
+
+async def run_mode(mode: str, args) -> dict:
+    fake = FakeWeChatBackend.synthetic(n_sessions=args.receivers, n_favorites=1, history=1,
+                                       latency=args.latency / 1000)
+    rpa = WeChatRPA(ui=fake)
+    if mode == 'per_frame':
+        # 逐帧提交超过交互任务的额度和提交速率，对比的是发送方式本身，不做准入限制
+        rpa.admission = AdmissionController(max_in_flight=10 ** 9, max_client_in_flight=10 ** 9,
+                                            rate=10 ** 9, burst=10 ** 9)
+    await rpa.find_wechat_window()
+    server = WsServer(rpa)
+    socket = RecordingSocket()
+    server.manager.register(socket, 'bench', Subscription())
+    receivers = [f"联系人{i % args.receivers}号" for i in range(args.messages)]
+    workers = [asyncio.create_task(rpa.process_send_queue()),
+               asyncio.create_task(rpa.process_task_queue()),
+               asyncio.create_task(server.send_replies())]
+
+    fake.reset_stats()
+    started = time.perf_counter()
+    if mode == 'per_frame':
+        frames = args.messages
+        for i, receiver in enumerate(receivers):
+            await server.handle_message(json.dumps({'type': 'send_text', 'receiver': receiver,
+                                                    'content': f"通知 {i}"}), 'bench')
+    else:
+        frames = 1
+        await server.handle_message(json.dumps({
+            'type': 'send_text_bulk',
+            'template': '通知 {i}',
+            'receivers': [{'receiver': receiver, 'vars': {'i': i}} for i, receiver in enumerate(receivers)],
+        }), 'bench')
+    await rpa.send_queue.join()
+    await rpa.task_queue.join()
+    await rpa.reply_queue.join()
+    await server.manager.flush()
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.cancel()
+    # 断开模拟客户端，停止它的发送队列写任务
+    server.manager.disconnect('bench')
+    rpa.ui_worker.shutdown()
+    return {
+        'mode': mode,
+        'frames': frames,
+        'sent': len(fake.sent),
+        'chat_opens': fake.calls['Click'],
+        'wall_ms': elapsed * 1000,
+        'events': len(socket.events),
+    }
+
+
+async def run(args):
+    return [await run_mode('per_frame', args), await run_mode('bulk', args)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量发送基准测试')
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--receivers', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help='每次UIA调用的延迟(毫秒)')
+    args = parser.parse_args(argv)
+    rows = asyncio.run(run(args))
+    print_table(rows, ['mode', 'frames', 'sent', 'chat_opens', 'wall_ms', 'events'])
+    incomplete = [row['mode'] for row in rows if row['sent'] != args.messages]
+    if incomplete:
+        print(f"未全部发出: {', '.join(incomplete)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+去重存储内存基准测试
+
+用数百万条合成消息对比原来的 set(f"{chat_name}_{content}") 与 MessageDedup 的内存占用和吞吐：
+    python -m benchmarks.bench_dedup --messages 2000000 --max-mb 16
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import print_table
+from dedup import MessageDedup
+
+
+def synthetic_messages(n: int, chats: int = 500):
+    for i in range(n):
+        yield f"会话_{i % chats}", f"这是第{i}条合成消息，内容长度和真实聊天差不多"
+
+
+def measure(name: str, n: int, make_store, add):
+    tracemalloc.start()
+    store = make_store()
+    start = time.perf_counter()
+    for chat_name, content in synthetic_messages(n):
+        add(store, chat_name, content)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'store': name,
+        'messages': n,
+        'entries': len(store),
+        'current_mb': current / 1024 / 1024,
+        'peak_mb': peak / 1024 / 1024,
+        'bytes_per_entry': current / max(1, len(store)),
+        'kops': n / elapsed / 1000,
+    }
+
+
+def legacy_add(store: set, chat_name: str, content: str):
+    message_id = f"{chat_name}_{content}"
+    if message_id not in store:
+        store.add(message_id)
+
+
+def dedup_add(store: MessageDedup, chat_name: str, content: str):
+    store.add(MessageDedup.make_key(chat_name, content))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='去重存储内存基准测试')
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--max-mb', type=float, default=16, help='MessageDedup 内存上限(MB)')
+    parser.add_argument('--skip-legacy', action='store_true', help='不测试原来的set实现')
+    args = parser.parse_args(argv)
+
+    rows = []
+    if not args.skip_legacy:
+        rows.append(measure('legacy_set', args.messages, set, legacy_add))
+    rows.append(measure('MessageDedup', args.messages,
+                        lambda: MessageDedup(max_bytes=int(args.max_mb * 1024 * 1024)), dedup_add))
+    print_table(rows, ['store', 'messages', 'entries', 'current_mb', 'peak_mb', 'bytes_per_entry', 'kops'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
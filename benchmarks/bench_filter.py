@@ -0,0 +1,94 @@
+"""
+消息过滤规则基准测试
+
+在合成的消息列表项、会话项名称语料上，对比改造前的逐项关键字扫描与 MessageFilter 的预编译匹配：
+    python -m benchmarks.bench_filter --items 1000000
+    python -m benchmarks.bench_filter --rules message_rules.json
+除每项耗时外，还统计两种实现分类结果不同的项数（主要是改造前被 ':'、'am'/'pm' 规则误当作时间分隔的消息）。
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+from benchmarks.common import print_table
+from message_filter import MESSAGE, SKIP, TIME, MessageFilter
+
+MESSAGES = ['好的', '收到', 'I am on my way', '地址: 北京市海淀区', '明天12:30见', 'OK, see you at the camp',
+            '这个方案可以', '[图片]', '[表情]', '[文件] 报告.pdf', '[Location] 公司', 'Voice Call 00:35',
+            '价格：100元', '', 'https://example.com/a?b=1', '你好，在吗？']
+TIMES = ['10:30', '上午9:05', '下午3:45', 'Yesterday 18:20', '昨天 下午3:05', '星期二 10:30',
+         '2024年5月3日 上午10:30', '5/3/24 10:30 AM', '11:02 PM']
+
+
+def legacy_classify(content: str) -> str:
+    """改造前 get_detailed_messages 中的规则"""
+    if any(x in content.lower() for x in ['am', 'pm', 'yesterday', ':', '上午', '下午']):
+        return TIME
+    if any(x in content for x in ['[Location]', 'Voice Call', '[图片]', '[表情]', '[文件]']):
+        return SKIP
+    return MESSAGE if content.strip() else 'empty'
+
+
+def legacy_badge(name: str):
+    """改造前在每个会话项的循环中编译未读提示的正则"""
+    match = re.compile(r'^(.*?)(\d+)条新消息$').search(name)
+    return (match.group(1).strip(), int(match.group(2))) if match else None
+
+
+def legacy_new_friend(chat_name: str, texts) -> bool:
+    expected_text = f"你已添加了{chat_name}，现在可以开始聊天了"
+    return any(expected_text in text for text in texts)
+
+
+def build_corpus(items: int, seed: int):
+    rng = random.Random(seed)
+    contents = [rng.choice(TIMES) if rng.random() < 0.1 else rng.choice(MESSAGES) for _ in range(items)]
+    sessions = []
+    for i in range(items // 10):
+        name = f"联系人{i}号"
+        unread = rng.random() < 0.2
+        preview = f"你已添加了{name}，现在可以开始聊天了" if rng.random() < 0.01 else rng.choice(MESSAGES)
+        sessions.append((f"{name}{rng.randint(1, 99)}条新消息" if unread else name, [name, '10:30', preview]))
+    return contents, sessions
+
+
+def timed(fn, corpus) -> float:
+    started = time.perf_counter()
+    for entry in corpus:
+        fn(*entry) if isinstance(entry, tuple) else fn(entry)
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='消息过滤规则基准测试')
+    parser.add_argument('--items', type=int, default=1000000, help='消息列表项数，会话项为其十分之一')
+    parser.add_argument('--rules', help='规则JSON文件')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rules = MessageFilter(rules_path=args.rules)
+    contents, sessions = build_corpus(args.items, args.seed)
+    names = [name for name, _ in sessions]
+    rows = []
+    for case, corpus, legacy, compiled in [
+        ('classify', contents, legacy_classify, rules.classify),
+        ('badge', names, legacy_badge, rules.badge),
+        ('new_friend', sessions, legacy_new_friend, rules.is_new_friend),
+    ]:
+        before = timed(legacy, corpus)
+        after = timed(compiled, corpus)
+        differ = sum((legacy(*entry) if isinstance(entry, tuple) else legacy(entry))
+                     != (compiled(*entry) if isinstance(entry, tuple) else compiled(entry)) for entry in corpus)
+        rows.append({'case': case, 'items': len(corpus), 'legacy_ns': before / len(corpus) * 1e9,
+                     'compiled_ns': after / len(corpus) * 1e9, 'speedup': before / after, 'differ': differ})
+    print_table(rows, ['case', 'items', 'legacy_ns', 'compiled_ns', 'speedup', 'differ'])
+
+    recovered = sum(legacy_classify(c) == TIME and rules.classify(c) == MESSAGE for c in contents)
+    print(f"改造前被当作时间分隔丢掉、现在正常转发的消息: {recovered}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
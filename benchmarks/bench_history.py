@@ -0,0 +1,92 @@
+"""
+消息历史基准测试
+
+写入大量合成消息后，对比按联系人查询首页、键集分页翻到深处与 OFFSET 分页的延迟：
+    python -m benchmarks.bench_history --rows 1000000 --contacts 2000
+行数越多，OFFSET 分页越慢，键集分页基本不变。
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import print_table, summarize
+from history import RECEIVED, SENT, MessageHistory
+
+
+def fill(history: MessageHistory, rows: int, contacts: int, seed: int) -> float:
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    ts = 1_700_000_000.0
+    for i in range(rows):
+        ts += rng.random()
+        history.record(f"联系人{rng.randrange(contacts)}号", f"合成消息{i}", SENT if i % 3 == 0 else RECEIVED, ts)
+    history.flush()
+    history._executor.submit(lambda: None).result()  # 等待写入线程完成
+    return time.perf_counter() - started
+
+
+async def measure(history: MessageHistory, contacts: int, queries: int, depth: int, page: int, seed: int):
+    rng = random.Random(seed)
+    first, keyset, offset = [], [], []
+    for _ in range(queries):
+        contact = f"联系人{rng.randrange(contacts)}号"
+        started = time.perf_counter()
+        _, cursor = await history.query(contact, limit=page)
+        first.append((time.perf_counter() - started) * 1000)
+
+        # 键集分页连续翻 depth 页，记录最后一页的耗时
+        elapsed = 0.0
+        for _ in range(depth - 1):
+            if cursor is None:
+                break
+            started = time.perf_counter()
+            _, cursor = await history.query(contact, limit=page, cursor=cursor)
+            elapsed = (time.perf_counter() - started) * 1000
+        keyset.append(elapsed)
+
+        # 相同深度的 OFFSET 查询
+        def offset_query():
+            return history._conn.execute(
+                'SELECT id, contact, direction, content, ts FROM messages WHERE contact = ? '
+                'ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?', (contact, page, page * (depth - 1))).fetchall()
+        started = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(history._executor, offset_query)
+        offset.append((time.perf_counter() - started) * 1000)
+    return [
+        {'query': 'first_page', **_ms(first)},
+        {'query': f'keyset_page_{depth}', **_ms(keyset)},
+        {'query': f'offset_page_{depth}', **_ms(offset)},
+    ]
+
+
+def _ms(values):
+    stats = summarize(values)
+    return {'n': stats['n'], 'p50_ms': stats['p50'], 'p95_ms': stats['p95'], 'max_ms': stats['max']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='消息历史基准测试')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--contacts', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--depth', type=int, default=10, help='翻到第几页')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = MessageHistory(os.path.join(tmp, 'history.db'), max_buffer=10000)
+        elapsed = fill(history, args.rows, args.contacts, args.seed)
+        print(f"写入 {args.rows} 条: {elapsed:.1f}s ({args.rows / elapsed:.0f} 条/秒)")
+        rows = asyncio.run(measure(history, args.contacts, args.queries, args.depth, args.page, args.seed))
+        history.close()
+    print_table(rows, ['query', 'n', 'p50_ms', 'p95_ms', 'max_ms'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+任务日志基准测试
+
+对比每条任务单独提交、多个生产者并发写入的组提交、单个消费者每次取出一批任务一起写入（drained，
+即 process_send_queue 的方式）在不同 synchronous 设置下的入队吞吐、提交次数和每次提交（fsync）耗时：
+    python -m benchmarks.bench_journal --tasks 2000 --producers 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.common import print_table, summarize
+from journal import TaskJournal
+
+
+async def run_mode(path: str, mode: str, synchronous: str, tasks: int, producers: int, window: float):
+    journal = TaskJournal(path, commit_window=window, synchronous=synchronous)
+    latencies = []
+
+    async def append(i: int):
+        started = time.perf_counter()
+        journal_id = await journal.append('send_text', {'receiver': f"联系人{i % 100}号", 'content': f"消息{i}"})
+        latencies.append((time.perf_counter() - started) * 1000)
+        return journal_id
+
+    started = time.perf_counter()
+    if mode == 'per_task':
+        # 逐条等待落盘，每次提交只有一条记录
+        for i in range(tasks):
+            await append(i)
+    elif mode == 'drained':
+        # 单个消费者每次取出 producers 条任务，一起写入后等待一次落盘
+        for start in range(0, tasks, producers):
+            batch = range(start, min(start + producers, tasks))
+            begun = time.perf_counter()
+            await journal.append_many([('send_text', {'receiver': f"联系人{i % 100}号", 'content': f"消息{i}"})
+                                       for i in batch])
+            latencies.extend([(time.perf_counter() - begun) * 1000] * len(batch))
+    else:
+        # 多个生产者同时入队，提交期间到达的写入合并
+        async def producer(p: int):
+            for i in range(p, tasks, producers):
+                await append(i)
+        await asyncio.gather(*(producer(p) for p in range(producers)))
+    elapsed = time.perf_counter() - started
+    stats = journal.stats()
+    journal.close()
+    latency = summarize(latencies)
+    return {
+        'mode': mode,
+        'synchronous': synchronous,
+        'tasks_per_s': tasks / elapsed,
+        'commits': stats['commits'],
+        'per_commit': stats['records_per_commit'],
+        'commit_ms': stats['commit_ms'],
+        'append_p50_ms': latency['p50'],
+        'append_p95_ms': latency['p95'],
+    }
+
+
+async def run_prune(path: str, tasks: int, prune_interval: float) -> dict:
+    """逐批写入并完成任务，检查运行期间已完成的记录是否被删除（长时间运行时数据库不增长）"""
+    journal = TaskJournal(path, synchronous='NORMAL', prune_interval=prune_interval)
+    peak = 0
+    for start in range(0, tasks, 100):
+        journal_ids = await journal.append_many([('send_text', {'receiver': '联系人', 'content': f"消息{i}"})
+                                                 for i in range(start, min(start + 100, tasks))])
+        for journal_id in journal_ids:
+            journal.complete(journal_id)
+        await journal.append('send_text', {'receiver': '联系人', 'content': '未完成'})
+        peak = max(peak, journal._executor.submit(
+            lambda: journal._conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]).result())
+    stats = journal.stats()
+    journal.close()
+    return {'tasks': tasks, 'pending': -(-tasks // 100), 'pruned': stats['pruned'], 'peak_rows': peak}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='任务日志基准测试')
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--producers', type=int, default=50, help='组提交模式的并发生产者数，drained 模式每批的任务数')
+    parser.add_argument('--window', type=float, default=0.0, help='组提交的额外收集时间(秒)')
+    parser.add_argument('--dir', default=None, help='数据库所在目录，默认临时目录（fsync耗时取决于磁盘）')
+    args = parser.parse_args(argv)
+
+    rows = []
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for synchronous in ('FULL', 'NORMAL'):
+            for mode in ('per_task', 'group', 'drained'):
+                path = os.path.join(tmp, f"{mode}_{synchronous}.db")
+                rows.append(asyncio.run(run_mode(path, mode, synchronous, args.tasks, args.producers, args.window)))
+        prune = asyncio.run(run_prune(os.path.join(tmp, 'prune.db'), args.tasks, 0.0))
+    print_table(rows, ['mode', 'synchronous', 'tasks_per_s', 'commits', 'per_commit', 'commit_ms',
+                       'append_p50_ms', 'append_p95_ms'])
+    print_table([prune], ['tasks', 'pending', 'pruned', 'peak_rows'])
+    # 每批只留下一条未完成的任务，已完成的记录没有被删除时行数随任务数增长
+    if prune['peak_rows'] > prune['pending'] + 100:
+        print(f"已完成的记录没有被清理: 峰值{prune['peak_rows']}行")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+消息管道延迟基准测试
+
+测量两段延迟：
+- enqueue_to_ui: 消息放入 send_queue 到模拟微信输入框收到该消息
+- detect_to_broadcast: 检测到的消息放入 recv_queue 到客户端收到广播
+
+--mode legacy 使用改造前的轮询实现（queue.empty() + asyncio.sleep(0.1)，每个任务后再sleep 0.1秒），
+--mode event 使用当前的阻塞等待实现，--mode both 对比两者：
+    python -m benchmarks.bench_latency --messages 50 --interval 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from benchmarks.common import print_table, summarize
+from main import WeChatRPA, WsRecvMsg, WsSendMsg, WsServer
+from subscriptions import Subscription
+from ui_backend import FakeWeChatBackend
+
+
+class RecordingSocket:
+    """记录收到广播时间的模拟WebSocket连接"""
+
+    def __init__(self):
+        self.received = {}
+
+    async def send_text(self, data: str):
+        self.received[data] = time.perf_counter()
+
+
+async def legacy_process_send_queue(rpa: WeChatRPA):
+    """改造前的 process_send_queue：轮询 send_queue"""
+    while True:
+        if not rpa.send_queue.empty():
+            msg = await rpa.send_queue.get()
+            await rpa.task_queue.put({'type': 'send_text', 'msg': msg})
+        else:
+            await asyncio.sleep(0.1)
+
+
+async def legacy_broadcast_messages(server: WsServer):
+    """改造前的 broadcast_messages：轮询 recv_queue"""
+    while True:
+        if not server.rpa.recv_queue.empty():
+            msg = await server.rpa.recv_queue.get()
+            await server.manager.broadcast(msg)
+        await asyncio.sleep(0.1)
+
+
+def install_legacy_task_delay(rpa: WeChatRPA):
+    """模拟改造前 process_task_queue 每个任务后的 asyncio.sleep(0.1)"""
+    send = rpa.async_send_messages
+
+    async def delayed(msgs):
+        results = await send(msgs)
+        await asyncio.sleep(0.1)
+        return results
+    rpa.async_send_messages = delayed
+
+
+async def run_mode(mode: str, args) -> dict:
+    fake = FakeWeChatBackend.synthetic(n_sessions=args.sessions, n_favorites=1, history=5)
+    rpa = WeChatRPA(ui=fake)
+    await rpa.find_wechat_window()
+    server = WsServer(rpa)
+    socket = RecordingSocket()
+    server.manager.register(socket, 'bench', Subscription())
+
+    if mode == 'legacy':
+        install_legacy_task_delay(rpa)
+        workers = [legacy_process_send_queue(rpa), legacy_broadcast_messages(server)]
+    else:
+        workers = [rpa.process_send_queue(), server.broadcast_messages()]
+    tasks = [asyncio.create_task(w) for w in workers + [rpa.process_task_queue()]]
+
+    rng = random.Random(args.seed)
+    enqueued, detected = {}, {}
+    for i in range(args.messages):
+        receiver = f"联系人{rng.randrange(args.sessions)}号"
+        content = f"延迟测试 {i}"
+        enqueued[content] = time.perf_counter()
+        await rpa.send_queue.put(WsSendMsg(receiver=receiver, content=content))
+        recv = WsRecvMsg(sender=receiver, content=f"收到 {i}")
+        detected[recv.content] = time.perf_counter()
+        await rpa.recv_queue.put(recv)
+        await asyncio.sleep(args.interval / 1000)
+
+    deadline = time.perf_counter() + 10
+    while (len(fake.sent) < args.messages or len(socket.received) < args.messages) \
+            and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    for task in tasks:
+        task.cancel()
+
+    sent_at = {content: at for (_, content), at in zip(fake.sent, fake.sent_at)}
+    to_ui = [(sent_at[c] - t) * 1000 for c, t in enqueued.items() if c in sent_at]
+    received = {json.loads(data)['content']: at for data, at in socket.received.items()}
+    to_client = [(received[c] - t) * 1000 for c, t in detected.items() if c in received]
+    return {'enqueue_to_ui': summarize(to_ui), 'detect_to_broadcast': summarize(to_client)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='消息管道延迟基准测试')
+    parser.add_argument('--mode', choices=['legacy', 'event', 'both'], default='both')
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=50, help='消息间隔(毫秒)')
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    modes = ['legacy', 'event'] if args.mode == 'both' else [args.mode]
+    rows = []
+    for mode in modes:
+        result = asyncio.run(run_mode(mode, args))
+        for hop, stats in result.items():
+            rows.append({'mode': mode, 'hop': hop, 'n': stats['n'], 'p50_ms': stats['p50'],
+                         'p95_ms': stats['p95'], 'max_ms': stats['max']})
+    print_table(rows, ['mode', 'hop', 'n', 'p50_ms', 'p95_ms', 'max_ms'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+消息读取基准测试
+
+会话中已加载大量消息时，对比每次全量读取消息列表与从末尾读到游标位置的耗时、UIA调用次数
+和经过的节点数（真实UIA中 GetChildren 对每个子控件都是一次跨进程调用）：
+    python -m benchmarks.bench_messages --history 50 200 1000 --new 3
+两个会话轮流收到 --new 条新消息，每轮点击收到消息的会话并读取，与监控发现未读消息后的流程一致。
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.common import print_table, summarize
+from main import WeChatRPA
+from ui_backend import FakeWeChatBackend
+
+MODES = ['full', 'tail']
+CHATS = ['联系人0号', '联系人1号']
+
+
+async def run_mode(mode: str, history: int, args) -> dict:
+    fake = FakeWeChatBackend.synthetic(n_sessions=10, n_favorites=1, history=history,
+                                       latency=args.latency / 1000,
+                                       search_node_latency=args.node_latency / 1000)
+    rpa = WeChatRPA(ui=fake)
+    rpa.max_tail_items = 0 if mode == 'full' else 200
+    walls, calls, nodes, missing = [], [], [], 0
+    try:
+        await rpa.find_wechat_window()
+        for i in range(args.warmup + args.rounds):
+            chat = CHATS[i % len(CHATS)]
+            contents = [f"新消息 {i}-{j}" for j in range(args.new)]
+            for content in contents:
+                fake.deliver(chat, content)
+            fake.reset_stats()
+            started = time.perf_counter()
+            await rpa.click_chat(chat, args.new)
+            elapsed = time.perf_counter() - started
+            received = []
+            while not rpa.recv_queue.empty():
+                received.append(rpa.recv_queue.get_nowait().content)
+            if i < args.warmup:
+                continue
+            walls.append(elapsed * 1000)
+            calls.append(fake.total_calls)
+            nodes.append(fake.nodes)
+            missing += len(set(contents) - set(received))
+    finally:
+        rpa.ui_worker.shutdown()
+    wall = summarize(walls)
+    return {'mode': mode, 'history': history, 'wall_ms': wall['mean'], 'wall_p95_ms': wall['p95'],
+            'uia_calls': sum(calls) / len(calls), 'nodes': sum(nodes) / len(nodes), 'missing': missing}
+
+
+async def run_benchmark(args):
+    rows = []
+    for history in args.history:
+        for mode in MODES:
+            rows.append(await run_mode(mode, history, args))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='消息读取基准测试')
+    parser.add_argument('--history', type=int, nargs='+', default=[50, 200, 1000], help='会话已加载的消息数')
+    parser.add_argument('--new', type=int, default=3, help='每轮收到的新消息数')
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.05, help='每次UIA调用的延迟(毫秒)')
+    parser.add_argument('--node-latency', type=float, default=0.01, help='树查找每个节点的延迟(毫秒)')
+    args = parser.parse_args(argv)
+
+    rows = asyncio.run(run_benchmark(args))
+    print_table(rows, ['mode', 'history', 'wall_ms', 'wall_p95_ms', 'uia_calls', 'nodes', 'missing'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+UIA调用计时包装的开销
+
+在没有调用延迟的模拟控件上，对比包装前后每次 Exists / GetChildren 的耗时，
+以及一次完整的 get_session_list 检查的耗时：
+    python -m benchmarks.bench_metrics --calls 200000 --sessions 300
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.common import print_table
+from main import WeChatRPA
+from metrics import UIA_PRIMITIVES, PrimitiveStats, instrument
+from ui_backend import FakeControl, FakeWeChatBackend
+
+
+def uninstrument():
+    for name in UIA_PRIMITIVES:
+        method = getattr(FakeControl, name)
+        setattr(FakeControl, name, getattr(method, '__wrapped__', method))
+
+
+def time_primitives(fake: FakeWeChatBackend, calls: int) -> dict:
+    control = fake.window.GetChildren()[0]
+    result = {}
+    for name, fn in (('Exists', lambda: control.Exists(0, 0)), ('GetChildren', control.GetChildren)):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        result[name] = (time.perf_counter() - started) / calls * 1e9
+    return result
+
+
+async def time_scan(rpa: WeChatRPA, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await rpa.get_session_list()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def run(args):
+    fake = FakeWeChatBackend.synthetic(n_sessions=args.sessions, n_favorites=1, history=1)
+    rpa = WeChatRPA(ui=fake)
+    await rpa.find_wechat_window()
+    rows = []
+    for mode in ('plain', 'instrumented'):
+        if mode == 'plain':
+            uninstrument()
+        else:
+            instrument(FakeControl, UIA_PRIMITIVES, PrimitiveStats())
+        per_call = time_primitives(fake, args.calls)
+        rows.append({'mode': mode, 'exists_ns': per_call['Exists'], 'get_children_ns': per_call['GetChildren'],
+                     'scan_ms': await time_scan(rpa, args.repeat)})
+    rpa.ui_worker.shutdown()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='UIA调用计时包装的开销')
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--sessions', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=50, help='get_session_list 的执行次数')
+    args = parser.parse_args(argv)
+    rows = asyncio.run(run(args))
+    print_table(rows, ['mode', 'exists_ns', 'get_children_ns', 'scan_ms'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
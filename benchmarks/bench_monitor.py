@@ -0,0 +1,88 @@
+"""
+消息监控调度基准测试
+
+在模拟微信中按泊松过程突发地投递消息，运行 message_monitor + process_task_queue，
+对比固定间隔与自适应调度的真实检测延迟（投递到进入 recv_queue）和检查次数：
+    python -m benchmarks.bench_monitor --duration 10 --fixed-interval 0.5
+时间参数按比例缩小，便于快速运行。
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from benchmarks.common import print_table, summarize
+from main import WeChatRPA
+from scheduler import MonitorScheduler
+from ui_backend import FakeWeChatBackend
+
+
+async def run_mode(name: str, scheduler: MonitorScheduler, args) -> dict:
+    fake = FakeWeChatBackend.synthetic(n_sessions=args.sessions, n_favorites=1, history=5,
+                                       latency=args.latency / 1000, sleep_scale=args.sleep_scale)
+    rpa = WeChatRPA(ui=fake, monitor=scheduler)
+    await rpa.find_wechat_window()
+    lags = []
+    max_pending_monitors = 0
+
+    async def consume():
+        while True:
+            msg = await rpa.recv_queue.get()
+            delivered = fake.delivered_at.get((msg.sender, msg.content))
+            if delivered is not None:
+                lags.append((time.perf_counter() - delivered) * 1000)
+
+    async def produce():
+        rng = random.Random(args.seed)
+        end = time.perf_counter() + args.duration
+        while time.perf_counter() < end:
+            # 突发：一次投递1~5条，之后空闲一段时间
+            for _ in range(rng.randint(1, 5)):
+                chat = f"联系人{rng.randrange(args.sessions)}号"
+                fake.deliver(chat, f"消息 {time.perf_counter():.6f}")
+            await asyncio.sleep(rng.expovariate(1 / args.idle))
+
+    workers = [asyncio.create_task(c) for c in
+               (rpa.message_monitor(), rpa.process_task_queue(), consume())]
+    producer = asyncio.create_task(produce())
+    while not producer.done():
+        pending = rpa.task_queue.pending_count('monitor')
+        max_pending_monitors = max(max_pending_monitors, pending)
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(scheduler.max_interval * 2)
+    for task in workers:
+        task.cancel()
+
+    lag = summarize(lags)
+    return {'mode': name, 'detected': lag['n'], 'delivered': len(fake.delivered_at),
+            'lag_p50_ms': lag['p50'], 'lag_p95_ms': lag['p95'], 'lag_max_ms': lag['max'],
+            'scans': scheduler.scans, 'max_pending_monitors': max_pending_monitors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='消息监控调度基准测试')
+    parser.add_argument('--duration', type=float, default=10, help='投递消息的时长(秒)')
+    parser.add_argument('--idle', type=float, default=1.0, help='突发之间的平均空闲时间(秒)')
+    parser.add_argument('--fixed-interval', type=float, default=0.5, help='固定调度的检查间隔(秒)')
+    parser.add_argument('--min-interval', type=float, default=0.1)
+    parser.add_argument('--max-interval', type=float, default=1.0)
+    parser.add_argument('--latency-target', type=float, default=0.5)
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02, help='每次UIA调用的延迟(毫秒)')
+    parser.add_argument('--sleep-scale', type=float, default=0.0, help='RPA中sleep的实际执行比例')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    fixed = MonitorScheduler(min_interval=args.fixed_interval, max_interval=args.fixed_interval,
+                             latency_target=args.fixed_interval)
+    adaptive = MonitorScheduler(min_interval=args.min_interval, max_interval=args.max_interval,
+                                latency_target=args.latency_target)
+    rows = [asyncio.run(run_mode('fixed', fixed, args)), asyncio.run(run_mode('adaptive', adaptive, args))]
+    print_table(rows, ['mode', 'delivered', 'detected', 'lag_p50_ms', 'lag_p95_ms', 'lag_max_ms',
+                       'scans', 'max_pending_monitors'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+RPA负载下的WebSocket响应性基准测试
+
+持续执行收藏转发任务（流程中的 sleep 按 --sleep-scale 真实等待），同时测量：
+- loop_lag: 事件循环调度延迟（asyncio.sleep 实际超时量）
+- broadcast: 消息放入 recv_queue 到客户端收到的延迟
+--mode inline 在事件循环中直接执行UI调用（改造前的行为），--mode worker 使用专用UI线程：
+    python -m benchmarks.bench_responsiveness --favorites 5 --sleep-scale 0.1
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks.common import print_table, summarize
+from main import WeChatRPA, WsRecvMsg, WsServer
+from subscriptions import Subscription
+from ui_backend import FakeWeChatBackend
+from ui_worker import UIWorker
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.received = {}
+
+    async def send_text(self, data: str):
+        self.received[json.loads(data)['content']] = time.perf_counter()
+
+
+async def run_mode(mode: str, args) -> list:
+    fake = FakeWeChatBackend.synthetic(n_sessions=20, n_favorites=20, history=5,
+                                       sleep_scale=args.sleep_scale)
+    rpa = WeChatRPA(ui=fake, ui_worker=UIWorker(threaded=(mode == 'worker')))
+    await rpa.find_wechat_window()
+    server = WsServer(rpa)
+    socket = RecordingSocket()
+    server.manager.register(socket, 'bench', Subscription())
+    for i in range(args.favorites):
+        await rpa.task_queue.put({'type': 'send_favorite', 'favorite_name': f"收藏_{i}",
+                                  'friend_names': [f"联系人{i}号"]})
+    workers = [asyncio.create_task(rpa.process_task_queue()),
+               asyncio.create_task(server.broadcast_messages())]
+
+    lags, sent = [], {}
+    probe_interval = args.probe_interval / 1000
+    i = 0
+    while not rpa.task_queue.empty() or rpa.is_processing:
+        start = time.perf_counter()
+        await asyncio.sleep(probe_interval)
+        lags.append((time.perf_counter() - start - probe_interval) * 1000)
+        content = f"探测 {i}"
+        sent[content] = time.perf_counter()
+        await rpa.recv_queue.put(WsRecvMsg(sender='bench', content=content))
+        i += 1
+    await asyncio.sleep(0.05)
+    for task in workers:
+        task.cancel()
+    rpa.ui_worker.shutdown()
+
+    broadcast = [(socket.received[c] - t) * 1000 for c, t in sent.items() if c in socket.received]
+    rows = []
+    for name, values in (('loop_lag', lags), ('broadcast', broadcast)):
+        stats = summarize(values)
+        rows.append({'mode': mode, 'metric': name, 'n': stats['n'], 'p50_ms': stats['p50'],
+                     'p95_ms': stats['p95'], 'max_ms': stats['max']})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='RPA负载下的WebSocket响应性基准测试')
+    parser.add_argument('--mode', choices=['inline', 'worker', 'both'], default='both')
+    parser.add_argument('--favorites', type=int, default=5, help='转发任务数')
+    parser.add_argument('--sleep-scale', type=float, default=0.1, help='流程中sleep的实际执行比例')
+    parser.add_argument('--probe-interval', type=float, default=10, help='探测间隔(毫秒)')
+    args = parser.parse_args(argv)
+    modes = ['inline', 'worker'] if args.mode == 'both' else [args.mode]
+    rows = []
+    for mode in modes:
+        rows.extend(asyncio.run(run_mode(mode, args)))
+    print_table(rows, ['mode', 'metric', 'n', 'p50_ms', 'p95_ms', 'max_ms'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+任务调度基准测试
+
+用虚拟时钟模拟混合负载（突发的收藏转发、外发消息、读取消息和监控），
+对比原来的先进先出队列与 TaskScheduler 各类别的排队等待时间百分位：
+    python -m benchmarks.bench_scheduler --tasks 5000
+priority+bulk 在开始时额外放入一批积压的批量发送任务，检查批量发送不影响收消息（read、monitor）
+和外发文本的等待时间（任务不可抢占，增加的等待时间应在一个批量任务的服务时间左右）：
+    python -m benchmarks.bench_scheduler --load 0.5 --bulk 500 --bulk-time 10
+"""
+import argparse
+import asyncio
+import random
+import sys
+from collections import deque
+
+from benchmarks.common import print_table, summarize
+from scheduler import CLASS_ORDER, TaskScheduler
+
+# 各类任务的服务时间(秒)和到达权重
+SERVICE_TIME = {'send_text': 1.5, 'send_favorite': 8.0, 'new_friend': 1.5, 'get_messages': 1.0, 'monitor': 0.3}
+WEIGHTS = {'send_text': 30, 'send_favorite': 10, 'new_friend': 2, 'get_messages': 20, 'monitor': 38}
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def workload(n: int, load: float, seed: int):
+    """生成 (到达时间, 任务) 序列，load 为系统负载率"""
+    rng = random.Random(seed)
+    types = list(WEIGHTS)
+    weights = [WEIGHTS[t] for t in types]
+    mean_service = sum(SERVICE_TIME[t] * w for t, w in WEIGHTS.items()) / sum(weights)
+    t = 0.0
+    for _ in range(n):
+        t += rng.expovariate(load / mean_service)
+        task_type = rng.choices(types, weights)[0]
+        yield t, {'type': task_type}
+
+
+def simulate(queue_kind: str, args, bulk: int = 0) -> dict:
+    clock = VirtualClock()
+    scheduler = TaskScheduler(aging=args.aging, clock=clock)
+    fifo = deque()
+    waits = {cls: [] for cls in CLASS_ORDER}
+    arrivals = deque(workload(args.tasks, args.load, args.seed))
+    for _ in range(bulk):
+        scheduler.put_nowait({'type': 'send_bulk', 'arrived': 0.0})
+    busy_until = 0.0
+    while arrivals or fifo or not scheduler.empty():
+        # 把服务结束前到达的任务放入队列
+        while arrivals and (arrivals[0][0] <= busy_until or (not fifo and scheduler.empty())):
+            at, task = arrivals.popleft()
+            clock.now = max(clock.now, at)
+            task['arrived'] = at
+            if args.deadline and task['type'] == 'send_text':
+                task['deadline'] = at + args.deadline
+            if queue_kind == 'fifo':
+                fifo.append(task)
+            else:
+                scheduler.put_nowait(task)
+        clock.now = max(clock.now, busy_until)
+        if queue_kind == 'fifo':
+            task = fifo.popleft()
+        else:
+            try:
+                task = scheduler.get_nowait()
+            except asyncio.QueueEmpty:
+                continue  # 队列中的任务都已过期
+            scheduler.task_done()
+        waits[TaskScheduler.task_class(task)].append(clock.now - task['arrived'])
+        busy_until = clock.now + (args.bulk_time if task['type'] == 'send_bulk' else SERVICE_TIME[task['type']])
+    rows = []
+    for cls in CLASS_ORDER:
+        stats = summarize(waits[cls])
+        rows.append({'queue': queue_kind + ('+bulk' if bulk else ''), 'class': cls, 'n': stats['n'], 'wait_p50_s': stats['p50'],
+                     'wait_p95_s': stats['p95'], 'wait_max_s': stats['max'],
+                     'expired': scheduler.expired[cls]})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='任务调度基准测试')
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--load', type=float, default=0.9, help='负载率(0~1)')
+    parser.add_argument('--aging', type=float, default=10.0, help='老化时间(秒/优先级)')
+    parser.add_argument('--deadline', type=float, default=0, help='send_text的截止时间(秒)，0表示不设置')
+    parser.add_argument('--bulk', type=int, default=500, help='开始时积压的批量发送任务数，0表示不测')
+    parser.add_argument('--bulk-time', type=float, default=10.0, help='每个批量发送任务的服务时间(秒)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    rows = simulate('fifo', args) + simulate('priority', args)
+    if args.bulk:
+        rows += simulate('priority', args, args.bulk)
+    print_table(rows, ['queue', 'class', 'n', 'wait_p50_s', 'wait_p95_s', 'wait_max_s', 'expired'])
+    if args.bulk:
+        # 批量发送积压前后，收消息和外发文本的等待时间变化
+        by_key = {(row['queue'], row['class']): row for row in rows}
+        for cls in ['outbound', 'read', 'monitor']:
+            before, after = by_key[('priority', cls)], by_key[('priority+bulk', cls)]
+            print(f"{cls}: 积压 {args.bulk} 个批量任务后 wait_p95 {before['wait_p95_s']:.2f}s -> "
+                  f"{after['wait_p95_s']:.2f}s，wait_max {before['wait_max_s']:.2f}s -> {after['wait_max_s']:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+控件树快照回放基准测试
+
+在回放的控件树上测量读取路径：全量扫描会话列表、读取消息列表、冷/热收藏查找。
+不指定快照时先在 FakeWeChatBackend.synthetic 上录制一份（300个会话、每个会话较长的消息历史），
+同时在原模拟后端和回放后端上运行，两者的UIA调用次数应一致：
+    python -m benchmarks.bench_snapshot --sessions 300 --history 500 --favorites 300
+在Windows上录制真实微信后，在Linux上用录制的树形状测量：
+    python ui_snapshot.py record wechat.json.gz
+    python -m benchmarks.bench_snapshot --snapshot wechat.json.gz
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import ui_snapshot
+from benchmarks.common import print_table, summarize
+from dedup import MessageDedup
+from favorites_index import FavoritesIndex
+from main import WeChatRPA
+from ui_backend import FakeWeChatBackend
+
+OPERATIONS = ['session_list', 'detailed_messages', 'favorite_cold', 'favorite_warm']
+
+
+def backend_options(args) -> dict:
+    return {
+        'latency': args.latency / 1000,
+        'search_node_latency': args.node_latency / 1000,
+        'sleep_scale': 0.0,
+    }
+
+
+async def record_synthetic(args, chat: str):
+    """在模拟后端上按真实流程打开一个会话，然后录制收藏页和会话页"""
+    fake = FakeWeChatBackend.synthetic(n_sessions=args.sessions, n_favorites=args.favorites,
+                                       history=args.history, **backend_options(args))
+    rpa = WeChatRPA(ui=fake)
+    try:
+        await rpa.find_wechat_window()
+        await rpa.search_and_open_chat(chat)
+        started = time.perf_counter()
+        snapshot = await rpa.ui_worker.run(ui_snapshot.record_views, rpa, ['Favorites', 'Chats'])
+        elapsed = time.perf_counter() - started
+    finally:
+        rpa.ui_worker.shutdown()
+    return fake, snapshot, elapsed
+
+
+def drain(queue: asyncio.Queue):
+    while not queue.empty():
+        queue.get_nowait()
+        queue.task_done()
+
+
+async def measure(ui, args, chat: str) -> list:
+    rpa = WeChatRPA(ui=ui)
+    rows = []
+    try:
+        if not await rpa.find_wechat_window():
+            raise RuntimeError("回放的控件树中未找到微信窗口")
+
+        async def timed(operation: str, fn, setup=None):
+            walls, calls = [], []
+            for i in range(args.warmup + args.repeat):
+                if setup is not None:
+                    setup(i)
+                ui.reset_stats()
+                started = time.perf_counter()
+                await fn(i)
+                elapsed = time.perf_counter() - started
+                if i >= args.warmup:
+                    walls.append(elapsed * 1000)
+                    calls.append(ui.total_calls)
+            wall = summarize(walls)
+            rows.append({'operation': operation, 'wall_ms': wall['mean'], 'wall_p95_ms': wall['p95'],
+                         'uia_calls': sum(calls) / len(calls)})
+
+        await rpa.click_button('Chats')
+
+        def reset_sessions(_):
+            # 清空上次的会话快照，每次都深度遍历所有会话项
+            rpa.session_rows = {}
+            rpa.session_scan_count = 0
+
+        async def read_sessions(_):
+            await rpa.get_session_list()
+            drain(rpa.task_queue)
+
+        await timed('session_list', read_sessions, reset_sessions)
+
+        def reset_dedup(_):
+            # 没有去重记录和读取游标，每次都全量读取消息列表
+            rpa.dedup = MessageDedup()
+            rpa.message_cursors.clear()
+
+        async def read_messages(_):
+            await rpa.get_detailed_messages(chat, args.msg_count)
+            drain(rpa.recv_queue)
+
+        await timed('detailed_messages', read_messages, reset_dedup)
+
+        await rpa.click_button('Favorites')
+        favorites_list = await rpa.ui_worker.run(rpa._favorites_list)
+        names = [item.Name for item in favorites_list.children] if favorites_list is not None else []
+        if names:
+            def reset_index(_):
+                rpa.favorites_index = FavoritesIndex(ui.is_bound)
+
+            async def lookup(i):
+                name = names[(i * 37) % len(names)]
+                await rpa.ui_worker.run(rpa.favorites_index.lookup, favorites_list, name)
+
+            await timed('favorite_cold', lookup, reset_index)
+            await timed('favorite_warm', lookup)
+    finally:
+        rpa.ui_worker.shutdown()
+    return rows
+
+
+async def run_benchmark(args):
+    chat = args.chat or f"联系人{args.sessions // 2}号"
+    backends = []
+    if args.snapshot:
+        snapshot = ui_snapshot.load(args.snapshot)
+        print(f"快照: {args.snapshot} ({os.path.getsize(args.snapshot) / 1024:.1f} KB)")
+    else:
+        fake, snapshot, elapsed = await record_synthetic(args, chat)
+        backends.append(('synthetic', fake))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot.json.gz')
+            ui_snapshot.save(snapshot, path)
+            size = os.path.getsize(path)
+            snapshot = ui_snapshot.load(path)
+        print(f"录制耗时 {elapsed * 1000:.1f} ms，压缩后 {size / 1024:.1f} KB")
+    for view, node in snapshot['views'].items():
+        print(view, ui_snapshot.stats(node))
+    backends.append(('replay', ui_snapshot.ReplayBackend(snapshot, **backend_options(args))))
+
+    rows = []
+    for name, ui in backends:
+        for row in await measure(ui, args, chat):
+            rows.append({'backend': name, **row})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='控件树快照回放基准测试')
+    parser.add_argument('--snapshot', help='录制的快照文件，不指定时在模拟后端上生成')
+    parser.add_argument('--chat', help='消息列表所属的会话名称')
+    parser.add_argument('--sessions', type=int, default=300, help='模拟会话数')
+    parser.add_argument('--favorites', type=int, default=300, help='模拟收藏数')
+    parser.add_argument('--history', type=int, default=500, help='每个会话的历史消息数')
+    parser.add_argument('--msg-count', type=int, default=20, help='每次读取的最新消息数')
+    parser.add_argument('--latency', type=float, default=0.05, help='每次UIA调用的延迟(毫秒)')
+    parser.add_argument('--node-latency', type=float, default=0.01, help='树查找每个节点的延迟(毫秒)')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rows = asyncio.run(run_benchmark(args))
+    print_table(rows, ['backend', 'operation', 'wall_ms', 'wall_p95_ms', 'uia_calls'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
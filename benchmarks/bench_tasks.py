@@ -0,0 +1,152 @@
+"""
+RPA任务基准测试
+
+在 FakeWeChatBackend 上运行 WeChatRPA 的各类任务，统计每个任务的耗时和UIA调用次数：
+    python -m benchmarks.bench_tasks --sessions 300 --repeat 20
+    python -m benchmarks.bench_tasks --save baseline.json
+    python -m benchmarks.bench_tasks --baseline baseline.json --max-regression 0.2
+
+耗时分为两部分：wall_ms 为实际执行时间（含模拟的UIA延迟），sleep_ms 为流程中请求的等待时间。
+默认 sleep 只记录不执行，可用 --sleep-scale 1 按真实时长等待。
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.common import check_regression, load_results, print_table, save_results, summarize
+from main import WeChatRPA, WsSendMsg
+from ui_backend import FakeWeChatBackend
+
+TASKS = ['monitor', 'get_messages', 'send_text', 'send_favorite', 'send_burst', 'forward_serial', 'forward_multi']
+BURST_SIZE = 10
+FORWARD_FANOUT = 9  # 同一收藏的接收者数
+
+
+def build_rpa(args) -> WeChatRPA:
+    fake = FakeWeChatBackend.synthetic(
+        n_sessions=args.sessions,
+        n_favorites=args.favorites,
+        history=args.history,
+        latency=args.latency / 1000,
+        search_node_latency=args.node_latency / 1000,
+        sleep_scale=args.sleep_scale,
+    )
+    rpa = WeChatRPA(ui=fake)
+    return rpa
+
+
+def drain(queue: asyncio.Queue):
+    while not queue.empty():
+        queue.get_nowait()
+        queue.task_done()
+
+
+async def run_task(rpa: WeChatRPA, task: str, i: int, args) -> bool:
+    fake = rpa.ui
+    target = f"联系人{(i * 7) % args.sessions}号"
+    if task == 'monitor':
+        fake.deliver(target, f"监控消息 {i}")
+        await rpa.get_session_list()
+        return not rpa.task_queue.empty()
+    if task == 'get_messages':
+        for j in range(3):
+            fake.deliver(target, f"新消息 {i}-{j}")
+        before = rpa.recv_queue.qsize()
+        await rpa.click_chat(target, 3)
+        return rpa.recv_queue.qsize() - before == 3
+    if task == 'send_text':
+        content = f"基准消息 {i}"
+        await rpa.async_send_message(WsSendMsg(receiver=target, content=content))
+        return fake.sent[-1:] == [(target, content)]
+    if task == 'send_favorite':
+        favorite = f"收藏_{(i * 13) % args.favorites}"
+        await rpa.find_favorite_and_send_to_friend(favorite, target)
+        return fake.forwarded[-1:] == [(favorite, target)]
+    if task in ('forward_serial', 'forward_multi'):
+        # 同一收藏发给多个朋友：逐个转发 vs 一个转发对话框中多选
+        favorite = f"收藏_{(i * 13) % args.favorites}"
+        friends = [f"联系人{(i * 7 + j) % args.sessions}号" for j in range(FORWARD_FANOUT)]
+        if task == 'forward_serial':
+            for friend in friends:
+                await rpa.find_favorite_and_send_to_friend(favorite, friend)
+        else:
+            await rpa.forward_favorite(favorite, friends)
+        return fake.forwarded[-FORWARD_FANOUT:] == [(favorite, friend) for friend in friends]
+    if task == 'send_burst':
+        # 同一接收者的连续消息经由任务队列处理
+        contents = [f"突发消息 {i}-{j}" for j in range(BURST_SIZE)]
+        for content in contents:
+            rpa.task_queue.put_nowait({'type': 'send_text', 'msg': WsSendMsg(receiver=target, content=content)})
+        worker = asyncio.create_task(rpa.process_task_queue())
+        await rpa.task_queue.join()
+        worker.cancel()
+        return fake.sent[-BURST_SIZE:] == [(target, content) for content in contents]
+    raise ValueError(task)
+
+
+async def run_benchmark(args) -> dict:
+    rpa = build_rpa(args)
+    fake = rpa.ui
+    await rpa.find_wechat_window()
+    results = {}
+    for task in args.tasks:
+        walls, calls, sleeps, failures = [], [], [], 0
+        for i in range(args.warmup + args.repeat):
+            fake.reset_stats()
+            start = time.perf_counter()
+            ok = await run_task(rpa, task, i, args)
+            elapsed = time.perf_counter() - start
+            drain(rpa.task_queue)
+            drain(rpa.recv_queue)
+            if i < args.warmup:
+                continue
+            walls.append(elapsed * 1000)
+            calls.append(fake.total_calls)
+            sleeps.append(fake.slept * 1000)
+            failures += not ok
+        wall = summarize(walls)
+        results[task] = {
+            'wall_ms': wall['mean'],
+            'wall_p95_ms': wall['p95'],
+            'uia_calls': sum(calls) / len(calls),
+            'sleep_ms': sum(sleeps) / len(sleeps),
+            'failures': failures,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='WeChatRPA 任务基准测试')
+    parser.add_argument('--tasks', nargs='+', default=TASKS, choices=TASKS)
+    parser.add_argument('--sessions', type=int, default=100, help='模拟会话数')
+    parser.add_argument('--favorites', type=int, default=100, help='模拟收藏数')
+    parser.add_argument('--history', type=int, default=30, help='每个会话的历史消息数')
+    parser.add_argument('--latency', type=float, default=0.05, help='每次UIA调用的延迟(毫秒)')
+    parser.add_argument('--node-latency', type=float, default=0.01, help='树查找每个节点的延迟(毫秒)')
+    parser.add_argument('--sleep-scale', type=float, default=0.0, help='sleep实际执行比例')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--save', help='将结果保存为基线JSON')
+    parser.add_argument('--baseline', help='与基线JSON比较')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='允许相对基线的增长比例')
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmark(args))
+    rows = [{'task': name, **values} for name, values in results.items()]
+    print_table(rows, ['task', 'wall_ms', 'wall_p95_ms', 'uia_calls', 'sleep_ms', 'failures'])
+
+    if args.save:
+        save_results(args.save, results)
+    if args.baseline:
+        failures = check_regression(results, load_results(args.baseline),
+                                    ['wall_ms', 'uia_calls', 'sleep_ms'], args.max_regression)
+        for line in failures:
+            print(f"回归: {line}")
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+任务追踪基准测试
+
+在 FakeWeChatBackend 上通过任务队列执行收藏转发、文本发送和监控任务，
+输出开启追踪后各类任务累计的 span 树（sleep、条件等待、控件查找和输入各占多少时间），
+以及开启追踪前后的总耗时对比：
+    python -m benchmarks.bench_trace --tasks 20 --sleep-scale 0.01
+    python -m benchmarks.bench_trace --output traces   # 同时写出每个任务的 Chrome trace 文件
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from benchmarks.common import print_table
+from main import WeChatRPA, WsSendMsg
+from tracer import Tracer
+from ui_backend import FakeWeChatBackend
+
+
+async def run_mode(traced: bool, args):
+    fake = FakeWeChatBackend.synthetic(n_sessions=args.sessions, n_favorites=args.favorites, history=3,
+                                       latency=args.latency / 1000, sleep_scale=args.sleep_scale)
+    rpa = WeChatRPA(ui=fake)
+    await rpa.find_wechat_window()
+    tracer = None
+    if traced:
+        tracer = Tracer(args.output, sample_rate=args.sample)
+        rpa.enable_tracing(tracer)
+    worker = asyncio.create_task(rpa.process_task_queue())
+    started = time.perf_counter()
+    for i in range(args.tasks):
+        target = f"联系人{(i * 7) % args.sessions}号"
+        await rpa.task_queue.put({'type': 'send_favorite', 'favorite_name': f"收藏_{i % args.favorites}",
+                                  'friend_names': [target]})
+        await rpa.task_queue.put({'type': 'send_text', 'msg': WsSendMsg(receiver=target, content=f"消息 {i}")})
+        fake.deliver(f"联系人{(i * 3) % args.sessions}号", f"新消息 {i}")
+        await rpa.task_queue.put({'type': 'monitor'})
+        await rpa.task_queue.join()
+    elapsed = time.perf_counter() - started
+    worker.cancel()
+    rpa.ui_worker.shutdown()
+    return elapsed, tracer
+
+
+async def run(args):
+    plain, _ = await run_mode(False, args)
+    traced, tracer = await run_mode(True, args)
+    return plain, traced, tracer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='任务追踪基准测试')
+    parser.add_argument('--tasks', type=int, default=20, help='每类任务的执行次数')
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--favorites', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.05, help='每次UIA调用的延迟(毫秒)')
+    parser.add_argument('--sleep-scale', type=float, default=0.01, help='流程中 sleep 的实际执行比例')
+    parser.add_argument('--sample', type=float, default=1.0, help='追踪的任务比例')
+    parser.add_argument('--output', default=None, help='Chrome trace 文件目录，不指定时不写文件')
+    parser.add_argument('--top', type=int, default=12, help='每类任务显示累计耗时最多的 span 数')
+    args = parser.parse_args(argv)
+    plain, traced, tracer = asyncio.run(run(args))
+    for task_type in sorted(tracer.profiles):
+        rows = tracer.profile(task_type)
+        top = sorted(rows, key=lambda row: -row['total_ms'])[:args.top]
+        print(f"\n{task_type}")
+        print_table([row for row in rows if row in top], ['span', 'count', 'total_ms', 'mean_ms'])
+    print()
+    print_table([{'mode': 'plain', 'wall_ms': plain * 1000},
+                 {'mode': 'traced', 'wall_ms': traced * 1000, 'traced_tasks': tracer.traced,
+                  'files': tracer.written}], ['mode', 'wall_ms', 'traced_tasks', 'files'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
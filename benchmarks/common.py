@@ -0,0 +1,61 @@
+"""基准测试公共工具：统计、表格输出、基线保存与回归门禁"""
+import json
+from typing import Dict, List, Sequence
+
+from scheduler import percentile
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    if not values:
+        return {'n': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    return {
+        'n': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'max': max(values),
+    }
+
+
+def print_table(rows: List[Dict], columns: List[str]):
+    widths = {c: max(len(c), *(len(_fmt(r.get(c))) for r in rows)) if rows else len(c) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    print('  '.join('-' * widths[c] for c in columns))
+    for row in rows:
+        print('  '.join(_fmt(row.get(c)).ljust(widths[c]) for c in columns))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return '' if value is None else str(value)
+
+
+def save_results(path: str, results: Dict):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_regression(results: Dict[str, Dict], baseline: Dict[str, Dict],
+                     metrics: Sequence[str], max_regression: float) -> List[str]:
+    """
+    与基线比较，返回超出阈值的指标描述
+    :param max_regression: 允许的相对增长，如0.2表示最多比基线慢20%
+    """
+    failures = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        for metric in metrics:
+            if metric not in base or metric not in current:
+                continue
+            limit = base[metric] * (1 + max_regression)
+            if current[metric] > limit and current[metric] - base[metric] > 1e-9:
+                failures.append(f"{name}.{metric}: {current[metric]:.3f} > {limit:.3f} (基线 {base[metric]:.3f})")
+    return failures
@@ -0,0 +1,108 @@
+"""
+批量文本发送
+
+客户端原来每个 WebSocket 帧只能提交一条 send_text，也收不到任何反馈。
+send_text_bulk 用一个内容模板加接收者列表（每个接收者可以带自己的变量）提交一个批量任务：
+- render_bulk 按接收者渲染模板，缺少变量的条目直接判为失败；模板只能引用变量名，
+  不允许 {receiver.upper}、{vars[0]} 这样的属性和下标访问，也不允许 {receiver:>10}、{receiver!r}
+  这样的格式说明和转换
+- plan_bulk 按接收者分组（同一接收者只打开一次聊天窗口，N条消息发给M个人只需M次搜索），
+  每组按 max_batch 拆分成任务，进入任务队列的 bulk 级别
+- 每条消息的排队、发送成功、失败事件（带耗时）发回提交任务的客户端
+"""
+import string
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class BulkItem:
+    index: int  # 在请求的 receivers 列表中的位置
+    receiver: str
+    content: str
+
+
+@dataclass
+class BulkJob:
+    job_id: str
+    client_id: Optional[str]
+    total: int
+    accepted_at: float = field(default_factory=time.monotonic)
+    sent: int = 0
+    failed: int = 0
+
+    @property
+    def done(self) -> bool:
+        return self.sent + self.failed >= self.total
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.accepted_at) * 1000
+
+
+class _TemplateFormatter(string.Formatter):
+    """只允许 {变量名} 的模板格式化，属性、下标、位置参数、格式说明和转换都判为模板错误"""
+
+    def get_field(self, field_name, args, kwargs):
+        if not field_name.isidentifier():
+            raise ValueError(f"不支持的模板字段: {{{field_name}}}")
+        return kwargs[field_name], field_name
+
+    def format_field(self, value, format_spec):
+        # {receiver:>999999999} 这样的宽度会让每个条目分配巨大的字符串
+        if format_spec:
+            raise ValueError(f"不支持的格式说明: {format_spec}")
+        return super().format_field(value, format_spec)
+
+    def convert_field(self, value, conversion):
+        if conversion:
+            raise ValueError(f"不支持的转换: !{conversion}")
+        return super().convert_field(value, conversion)
+
+
+_formatter = _TemplateFormatter()
+
+
+def render_bulk(template: str, receivers: List[dict]) -> Tuple[List[BulkItem], List[Tuple[int, str, str]]]:
+    """
+    渲染每个接收者的消息内容
+    :param receivers: [{"receiver": 名称, "vars": {变量: 值}}] 或 [名称]，模板中还可以使用 {receiver}
+    :return: (可发送的条目, [(位置, 接收者, 失败原因)])
+    """
+    items = []
+    errors = []
+    for index, entry in enumerate(receivers):
+        if isinstance(entry, str):
+            entry = {'receiver': entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get('receiver', ''), str):
+            errors.append((index, '', "接收者格式错误"))
+            continue
+        receiver = entry.get('receiver', '')
+        try:
+            variables = dict(entry.get('vars') or {})
+            variables.setdefault('receiver', receiver)
+            content = _formatter.vformat(template, (), variables)
+        except (KeyError, ValueError, TypeError) as e:
+            errors.append((index, receiver, f"模板变量错误: {str(e)}"))
+            continue
+        if not receiver or not content.strip():
+            errors.append((index, receiver, "接收者或内容为空"))
+            continue
+        items.append(BulkItem(index, receiver, content))
+    return items, errors
+
+
+def plan_bulk(items: List[BulkItem], max_batch: int) -> List[List[BulkItem]]:
+    """
+    规划发送顺序：同一接收者的消息合并为一组（组内保持原有先后顺序），
+    各组按接收者首次出现的顺序排列；每组最多 max_batch 条
+    """
+    groups: Dict[str, List[BulkItem]] = OrderedDict()
+    for item in items:
+        groups.setdefault(item.receiver, []).append(item)
+    batches = []
+    for group in groups.values():
+        for i in range(0, len(group), max_batch):
+            batches.append(group[i:i + max_batch])
+    return batches
@@ -0,0 +1,89 @@
+"""
+联系人目录
+
+原来 search_and_open_chat 和转发对话框直接把接收者名称输入搜索框后回车，
+名称拼错或不存在时要白白走完一整轮UI操作，还可能打开错误的聊天。
+ContactDirectory 由通讯录和会话列表构建，在任何UI操作之前解析接收者：
+精确名称 > 备注/昵称 > 模糊匹配（difflib，只接受唯一的候选，需要请求方明确开启，
+否则相近的名称只作为拒绝时的 suggestions，不会悄悄改写接收者），
+解析失败的名称在 negative_ttl 秒内直接判定为未知，不再重复查找。
+"""
+import difflib
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+
+class ContactDirectory:
+    def __init__(self, negative_ttl: float = 300.0, fuzzy_cutoff: float = 0.85,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param negative_ttl: 未知名称的缓存时间（秒）
+        :param fuzzy_cutoff: 模糊匹配的最低相似度(0~1)
+        """
+        self.negative_ttl = negative_ttl
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.clock = clock
+        self.names: Set[str] = set()  # 微信中显示的名称（有备注时为备注）
+        self.aliases: Dict[str, str] = {}  # 昵称等其他名称 -> 显示名称
+        self._negative: Dict[str, float] = {}  # 未知名称 -> 缓存到期时间
+        self.loaded_at: Optional[float] = None  # 最近一次读取通讯录的时间
+        self.negative_hits = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name: str):
+        return name in self.names
+
+    def update(self, names: Iterable[str], aliases: Optional[Dict[str, str]] = None, complete: bool = False):
+        """
+        加入联系人，有新名称时清空未知名称缓存
+        :param aliases: {其他名称: 显示名称}
+        :param complete: 是否为完整的通讯录（记录读取时间）
+        """
+        before = (len(self.names), len(self.aliases))
+        self.names.update(name for name in names if name)
+        if aliases:
+            self.aliases.update(aliases)
+        if (len(self.names), len(self.aliases)) != before:
+            self._negative.clear()
+        if complete:
+            self.loaded_at = self.clock()
+
+    def is_known_missing(self, name: str) -> bool:
+        """名称是否在未知名称缓存中且未过期"""
+        expires = self._negative.get(name)
+        if expires is None:
+            return False
+        if expires <= self.clock():
+            del self._negative[name]
+            return False
+        return True
+
+    def resolve(self, name: str, fuzzy: bool = False) -> Optional[str]:
+        """
+        解析为微信中可以搜索到的显示名称，未知时返回None
+        目录为空（还没有读取过通讯录和会话列表）时原样返回，不做拦截
+        :param fuzzy: 是否接受唯一的模糊匹配结果
+        """
+        if not self.names:
+            return name
+        if name in self.names:
+            return name
+        if name in self.aliases:
+            return self.aliases[name]
+        if fuzzy:
+            matches = difflib.get_close_matches(name, list(self.names) + list(self.aliases), n=2,
+                                                cutoff=self.fuzzy_cutoff)
+            if len(matches) == 1:
+                return self.aliases.get(matches[0], matches[0])
+        if self.is_known_missing(name):
+            self.negative_hits += 1
+            return None
+        self._negative[name] = self.clock() + self.negative_ttl
+        return None
+
+    def suggestions(self, name: str, n: int = 3) -> List[str]:
+        """相似的联系人名称，用于提示"""
+        matches = difflib.get_close_matches(name, list(self.names) + list(self.aliases), n=n, cutoff=0.5)
+        return [self.aliases.get(match, match) for match in matches]
@@ -0,0 +1,123 @@
+"""
+收藏索引
+
+原来每次转发收藏都对整个 All Favorites 列表调用 GetChildren()，再逐项读取名称做子串匹配，
+收藏有几百项时这部分扫描占了任务的大部分时间。
+FavoritesIndex 记录每个收藏项的名称、列表位置和控件，按名称支持精确、前缀（有序名称上二分查找）
+和子串查找；只有查找未命中、命中的控件已失效或名称已变化、列表第一项变化（新收藏加在列表最前面）
+时才重新读取列表，未变化的项沿用原来的记录，列表有变化时清空子串查找的缓存。
+同时匹配多项时按 精确名称 > 名称前缀 > 包含 的顺序，同一级别内取列表位置最前的一项
+（原来取列表中第一个包含查找文本的项，名称完全相同的收藏现在优先于排在它前面、只是包含该文本的收藏）。
+"""
+import bisect
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from ui_backend import ControlType
+
+
+@dataclass
+class FavoriteEntry:
+    name: str
+    position: int  # 在 All Favorites 列表中的位置
+    control: object
+
+
+class FavoritesIndex:
+    def __init__(self, is_bound: Callable[[object], bool]):
+        """
+        :param is_bound: 检查控件对应的元素是否仍然存在，通常为 UIBackend.is_bound；
+                         不能检查可见性，滚动到可见区域外的收藏项也要能命中
+        """
+        self.is_bound = is_bound
+        self.entries: List[FavoriteEntry] = []
+        self._by_name: Dict[str, FavoriteEntry] = {}  # 同名收藏只记录位置最前的一项
+        self._sorted_names: List[str] = []
+        self._substring_cache: Dict[str, Optional[FavoriteEntry]] = {}
+        self._head: Optional[str] = None  # 上次读取时列表第一项的名称
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def refresh(self, favorites_list) -> int:
+        """
+        重新读取收藏列表，返回新增、删除或移动的项数
+        """
+        self.refreshes += 1
+        entries = []
+        by_name = {}
+        changed = 0
+        children = favorites_list.GetChildren()
+        self._head = children[0].Name if children else None
+        for child in children:
+            if child.ControlType != ControlType.ListItemControl:
+                continue
+            name = child.Name
+            old = self._by_name.get(name)
+            if old is not None and old.position == len(entries):
+                old.control = child
+                entry = old
+            else:
+                entry = FavoriteEntry(name, len(entries), child)
+                changed += 1
+            entries.append(entry)
+            by_name.setdefault(name, entry)
+        changed += len(self._by_name.keys() - by_name.keys())
+        self.entries = entries
+        if changed or len(by_name) != len(self._by_name):
+            self._by_name = by_name
+            self._sorted_names = sorted(by_name)
+            self._substring_cache.clear()
+        logging.debug(f"收藏索引刷新: 共{len(entries)}项，变化{changed}项")
+        return changed
+
+    def find(self, query: str) -> Optional[FavoriteEntry]:
+        """按精确、前缀、子串的顺序查找，同一级别内取列表位置最前的一项"""
+        entry = self._by_name.get(query)
+        if entry is not None:
+            return entry
+        start = bisect.bisect_left(self._sorted_names, query)
+        prefixed = []
+        for name in self._sorted_names[start:]:
+            if not name.startswith(query):
+                break
+            prefixed.append(self._by_name[name])
+        if prefixed:
+            return min(prefixed, key=lambda e: e.position)
+        if query not in self._substring_cache:
+            self._substring_cache[query] = next((e for e in self.entries if query in e.name), None)
+        return self._substring_cache[query]
+
+    def lookup(self, favorites_list, query: str) -> Optional[FavoriteEntry]:
+        """
+        查找收藏项，未命中或控件失效时刷新索引后再查一次
+        列表第一项变化说明有新收藏，先刷新索引，缓存的结果（包括未命中）可能已经不是最前的匹配项
+        """
+        if self.entries and not self._head_unchanged(favorites_list):
+            self.refresh(favorites_list)
+        entry = self.find(query)
+        if entry is not None and self._valid(entry, query):
+            self.hits += 1
+            return entry
+        self.misses += 1
+        self.refresh(favorites_list)
+        return self.find(query)
+
+    def _head_unchanged(self, favorites_list) -> bool:
+        try:
+            first = favorites_list.GetFirstChildControl()
+            return (first.Name if first is not None else None) == self._head
+        except Exception as e:
+            logging.debug(f"读取收藏列表第一项出错: {str(e)}")
+            return False
+
+    def _valid(self, entry: FavoriteEntry, query: str) -> bool:
+        try:
+            return self.is_bound(entry.control) and query in entry.control.Name
+        except Exception as e:
+            logging.debug(f"收藏项已失效: {str(e)}")
+            return False
@@ -0,0 +1,147 @@
+"""
+消息历史存储
+
+检测到的消息广播一次后就丢弃了，广播时未连接的客户端无法再取回。
+MessageHistory 把收到的 WsRecvMsg 和发出的 WsSendMsg 追加写入 SQLite（WAL模式），
+按 (联系人, 时间) 和时间建索引，查询使用键集分页（游标为上一页最后一条的时间和ID），
+翻到任意深度的代价都只是一次索引定位，数千万行时依然稳定。
+写入先缓存在内存中，攒够一批或最早的一条停留超过刷新间隔（定时提交）后在专用线程中一次提交，
+查询前会先提交缓存。
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+RECEIVED = 0
+SENT = 1
+DIRECTIONS = {RECEIVED: 'recv', SENT: 'sent'}
+
+
+class MessageHistory:
+    def __init__(self, path: str = 'history.db', flush_interval: float = 0.5, max_buffer: int = 1000):
+        """
+        :param flush_interval: 缓存写入的最长停留时间（秒）
+        :param max_buffer: 缓存达到该条数时立即提交
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='message-history')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor.submit(self._open).result()
+        self._buffer: List[tuple] = []
+        self._last_flush = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'id INTEGER PRIMARY KEY, contact TEXT NOT NULL, direction INTEGER NOT NULL, '
+            'content TEXT NOT NULL, ts REAL NOT NULL)'
+        )
+        # rowid 隐含在索引末尾，(contact, ts, id) 与 (ts, id) 的排序都可以直接走索引
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_contact_ts ON messages (contact, ts)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages (ts)')
+        self._conn.commit()
+
+    def record(self, contact: str, content: str, direction: int = RECEIVED, ts: float = None):
+        """追加一条消息，不等待写入"""
+        self._buffer.append((contact, direction, content, time.time() if ts is None else ts))
+        if len(self._buffer) >= self.max_buffer or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        elif self._timer is None:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        """缓存中有消息时设置定时提交，之后没有新消息也不会一直停留在内存中"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 不在事件循环中（如基准测试直接写入），只按条数和查询时提交
+        self._timer = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """在写入线程中提交缓存的消息"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        self._executor.submit(self._write, rows).add_done_callback(self._on_written)
+
+    def _write(self, rows: List[tuple]):
+        with self._conn:
+            self._conn.executemany('INSERT INTO messages (contact, direction, content, ts) VALUES (?, ?, ?, ?)', rows)
+
+    @staticmethod
+    def _on_written(future):
+        if future.exception() is not None:
+            logging.error(f"写入消息历史出错: {str(future.exception())}")
+
+    async def query(self, contact: Optional[str] = None, start: Optional[float] = None,
+                    end: Optional[float] = None, limit: int = 50, cursor: Optional[str] = None):
+        """
+        按联系人和时间范围查询，从新到旧分页
+        :param cursor: 上一页返回的 next_cursor
+        :return: (消息列表, 下一页游标，没有更多时为None)
+        """
+        self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._query, contact, start, end, limit, cursor)
+
+    def _query(self, contact: Optional[str], start: Optional[float], end: Optional[float],
+               limit: int, cursor: Optional[str]) -> Tuple[List[dict], Optional[str]]:
+        conditions = []
+        params = []
+        if contact is not None:
+            conditions.append('contact = ?')
+            params.append(contact)
+        if start is not None:
+            conditions.append('ts >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('ts <= ?')
+            params.append(end)
+        if cursor:
+            cursor_ts, cursor_id = self.parse_cursor(cursor)
+            # ts <= ? 让 SQLite 在索引上做范围定位，括号内只过滤同一时间的记录
+            conditions.append('ts <= ? AND (ts < ? OR id < ?)')
+            params.extend([cursor_ts, cursor_ts, cursor_id])
+        sql = 'SELECT id, contact, direction, content, ts FROM messages'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ts DESC, id DESC LIMIT ?'
+        params.append(limit + 1)  # 多取一条判断是否还有下一页
+        rows = self._conn.execute(sql, params).fetchall()
+
+        messages = [{
+            'id': row_id,
+            'contact': row_contact,
+            'direction': DIRECTIONS.get(direction, 'recv'),
+            'content': content,
+            'ts': ts,
+        } for row_id, row_contact, direction, content, ts in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = messages[-1]
+            next_cursor = f"{last['ts']!r}_{last['id']}"
+        return messages, next_cursor
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> Tuple[float, int]:
+        """解析游标，格式错误时抛出 ValueError"""
+        ts, _, row_id = cursor.rpartition('_')
+        return float(ts), int(row_id)
+
+    def close(self):
+        self.flush()
+        self._executor.submit(self._conn.close).result()
+        self._executor.shutdown()
@@ -0,0 +1,177 @@
+"""
+外发任务日志（预写日志）
+
+send_queue 和 task_queue 都在内存中，程序崩溃或重启会丢失所有已接受但还没发送的任务。
+TaskJournal 用 SQLite（WAL模式）记录每个外发任务：
+- append / append_many 在任务进入任务队列之前写入并等待落盘；上一次提交进行期间到达的写入
+  合并为下一次提交（组提交），突发请求时多条任务分摊一次 fsync
+- 任务执行结束后 complete 标记完成或失败，不需要等待落盘；提交失败时完成标记保留到下一次提交
+- 启动时 replay 返回所有未完成的任务，重新加入任务队列
+- 已完成的记录在组提交中定期删除（最多每 prune_interval 秒一次），长时间运行时数据库不会无限增长
+执行到一半时崩溃的任务在重启后会再执行一次（至少一次语义）。
+所有数据库操作都在专用线程中执行，不阻塞事件循环。
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+PENDING = 0
+SUCCEEDED = 1
+FAILED = 2
+
+
+class TaskJournal:
+    def __init__(self, path: str = 'tasks.db', commit_window: float = 0.0, synchronous: str = 'FULL',
+                 prune_interval: float = 60.0):
+        """
+        :param path: 数据库文件路径
+        :param commit_window: 第一条写入到达后额外等待的时间（秒），用来收集更多写入；
+                              为0时只合并上一次提交期间到达的写入
+        :param synchronous: SQLite synchronous 设置，FULL 每次提交都 fsync，NORMAL 只在检查点时 fsync
+        :param prune_interval: 删除已完成记录的最短间隔（秒）
+        """
+        self.path = path
+        self.commit_window = commit_window
+        self.prune_interval = prune_interval
+        self._last_prune = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='task-journal')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._next_id = self._executor.submit(self._open, synchronous).result() + 1
+        self._inserts: List[tuple] = []
+        self._updates: List[tuple] = []
+        self._waiters: List[asyncio.Future] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self.commits = 0
+        self.records = 0
+        self.commit_seconds = 0.0
+        self.pruned = 0
+
+    def _open(self, synchronous: str) -> int:
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'PRAGMA synchronous={synchronous}')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            'id INTEGER PRIMARY KEY, type TEXT NOT NULL, payload TEXT NOT NULL, '
+            'status INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, finished_at REAL)'
+        )
+        self._conn.commit()
+        return self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM tasks').fetchone()[0]
+
+    def _write(self, inserts: List[tuple], updates: List[tuple]):
+        """一个事务写入一批任务和完成标记"""
+        started = time.perf_counter()
+        prune = bool(updates) and time.monotonic() - self._last_prune >= self.prune_interval
+        with self._conn:
+            if inserts:
+                self._conn.executemany(
+                    'INSERT INTO tasks (id, type, payload, created_at) VALUES (?, ?, ?, ?)', inserts)
+            if updates:
+                self._conn.executemany('UPDATE tasks SET status=?, finished_at=? WHERE id=?', updates)
+            if prune:
+                # 随完成标记在同一个事务中删除，不额外增加提交次数
+                pruned = self._conn.execute('DELETE FROM tasks WHERE status != ?', (PENDING,)).rowcount
+        if prune:
+            self.pruned += pruned
+            self._last_prune = time.monotonic()
+        self.commit_seconds += time.perf_counter() - started
+        self.commits += 1
+        self.records += len(inserts) + len(updates)
+
+    async def append(self, task_type: str, payload: dict) -> int:
+        """
+        写入一条任务，落盘后返回任务日志ID
+        :param payload: 可JSON序列化的任务内容
+        """
+        return (await self.append_many([(task_type, payload)]))[0]
+
+    async def append_many(self, records: List[Tuple[str, dict]]) -> List[int]:
+        """
+        写入多条任务，在同一次提交中落盘后按顺序返回各自的任务日志ID
+        :param records: [(任务类型, 任务内容)]
+        """
+        journal_ids = []
+        now = time.time()
+        for task_type, payload in records:
+            journal_id = self._next_id
+            self._next_id += 1
+            self._inserts.append((journal_id, task_type, json.dumps(payload, ensure_ascii=False), now))
+            journal_ids.append(journal_id)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._schedule_flush()
+        await waiter
+        return journal_ids
+
+    def complete(self, journal_id: int, success: bool = True):
+        """标记任务已执行（成功或失败），随下一次提交写入"""
+        self._updates.append((SUCCEEDED if success else FAILED, time.time(), journal_id))
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        failed = False
+        # 提交失败后只在有新的写入时重试，放回的完成标记随下一次提交写入
+        while self._inserts or (self._updates and not failed):
+            if self.commit_window > 0:
+                await asyncio.sleep(self.commit_window)
+            inserts, self._inserts = self._inserts, []
+            updates, self._updates = self._updates, []
+            waiters, self._waiters = self._waiters, []
+            try:
+                await loop.run_in_executor(self._executor, self._write, inserts, updates)
+            except Exception as e:
+                logging.error(f"写入任务日志出错: {str(e)}")
+                failed = True
+                # 完成标记放回重试，丢掉的话重启后这些已执行的任务会被重放、重复发送
+                self._updates[:0] = updates
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    def replay(self) -> List[Tuple[int, str, dict]]:
+        """
+        返回未完成的任务 [(任务日志ID, 任务类型, 任务内容)]，按写入顺序排列
+        已完成的记录在此时也清理一次
+        """
+        def load():
+            with self._conn:
+                self._conn.execute('DELETE FROM tasks WHERE status != ?', (PENDING,))
+            rows = self._conn.execute(
+                'SELECT id, type, payload FROM tasks WHERE status = ? ORDER BY id', (PENDING,)).fetchall()
+            return [(journal_id, task_type, json.loads(payload)) for journal_id, task_type, payload in rows]
+
+        return self._executor.submit(load).result()
+
+    def stats(self) -> dict:
+        return {
+            'commits': self.commits,
+            'records': self.records,
+            'records_per_commit': self.records / self.commits if self.commits else 0.0,
+            'commit_ms': self.commit_seconds / self.commits * 1000 if self.commits else 0.0,
+            'pruned': self.pruned,
+        }
+
+    def close(self):
+        """写入尚未提交的记录并关闭数据库"""
+        inserts, self._inserts = self._inserts, []
+        updates, self._updates = self._updates, []
+        if inserts or updates:
+            try:
+                self._executor.submit(self._write, inserts, updates).result()
+            except Exception as e:
+                logging.error(f"写入任务日志出错: {str(e)}")
+        self._executor.submit(self._conn.close).result()
+        self._executor.shutdown()
@@ -0,0 +1,103 @@
+"""
+任务生命周期
+
+原来通过 /ws/{client_id} 提交的请求发出后就没有任何回应，process_task_queue 中的失败只写进服务器日志，
+客户端无法知道消息是否、何时发出。每个被接受的请求现在有一个 task_id（客户端可以自己指定），
+TaskTracker 把生命周期事件发回提交请求的客户端：
+- accepted: 通过准入检查进入队列，带排队位置和预计完成时间
+- started: 开始执行，带排队等待时间 wait_ms
+- succeeded / failed: 执行结束，带 wait_ms、执行耗时 exec_ms 和总耗时 total_ms
+一个请求可能拆成多个任务执行（收藏转发按对话框、批量发送按接收者分组），
+第一个任务开始时发送 started，全部任务结束后发送一次 succeeded 或 failed。
+task_id 由客户端指定时不同客户端可能重复，任务按 (client_id, task_id) 区分。
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+ACCEPTED = 'accepted'
+STARTED = 'started'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+@dataclass
+class TaskRecord:
+    task_id: str
+    client_id: Optional[str]
+    request: str  # 客户端提交的请求类型
+    parts: int = 1  # 拆分成的任务数
+    accepted_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_parts: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+class TaskTracker:
+    def __init__(self, emit: Callable[[str, dict], None], clock: Callable[[], float] = time.monotonic):
+        """
+        :param emit: 发送事件给客户端，参数为 (client_id, 事件)
+        """
+        self.emit = emit
+        self.clock = clock
+        self.tasks: Dict[Tuple[Optional[str], str], TaskRecord] = {}  # 未结束的请求，键为 (client_id, task_id)
+
+    def __contains__(self, key: Tuple[Optional[str], str]):
+        return key in self.tasks
+
+    def _event(self, record: TaskRecord, status: str, **fields):
+        if record.client_id is not None:
+            self.emit(record.client_id, {'type': 'task', 'task_id': record.task_id, 'request': record.request,
+                                         'status': status, **fields})
+
+    def accept(self, task_id: str, client_id: Optional[str], request: str, **fields):
+        """请求进入队列，fields 附加在 accepted 事件中"""
+        record = TaskRecord(task_id, client_id, request, accepted_at=self.clock())
+        self.tasks[(client_id, task_id)] = record
+        self._event(record, ACCEPTED, **fields)
+
+    def set_parts(self, task_id: Optional[str], client_id: Optional[str], parts: int):
+        """请求拆分后的任务数"""
+        record = self.tasks.get((client_id, task_id))
+        if record is not None:
+            record.parts = max(1, parts)
+
+    def restore(self, task_id: Optional[str], client_id: Optional[str], request: str):
+        """从任务日志恢复的任务，同一请求的多个任务累加任务数，不再发送 accepted"""
+        if task_id is None:
+            return
+        record = self.tasks.get((client_id, task_id))
+        if record is None:
+            self.tasks[(client_id, task_id)] = TaskRecord(task_id, client_id, request, accepted_at=self.clock())
+        else:
+            record.parts += 1
+
+    def start(self, task_id: Optional[str], client_id: Optional[str]):
+        record = self.tasks.get((client_id, task_id))
+        if record is None or record.started_at is not None:
+            return
+        record.started_at = self.clock()
+        self._event(record, STARTED, wait_ms=(record.started_at - record.accepted_at) * 1000)
+
+    def finish(self, task_id: Optional[str], client_id: Optional[str], success: bool, error: Optional[str] = None):
+        """一个任务结束，请求的全部任务结束后发送 succeeded 或 failed"""
+        record = self.tasks.get((client_id, task_id))
+        if record is None:
+            return
+        record.finished_parts += 1
+        if not success:
+            record.errors.append(error or "执行失败")
+        if record.finished_parts < record.parts:
+            return
+        del self.tasks[(client_id, task_id)]
+        now = self.clock()
+        started_at = record.started_at if record.started_at is not None else now
+        fields = {
+            'wait_ms': (started_at - record.accepted_at) * 1000,
+            'exec_ms': (now - started_at) * 1000,
+            'total_ms': (now - record.accepted_at) * 1000,
+        }
+        if record.errors:
+            self._event(record, FAILED, error='; '.join(dict.fromkeys(record.errors)), **fields)
+        else:
+            self._event(record, SUCCEEDED, **fields)
@@ -0,0 +1,70 @@
+"""
+控件定位缓存
+
+微信主窗口中的会话列表、消息列表、搜索框、输入框和导航按钮在窗口生命周期内基本不变，
+深度树查找却是每个任务里最耗时的部分。LocatorCache 保存已解析的控件，复用前做一次
+廉价的存活校验；窗口句柄变化（微信重启）时整体失效。
+"""
+import logging
+from typing import Callable, Dict, Optional
+
+
+class LocatorCache:
+    def __init__(self, is_alive: Callable[[object], bool] = None):
+        """
+        :param is_alive: 校验已缓存（已绑定元素）的控件是否仍然有效的函数，默认调用 Exists(0, 0)
+        """
+        self._is_alive = is_alive or (lambda control: control.Exists(0, 0))
+        self._controls: Dict[str, object] = {}
+        self._window_handle = None
+        self.hits = 0
+        self.misses = 0
+
+    def bind_window(self, window):
+        """绑定主窗口，句柄与之前不同时清空缓存"""
+        try:
+            handle = window.NativeWindowHandle
+        except Exception:
+            handle = None
+        if handle != self._window_handle:
+            if self._controls:
+                logging.info("微信窗口已变化，清空控件缓存")
+            self._controls.clear()
+            self._window_handle = handle
+
+    def get(self, key: str, resolve: Callable[[], Optional[object]]):
+        """
+        获取控件，缓存失效时调用 resolve 重新查找
+        :param key: 缓存键
+        :param resolve: 查找函数，返回控件或None
+        :return: 存在的控件，找不到时返回None
+        """
+        control = self._controls.get(key)
+        if control is not None:
+            try:
+                if self._is_alive(control):
+                    self.hits += 1
+                    return control
+            except Exception as e:
+                logging.debug(f"缓存控件 {key} 校验失败: {str(e)}")
+            del self._controls[key]
+
+        self.misses += 1
+        control = resolve()
+        # 新查找的控件还没有绑定元素，读取属性会触发带超时的重新查找，
+        # 这里用 Exists(0, 0) 只查找一次，找不到时立即返回；_is_alive 只用于已缓存的控件
+        try:
+            if control is None or not control.Exists(0, 0):
+                return None
+        except Exception as e:
+            logging.debug(f"控件 {key} 校验失败: {str(e)}")
+            return None
+        self._controls[key] = control
+        return control
+
+    def invalidate(self, key: str = None):
+        """使单个或全部缓存失效"""
+        if key is None:
+            self._controls.clear()
+        else:
+            self._controls.pop(key, None)
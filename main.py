@@ -1,20 +1,44 @@
 import asyncio
 from dataclasses import dataclass
-from typing import List, Dict
-import uiautomation as auto
+from typing import List, Dict, Optional, Tuple
 import logging
 import json
 import time
 import fastapi
 from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from starlette.websockets import WebSocketState
 import os
+import re
 import subprocess
-import pyautogui
+import uuid
+from ui_backend import ControlType, UIBackend, UIAutomationBackend
+from locator_cache import LocatorCache
+from admission import AdmissionController
+from bulk import BulkItem, BulkJob, plan_bulk, render_bulk
+from contacts import ContactDirectory
+from dedup import MessageDedup
+from favorites_index import FavoritesIndex
+from lifecycle import TaskTracker
+from message_cursor import MessageCursor, advance, read_tail
+from message_filter import MESSAGE, TIME, MessageFilter
+from metrics import Histogram, MetricsWriter, PrimitiveStats
+from journal import TaskJournal
+from history import MessageHistory, SENT
+from outbound import DROP_OLDEST, ClientOutbox
+from scheduler import MonitorScheduler, TaskScheduler
+from subscriptions import Subscription, SubscriptionIndex
+from tracer import Tracer
+from ui_worker import UIWorker
+from ui_wait import StepTimer, wait_until
 
 @dataclass
 class WsSendMsg:
     receiver: str  
     content: str
+    deadline: Optional[float] = None  # 截止时间(time.monotonic)，过期未发送则丢弃
+    client_id: Optional[str] = None  # 提交请求的客户端
+    task_id: Optional[str] = None  # 用于向客户端报告任务进度
 
 @dataclass
 class WsRecvMsg:
@@ -24,30 +48,209 @@ class WsRecvMsg:
 @dataclass
 class WsFavoriteMsg:
     favorite_name: str
-    friend_name: str
+    friend_names: List[str]  # 同一个收藏发给多个朋友时在一个转发对话框中完成
+    deadline: Optional[float] = None
+    client_id: Optional[str] = None  # 发起请求的客户端，用于回复每个接收者的结果
+    task_id: Optional[str] = None
+
+@dataclass
+class WsBulkMsg:
+    job: BulkJob
+    items: List[BulkItem]  # 已渲染、接收者已解析的条目
+    deadline: Optional[float] = None
+
+CONTACT_HEADERS = {'新的朋友', '公众号', '群聊', '标签', '企业微信联系人'}  # 通讯录中不是联系人的固定入口
+CONTACT_INDEX_PATTERN = re.compile(r'^[A-Z#]$')  # 通讯录首字母分组标题
+# 开启追踪时记录为 span 的步骤方法（UI线程中直接执行的函数由 UIWorker 记录）
+TRACED_STEPS = ('_click_button', '_favorites_list', '_find_favorite_item', '_select_forward_recipient',
+                '_cancel_forward_dialog', '_session_list', '_search_and_open_chat', '_wait_chat_opened',
+                'human_move_to')
+# 服务端主动断开 WebSocket 时的关闭码
+CLOSE_NORMAL = 1000
+CLOSE_TRY_AGAIN_LATER = 1013  # 发送队列溢出或写入出错，客户端稍后重连
+
+@dataclass
+class SessionRow:
+    """会话列表中一项的快照"""
+    name: str  # 会话项名称（含未读提示）
+    unread: int
+    texts: List[str]  # 面板文本，包含预览
+    preview: Optional[str] = None  # 沿最后一个子控件读到的预览文本，用于判断会话项是否变化
 
 class WeChatRPA:
-    def __init__(self):
+    def __init__(self, ui: UIBackend = None, dedup: MessageDedup = None,
+                 monitor: MonitorScheduler = None, ui_worker: UIWorker = None,
+                 journal: TaskJournal = None, history: MessageHistory = None,
+                 message_filter: MessageFilter = None):
+        self.ui = ui or UIAutomationBackend()  # UI自动化后端
+        # 所有UI自动化调用都在这个专用线程中执行，事件循环只提交任务并等待结果
+        self.ui_worker = ui_worker or UIWorker(self.ui.thread_initializer())
         self.wx_window = None
         self.welcome_msg = "你好，我是小助手，有什么可以帮你的吗？"
-        self.send_queue = asyncio.Queue()  # 发送队列
+        self.pending_welcomes: Dict[str, int] = {}  # 欢迎消息未发出、等待下一次检查重试的新好友 -> 已尝试次数
+        self.max_welcome_attempts = 3  # 欢迎消息最多尝试发送的次数
+        self.send_queue = asyncio.Queue(maxsize=1000)  # 发送队列，满时 handle_message 等待（反压）
         self.recv_queue = asyncio.Queue()  # 接收队列
-        self.task_queue = asyncio.Queue()  # 任务队列
+        self.task_queue = TaskScheduler(on_drop=self._on_task_dropped, maxsize=2000)  # 任务队列（优先级调度）
         self.processing_lock = asyncio.Lock()  # 处理锁
         self.is_processing = False  # 是否正在处理任务
-        self.processed_messages = set()  # 已处理消息的集合
+        self.tasks_processed = 0
+        self.queue_report_interval = 100  # 每处理多少个任务输出一次排队统计
+        self.dedup = dedup if dedup is not None else MessageDedup()  # 已处理消息的去重存储
+        self.message_filter = message_filter or MessageFilter()  # 时间分隔、系统消息、未读提示和新好友提示的匹配规则
+        self.locators = LocatorCache(self.ui.is_alive)  # 常用控件缓存
+        self.favorites_index = FavoritesIndex(self.ui.is_bound)  # 收藏名称到列表项的索引
+        self.contacts = ContactDirectory()  # 联系人目录，用于在UI操作前校验接收者
+        self.contacts_refresh_interval = 60  # 接收者未知时重新读取通讯录的最短间隔（秒）
+        self._contacts_refresh: Optional[asyncio.Task] = None  # 后台读取通讯录的任务
+        self.max_contact_pages = 100  # 读取通讯录时最多滚动的次数
+        self.max_forward_recipients = 9  # 转发对话框一次最多选择的联系人数（微信多选上限）
+        self.reply_queue = asyncio.Queue()  # 回复给发起请求客户端的消息 (client_id, dict)
+        self.bulk_jobs: Dict[Tuple[Optional[str], str], BulkJob] = {}  # 进行中的批量发送任务，键为 (client_id, job_id)
+        self.max_send_batch = 20  # 同一接收者一次合并发送的最大消息数
+        self.session_rows: Dict[Tuple[str, Optional[str]], SessionRow] = {}  # 上一次检查时的会话列表快照，键为 (名称, 预览)
+        self.session_scan_count = 0
+        self.full_session_scan_interval = 60  # 每隔多少次检查全量遍历一次面板文本
+        self.session_unread: Dict[str, int] = {}  # 上一次检查时各会话的未读数
+        self.message_cursors: Dict[str, MessageCursor] = {}  # 各会话消息列表上次读到的位置
+        self.max_tail_items = 200  # 从消息列表末尾往前查找游标的最大项数，为0时每次全量读取
+        self.monitor = monitor or MonitorScheduler()  # 消息监控调度
+        self.step_timer = StepTimer()  # 各UI步骤的实际等待耗时
+        self.wait_interval = 0.05  # 条件等待的轮询间隔
+        self.journal = journal  # 外发任务日志，为None时不持久化
+        self.history = history  # 消息历史，为None时不记录
+        self.admission = AdmissionController()  # 外发请求的准入控制和排队时间估计
+        # 外发请求的生命周期事件，经 reply_queue 发回提交请求的客户端
+        self.tracker = TaskTracker(lambda client_id, event: self.reply_queue.put_nowait((client_id, event)))
+        self.task_latency: Dict[str, Histogram] = {}  # 任务类型 -> 执行耗时
+        self.uia_stats = PrimitiveStats()  # UIA基础调用的次数和耗时
+        self.ui.instrument(self.uia_stats)
+        self.tracer: Optional[Tracer] = None  # 任务追踪，默认关闭，见 enable_tracing
+
+    def enable_tracing(self, tracer: Tracer):
+        """开启任务追踪：记录UI线程中执行的函数、主要步骤、条件等待、UI后端调用和UIA基础调用"""
+        self.tracer = tracer
+        self.ui_worker.tracer = tracer
+        self.uia_stats.tracer = tracer
+        tracer.attach_backend(self.ui)
+        tracer.attach(self, TRACED_STEPS)
 
     def human_move_to(self, x, y):
         """模拟人类移动鼠标"""
         try:
-            pyautogui.moveTo(x, y, duration=0.3)
+            self.ui.move_to(x, y, duration=0.3)
             return True
         except Exception as e:
             logging.error(f"移动鼠标时出错: {str(e)}")
             return False
 
+    def _session_list(self):
+        """会话列表（缓存）"""
+        return self.locators.get('session_list', lambda: self.wx_window.ListControl(Name='会话'))
+
+    def _search_box(self):
+        """主窗口搜索框（缓存）"""
+        return self.locators.get('search_box', lambda: self.wx_window.EditControl(Name='Search'))
+
+    def _input_box(self):
+        """聊天输入框（缓存）"""
+        return self.locators.get('input_box', lambda: self.wx_window.EditControl(
+            IsKeyboardFocusable=True, searchDepth=10))
+
+    def _nav_button(self, button_name: str):
+        """左侧导航按钮（缓存）"""
+        return self.locators.get(f'nav:{button_name}', lambda: self.wx_window.ButtonControl(
+            Name=button_name, searchDepth=5))
+
+    def _contact_list(self):
+        """通讯录列表（缓存）"""
+        return self.locators.get('contact_list', lambda: self.wx_window.ListControl(Name='联系人'))
+
+    def _favorites_list(self):
+        """收藏页的 All Favorites 列表（缓存）"""
+        # 定义递归向上查找All Favorites列表的函数
+        def find_all_favorites_in_ancestors(control, depth=6):
+            try:
+                # 先检查当前控件是否是All Favorites列表
+                if (control.ControlType == ControlType.ListControl and 
+                    control.Name == 'All Favorites' and control.Exists()):
+                    logging.info(f"找到All Favorites列表")
+                    return control
+                
+                # 搜索当前控件的子控件
+                for child in control.GetChildren():
+                    list_control = find_all_favorites_in_ancestors(child, 0)
+                    if list_control:
+                        return list_control
+                
+                # 如果当前深度允许，向上递归查找
+                if depth > 0:
+                    parent = control.GetParentControl()
+                    if parent:
+                        return find_all_favorites_in_ancestors(parent, depth - 1)
+                        
+            except Exception as e:
+                logging.error(f"在递归查找All Favorites时出错: {str(e)}")
+            return None
+
+        return self.locators.get('favorites_list', lambda: find_all_favorites_in_ancestors(self.wx_window))
+
+    def _forward_menu_item(self):
+        """收藏项右键菜单中的转发选项，菜单还未弹出时返回None"""
+        menu = self.ui.window_control(ClassName='CMenuWnd', searchDepth=1)
+        if not menu.Exists(0, 0):
+            return None
+        item = menu.MenuItemControl(SubName='转发', searchDepth=3)
+        return item if item.Exists(0, 0) else None
+
+    def _forward_dialog_open(self) -> bool:
+        """转发对话框是否打开（主界面没有Cancel按钮）"""
+        return self.wx_window.ButtonControl(Name='Cancel', searchDepth=6).Exists(0, 0)
+
+    def _forward_selected_list(self):
+        """转发对话框中已选择的联系人列表（目前只在 FakeWeChatBackend 中核对过）"""
+        return self.wx_window.ListControl(Name='已选择', searchDepth=6)
+
+    def _forward_send_button(self):
+        """转发对话框中可点击的发送按钮，未选择联系人时按钮不可用"""
+        for name in ('Send', '发送'):
+            button = self.wx_window.ButtonControl(Name=name, searchDepth=6)
+            if button.Exists(0, 0) and button.IsEnabled:
+                return button
+        return None
+
+    def _find_favorite_item(self, favorites_list, favorite_name: str):
+        """通过收藏索引查找收藏项，不在可见区域时先滚动到该项"""
+        entry = self.favorites_index.lookup(favorites_list, favorite_name)
+        if entry is None:
+            return None
+        item = entry.control
+        logging.info(f"找到匹配的收藏项: {entry.name} (第{entry.position + 1}项)")
+        if item.IsOffscreen:
+            item.GetScrollItemPattern().ScrollIntoView()
+            self._wait_for('favorite_scroll', lambda: not item.IsOffscreen, timeout=1.0)
+        return item
+
+    def _wait_for(self, step: str, predicate, timeout: float = 3.0):
+        """
+        等待UI条件满足并记录该步骤的耗时
+        :return: predicate 的返回值，超时返回None
+        """
+        started = time.perf_counter()
+        result = wait_until(predicate, timeout=timeout, interval=self.wait_interval, sleep=self.ui.sleep)
+        elapsed = time.perf_counter() - started
+        self.step_timer.record(step, elapsed, timed_out=result is None)
+        if self.tracer is not None:
+            self.tracer.record(f"wait:{step}", 'wait', started, elapsed, {'timed_out': result is None})
+        if result is None:
+            logging.warning(f"等待超时: {step} ({timeout}秒)")
+        return result
+
     async def start_wechat(self):
         """尝试启动微信"""
+        return self._start_wechat()
+
+    def _start_wechat(self) -> bool:
         try:
             # 微信常见安装路径
             wechat_paths = [
@@ -75,13 +278,37 @@ class WeChatRPA:
                 task = await self.task_queue.get()
                 async with self.processing_lock:
                     self.is_processing = True
+                    started = time.monotonic()
+                    finished = [task]
+                    trace = self.tracer.begin(task) if self.tracer is not None else None
+                    self.tracker.start(task.get('task_id'), task.get('client_id'))
                     try:
                         if task['type'] == 'send_text':
-                            success = await self.async_send_message(task['msg'])
-                            if not success:
-                                logging.error(f"消息发送失败: {task['msg']}")
+                            # 合并队列中发给同一接收者的文本消息，只打开一次聊天窗口
+                            batch = [task] + self._take_pending_sends(task['msg'].receiver)
+                            finished = batch
+                            for t in batch[1:]:
+                                self.tracker.start(t.get('task_id'), t.get('client_id'))
+                            try:
+                                results = await self.async_send_messages([t['msg'] for t in batch])
+                            finally:
+                                for _ in batch[1:]:
+                                    self.task_queue.task_done()
+                            for t, success in zip(batch, results):
+                                self._complete_task(t, success, "发送失败")
+                                if success:
+                                    self._record_sent(t['msg'])
+                                else:
+                                    logging.error(f"消息发送失败: {t['msg']}")
+                            # 刚发送过消息，尽快检查回复
+                            self.monitor.notify_activity()
                         elif task['type'] == 'monitor':
-                            await self.get_session_list()
+                            started = time.monotonic()
+                            detected = self.monitor.detected
+                            try:
+                                await self.get_session_list()
+                            finally:
+                                self.monitor.scan_finished(started, self.monitor.detected > detected)
                         elif task['type'] == 'get_messages':
                             # 处理获取消息的任务
                             await self.click_chat(task['chat_name'], task['msg_count'])
@@ -94,44 +321,80 @@ class WeChatRPA:
                                 content=self.welcome_msg
                             )
                             success = await self.async_send_message(welcome_msg)
-                            if not success:
-                                logging.error(f"发送欢迎消息失败: {task['chat_name']}")
+                            if success:
+                                self._record_sent(welcome_msg)
+                            elif task.get('attempt', 1) < self.max_welcome_attempts:
+                                # 会话项文本没有变化时不会再次检测到新好友，记下来由下一次检查重试
+                                logging.error(f"发送欢迎消息失败，稍后重试: {task['chat_name']}")
+                                self.pending_welcomes[task['chat_name']] = task.get('attempt', 1)
+                            else:
+                                logging.error(f"发送欢迎消息失败，已尝试{task['attempt']}次，放弃: {task['chat_name']}")
+                        elif task['type'] == 'send_bulk':
+                            await self._process_bulk_task(task)
                         elif task['type'] == 'send_favorite':
-                            logging.info(f"处理发送收藏消息: {task['favorite_name']} -> {task['friend_name']}")
-                            success = await self.find_favorite_and_send_to_friend(task['favorite_name'], task['friend_name'])
-                            if not success:
-                                logging.error(f"发送收藏消息失败: {task['favorite_name']} -> {task['friend_name']}")
+                            friend_names = task['friend_names']
+                            logging.info(f"处理发送收藏消息: {task['favorite_name']} -> {', '.join(friend_names)}")
+                            results = await self.forward_favorite(task['favorite_name'], friend_names)
+                            failed = [name for name, success in results.items() if not success]
+                            if failed:
+                                logging.error(f"发送收藏消息失败: {task['favorite_name']} -> {', '.join(failed)}")
+                            # 先发送这个对话框的结果，再结束任务，客户端收到 succeeded/failed 时结果已全部送达
+                            if task.get('client_id') is not None:
+                                await self.reply_queue.put((task['client_id'], {
+                                    'type': 'send_favorite_result',
+                                    'task_id': task.get('task_id'),
+                                    'part': task.get('part', 0),
+                                    'favorite_name': task['favorite_name'],
+                                    'results': results
+                                }))
+                            self._complete_task(task, not failed, f"转发失败: {', '.join(failed)}")
                         else:
                             logging.error(f"未知任务类型: {task['type']}")
                     finally:
                         self.is_processing = False
+                        if trace is not None:
+                            self.tracer.end(trace)
+                        duration = (time.monotonic() - started) / len(finished)
+                        for t in finished:
+                            self.task_latency.setdefault(t['type'], Histogram()).observe(duration)
+                            if 'task_id' in t and not t.get('completed'):
+                                # 执行中出现异常，没有走到完成的地方
+                                self._complete_task(t, False, "执行出错")
+                            self._release_task(t, duration)
                         self.task_queue.task_done()
+                        self.tasks_processed += 1
+                        if self.tasks_processed % self.queue_report_interval == 0:
+                            self._report_queue_waits()
             except Exception as e:
                 logging.error(f"处理任务出错: {str(e)}")
-            await asyncio.sleep(0.1)
     async def find_wechat_window(self)->bool:
         """查找微信主窗口"""
+        return await self.ui_worker.run(self._find_wechat_window)
+
+    def _find_wechat_window(self) -> bool:
         try:
             # 使用微信的类名查找
-            self.wx_window = auto.WindowControl(ClassName='WeChatMainWndForPC', searchDepth=3)
+            self.wx_window = self.ui.window_control(ClassName='WeChatMainWndForPC', searchDepth=3)
             if self.wx_window.Exists():
                 logging.info("通过类名成功找到微信窗口")
+                self.locators.bind_window(self.wx_window)
                 self.wx_window.SetActive()
-                time.sleep(0.5)
+                self.ui.sleep(0.5)
                 return True
             
             # 如果仍未找到，可能微信未启动，尝试启动
             logging.warning("未找到微信窗口，尝试启动微信...")
-            await self.start_wechat()
-            time.sleep(1)  # 等待微信启动
+            self._start_wechat()
+            self.ui.sleep(1)  # 等待微信启动
             
             # 再次尝试查找
             for name in ['微信', 'WeChat']:
-                self.wx_window = auto.WindowControl(Name=name, searchDepth=3)
+                self.wx_window = self.ui.window_control(Name=name, searchDepth=3)
                 if self.wx_window.Exists():
                     logging.info(f"启动后成功找到微信窗口，窗口名称: {name}")
+                    self.locators.bind_window(self.wx_window)
                     self.wx_window.SetActive()
-                    time.sleep(0.5)
+                    self.ui.sleep(0.5)
                     return True
             
             logging.error("尝试启动后仍未找到微信窗口")
@@ -142,25 +405,28 @@ class WeChatRPA:
 
     async def search_and_open_chat(self, contact_name)->bool:
         """搜索并打开指定联系人的聊天窗口"""
+        return await self.ui_worker.run(self._search_and_open_chat, contact_name)
+
+    def _search_and_open_chat(self, contact_name) -> bool:
         try:
             # 点击搜索框
-            search_box = self.wx_window.EditControl(Name='Search')
-            if not search_box.Exists():
+            search_box = self._search_box()
+            if search_box is None:
                 logging.error("未找到搜索框")
                 return False
             
             search_box.Click()
             # 清空搜索框
             search_box.SendKeys('{Ctrl}a')
-            time.sleep(0.2)
             search_box.SendKeys('{Delete}')
-            time.sleep(0.2)
+            self._wait_for('search_clear', lambda: search_box.GetValuePattern().Value == '')
             
             # 输入联系人名称
             search_box.SendKeys(contact_name)
-            time.sleep(0.3)  # 等待搜索结果
+            self._wait_for('search_input', lambda: search_box.GetValuePattern().Value == contact_name)
             search_box.SendKeys('{Enter}')
-            time.sleep(0.3)
+            # 打开聊天后搜索框会被清空
+            self._wait_for('open_chat', lambda: search_box.GetValuePattern().Value == '')
             return True
             
         except Exception as e:
@@ -169,45 +435,205 @@ class WeChatRPA:
     async def process_send_queue(self):
         """处理发送队列"""
         while True:
-            if not self.send_queue.empty():
-                msg = await self.send_queue.get()
-                # 根据消息类型将任务加入任务队列
-                if isinstance(msg, WsSendMsg):
-                    await self.task_queue.put({
-                        'type': 'send_text',
-                        'msg': msg
-                    })
-                elif isinstance(msg, WsFavoriteMsg):
-                    await self.task_queue.put({
-                        'type': 'send_favorite',
-                        'favorite_name': msg.favorite_name,
-                        'friend_name': msg.friend_name
-                    })
-            else:
-                await asyncio.sleep(0.1)
+            # 阻塞等待，有消息时取出队列中所有已到达的消息，一起写入任务日志后转交任务队列
+            msgs = [await self.send_queue.get()]
+            while not self.send_queue.empty():
+                msgs.append(self.send_queue.get_nowait())
+            try:
+                batches = []
+                for msg in msgs:
+                    try:
+                        batches.append((msg, self._tasks_for(msg)))
+                    except Exception as e:
+                        logging.error(f"任务入队出错: {str(e)}")
+                        self._abandon_msg(msg, f"任务入队出错: {str(e)}")
+                tasks = [task for _, msg_tasks in batches for task in msg_tasks]
+                if self.journal is not None and tasks:
+                    # 先写入任务日志再入队，崩溃后可以恢复；一次提交落盘，不逐条等待
+                    try:
+                        journal_ids = await self.journal.append_many(
+                            [(task['type'], self._encode_task(task)) for task in tasks])
+                    except Exception as e:
+                        # 写入失败时任务照常执行，只是崩溃后无法恢复
+                        logging.error(f"写入任务日志出错，任务不记录日志直接入队: {str(e)}")
+                    else:
+                        for task, journal_id in zip(tasks, journal_ids):
+                            task['journal_id'] = journal_id
+                for msg, msg_tasks in batches:
+                    for task in msg_tasks:
+                        await self.task_queue.put(task)
+                    if isinstance(msg, WsBulkMsg):
+                        self.bulk_progress(msg.job.job_id, msg.job.client_id, 'queued',
+                                            messages=len(msg.items), batches=len(msg_tasks))
+            except Exception as e:
+                logging.error(f"任务入队出错: {str(e)}")
+            finally:
+                for _ in msgs:
+                    self.send_queue.task_done()
+
+    def _abandon_msg(self, msg, error: str):
+        """已准入的请求无法入队：释放在途工作量，通知客户端失败"""
+        if isinstance(msg, WsBulkMsg):
+            self.admission.release(msg.job.client_id, 'send_bulk', len(msg.items))
+            self.tracker.set_parts(msg.job.job_id, msg.job.client_id, 1)
+            self.tracker.finish(msg.job.job_id, msg.job.client_id, False, error)
+            self.bulk_jobs.setdefault((msg.job.client_id, msg.job.job_id), msg.job)
+            # 每条消息报告失败，全部结束后发送 done 并清理任务记录
+            for item in msg.items:
+                self.bulk_progress(msg.job.job_id, msg.job.client_id, 'failed',
+                                   index=item.index, receiver=item.receiver, error=error)
+        elif isinstance(msg, WsFavoriteMsg):
+            dialogs = -(-len(msg.friend_names) // self.max_forward_recipients)
+            self.admission.release(msg.client_id, 'send_favorite', dialogs)
+            self.tracker.set_parts(msg.task_id, msg.client_id, 1)
+            self.tracker.finish(msg.task_id, msg.client_id, False, error)
+        elif isinstance(msg, WsSendMsg):
+            self.admission.release(msg.client_id, 'send_text', 1)
+            self.tracker.set_parts(msg.task_id, msg.client_id, 1)
+            self.tracker.finish(msg.task_id, msg.client_id, False, error)
+
+    def _tasks_for(self, msg) -> List[dict]:
+        """根据消息类型生成任务队列中的任务"""
+        tasks = []
+        if isinstance(msg, WsSendMsg):
+            tasks.append({
+                'type': 'send_text',
+                'msg': msg,
+                'deadline': msg.deadline,
+                'client_id': msg.client_id,
+                'task_id': msg.task_id
+            })
+        elif isinstance(msg, WsFavoriteMsg):
+            # 每个转发对话框最多选择 max_forward_recipients 个联系人，超出时拆成多个任务
+            for i in range(0, len(msg.friend_names), self.max_forward_recipients):
+                tasks.append({
+                    'type': 'send_favorite',
+                    'favorite_name': msg.favorite_name,
+                    'friend_names': msg.friend_names[i:i + self.max_forward_recipients],
+                    'part': i // self.max_forward_recipients,
+                    'deadline': msg.deadline,
+                    'client_id': msg.client_id,
+                    'task_id': msg.task_id
+                })
+        elif isinstance(msg, WsBulkMsg):
+            job = msg.job
+            self.bulk_jobs[(job.client_id, job.job_id)] = job
+            for batch in plan_bulk(msg.items, self.max_send_batch):
+                tasks.append({
+                    'type': 'send_bulk',
+                    'job_id': job.job_id,
+                    'client_id': job.client_id,
+                    'task_id': job.job_id,
+                    'receiver': batch[0].receiver,
+                    'items': [(item.index, item.content) for item in batch],
+                    'deadline': msg.deadline
+                })
+        if tasks:
+            self.tracker.set_parts(tasks[0]['task_id'], tasks[0]['client_id'], len(tasks))
+        return tasks
+
+    async def refresh_contacts(self) -> int:
+        """读取通讯录更新联系人目录，返回联系人数"""
+        async with self.processing_lock:
+            names, aliases = await self.ui_worker.run(self._load_contacts)
+        # 读取失败时同样记录时间，避免每个未知名称都触发一次读取
+        self.contacts.update(names, aliases, complete=True)
+        logging.info(f"通讯录共 {len(names)} 个联系人，{len(aliases)} 个昵称")
+        return len(names)
+
+    def _load_contacts(self):
+        """返回 (显示名称列表, {昵称: 显示名称})"""
+        names = []
+        aliases = {}
+        try:
+            if not self._click_button("Contacts"):
+                return names, aliases
+            contact_list = self._contact_list()
+            if contact_list is None:
+                logging.error("未找到通讯录列表")
+                return names, aliases
+            seen = set()
+            for _ in range(self.max_contact_pages):
+                new_items = [item for item in contact_list.GetChildren()
+                             if item.ControlType == ControlType.ListItemControl and item.Name not in seen]
+                if not new_items:
+                    break
+                for item in new_items:
+                    name = item.Name
+                    seen.add(name)
+                    if name in CONTACT_HEADERS or CONTACT_INDEX_PATTERN.match(name):
+                        continue
+                    names.append(name)
+                    # 设置了备注的联系人，子项中是微信昵称
+                    for child in item.GetChildren():
+                        if child.ControlType == ControlType.TextControl and child.Name and child.Name != name:
+                            aliases[child.Name] = name
+                # 通讯录列表是虚拟化的，滚动到最后一项以加载后面的联系人
+                new_items[-1].GetScrollItemPattern().ScrollIntoView()
+            return names, aliases
+        except Exception as e:
+            logging.error(f"读取通讯录出错: {str(e)}")
+            return names, aliases
+        finally:
+            self._click_button("Chats")
+
+    async def resolve_receiver(self, name: str, fuzzy: bool = False) -> Optional[str]:
+        """
+        在任何UI操作之前解析接收者名称，未知时返回None
+        名称不在目录中且距离上次读取通讯录超过 contacts_refresh_interval 时在后台重新读取一次，
+        读取通讯录要等待 processing_lock，不在请求路径上等待，本次请求直接判定为未知
+        :param fuzzy: 是否接受唯一的模糊匹配结果（请求中的 fuzzy 字段）
+        """
+        cached_miss = self.contacts.is_known_missing(name)
+        resolved = self.contacts.resolve(name, fuzzy)
+        if resolved is not None or cached_miss:
+            return resolved
+        loaded_at = self.contacts.loaded_at
+        if loaded_at is None or self.contacts.clock() - loaded_at >= self.contacts_refresh_interval:
+            self.refresh_contacts_later()
+        return None
+
+    def refresh_contacts_later(self):
+        """在后台读取通讯录，已经在读取时不重复启动"""
+        if self._contacts_refresh is not None and not self._contacts_refresh.done():
+            return
+        self._contacts_refresh = asyncio.get_running_loop().create_task(self._refresh_contacts_background())
+
+    async def _refresh_contacts_background(self):
+        try:
+            await self.refresh_contacts()
+        except Exception as e:
+            logging.error(f"后台读取通讯录出错: {str(e)}")
+
     async def click_button(self, button_name)->bool:
         """
         点击微信收藏按钮
         button_name: 按钮名称(收藏:Favorites, 主页面:Chats,联系人:Contacts,······)
         return: 是否点击成功
         """
+        return await self.ui_worker.run(self._click_button, button_name)
+
+    def _click_button(self, button_name) -> bool:
         try:
             # 先确保微信窗口是激活的
             if self.wx_window and self.wx_window.Exists():
                 self.wx_window.SetActive()
-                time.sleep(0.5)
                 
                 # 方法1: 直接通过名称查找按钮控件
-                favorites_button = self.wx_window.ButtonControl(Name=button_name, searchDepth=5)
-                if favorites_button.Exists():
+                favorites_button = self._wait_for('activate', lambda: self._nav_button(button_name), timeout=1.0)
+                if favorites_button is not None:
                     logging.info("找到Favorites按钮 (方法1)")
                     favorites_button.Click()
-                    time.sleep(0.5)
-                    return True
-                
-                time.sleep(0.3)
-                pyautogui.click()
-                time.sleep(0.5)
+                else:
+                    self.ui.click()
+                # 等待对应页面加载完成，不按固定时间等待
+                if button_name == 'Favorites':
+                    self._wait_for('favorites_view', lambda: (
+                        (favorites := self._favorites_list()) is not None and favorites.GetFirstChildControl()))
+                elif button_name == 'Chats':
+                    self._wait_for('chats_view', self._session_list)
+                elif button_name == 'Contacts':
+                    self._wait_for('contacts_view', self._contact_list)
                 return True
                 
             else:
@@ -219,69 +645,218 @@ class WeChatRPA:
     
     async def async_send_message(self, msg: WsSendMsg) -> bool:
         """异步执行发送操作"""
+        return (await self.async_send_messages([msg]))[0]
+
+    async def async_send_messages(self, msgs: List[WsSendMsg]) -> List[bool]:
+        """异步发送同一接收者的多条消息，返回每条消息是否成功"""
         try:
-            # 直接调用异步发送方法
-            return await self._sync_send(msg)
+            return await self.ui_worker.run(self._sync_send_batch, msgs)
         except Exception as e:
             logging.error(f"异步发送异常: {str(e)}")
-            return False
+            return [False] * len(msgs)
+
+    def _report_queue_waits(self):
+        """输出各优先级类别的排队等待时间百分位和UI步骤耗时"""
+        for cls, stats in self.task_queue.stats().items():
+            logging.info(
+                f"排队等待 {cls}: p50={stats['wait_p50']:.2f}s p95={stats['wait_p95']:.2f}s "
+                f"p99={stats['wait_p99']:.2f}s 待执行={stats['pending']} 过期={stats['expired']}"
+            )
+        for step, stats in self.step_timer.stats().items():
+            logging.info(
+                f"UI步骤 {step}: 平均={stats['mean']:.3f}s 最大={stats['max']:.3f}s "
+                f"次数={stats['count']} 超时={stats['timeouts']}"
+            )
+
+    def _on_task_dropped(self, task: dict):
+        """任务过期被调度器丢弃"""
+        if task['type'] == 'monitor':
+            self.monitor.pending = False
+        else:
+            self._complete_task(task, False, "超过截止时间")
+            self._release_task(task)
+            if task['type'] == 'send_bulk':
+                for index, _ in task['items']:
+                    self.bulk_progress(task['job_id'], task.get('client_id'), 'failed',
+                                        index=index, receiver=task['receiver'], error="超过截止时间")
+            logging.error(f"任务超过截止时间未执行，已丢弃: {task}")
+
+    @staticmethod
+    def _task_units(task: dict) -> int:
+        """任务的工作量：批量发送按消息条数，其他任务为1"""
+        return len(task['items']) if task['type'] == 'send_bulk' else 1
+
+    def _release_task(self, task: dict, duration: Optional[float] = None):
+        """任务执行完或被丢弃，从在途工作量中扣除；duration 为实际执行耗时"""
+        self.admission.release(task.get('client_id'), task['type'], self._task_units(task), duration)
+
+    def _complete_task(self, task: dict, success: bool, error: Optional[str] = None):
+        """在任务日志中标记外发任务已执行，并通知提交请求的客户端"""
+        task['completed'] = True
+        if self.journal is not None and 'journal_id' in task:
+            self.journal.complete(task['journal_id'], success)
+        self.tracker.finish(task.get('task_id'), task.get('client_id'), success, None if success else error)
+
+    @staticmethod
+    def _encode_task(task: dict) -> dict:
+        """外发任务转换为任务日志内容，截止时间转换为墙上时间"""
+        if task['type'] == 'send_text':
+            payload = {'receiver': task['msg'].receiver, 'content': task['msg'].content}
+        elif task['type'] == 'send_bulk':
+            payload = {'job_id': task['job_id'], 'receiver': task['receiver'], 'items': task['items']}
+        else:
+            payload = {'favorite_name': task['favorite_name'], 'friend_names': task['friend_names'],
+                       'part': task.get('part', 0)}
+        payload['client_id'] = task.get('client_id')
+        payload['task_id'] = task.get('task_id')
+        if task.get('deadline') is not None:
+            payload['expires_at'] = time.time() + task['deadline'] - time.monotonic()
+        return payload
+
+    @staticmethod
+    def _decode_task(journal_id: int, task_type: str, payload: dict) -> dict:
+        """任务日志内容还原为任务"""
+        deadline = None
+        if payload.get('expires_at') is not None:
+            deadline = time.monotonic() + payload['expires_at'] - time.time()
+        if task_type == 'send_text':
+            task = {'type': task_type,
+                    'msg': WsSendMsg(receiver=payload['receiver'], content=payload['content'], deadline=deadline,
+                                     client_id=payload.get('client_id'), task_id=payload.get('task_id'))}
+        elif task_type == 'send_bulk':
+            task = {'type': task_type, 'job_id': payload['job_id'],
+                    'receiver': payload['receiver'], 'items': [tuple(item) for item in payload['items']]}
+        else:
+            task = {'type': task_type, 'favorite_name': payload['favorite_name'],
+                    'friend_names': payload['friend_names'], 'part': payload.get('part', 0)}
+        task['client_id'] = payload.get('client_id')
+        task['task_id'] = payload.get('task_id')
+        task['deadline'] = deadline
+        task['journal_id'] = journal_id
+        return task
+
+    def replay_journal(self) -> int:
+        """把任务日志中未完成的任务重新加入任务队列，返回恢复的任务数"""
+        if self.journal is None:
+            return 0
+        count = 0
+        for journal_id, task_type, payload in self.journal.replay():
+            task = self._decode_task(journal_id, task_type, payload)
+            try:
+                self.task_queue.put_nowait(task)
+            except asyncio.QueueFull:
+                # 剩余的任务仍是未完成状态，下次启动时恢复
+                logging.error("任务队列已满，剩余的任务留在任务日志中")
+                break
+            if task_type == 'send_bulk':
+                self._restore_bulk_job(task)
+            self.admission.track(task['client_id'], task_type, self._task_units(task))
+            self.tracker.restore(task['task_id'], task['client_id'],
+                                 'send_text_bulk' if task_type == 'send_bulk' else task_type)
+            count += 1
+        if count:
+            logging.info(f"从任务日志恢复 {count} 个未完成的任务")
+        return count
+
+    def _restore_bulk_job(self, task: dict):
+        """恢复批量任务的进度记录，只统计日志中未完成的条目（已完成的条目在重启前已经报告过）"""
+        key = (task['client_id'], task['job_id'])
+        job = self.bulk_jobs.get(key)
+        if job is None:
+            job = self.bulk_jobs[key] = BulkJob(job_id=task['job_id'], client_id=task['client_id'],
+                                                           total=0)
+        job.total += len(task['items'])
+
+    @staticmethod
+    def _task_receivers(task: dict) -> List[str]:
+        """任务涉及的联系人"""
+        if task['type'] == 'send_text':
+            return [task['msg'].receiver]
+        if task['type'] == 'send_favorite':
+            return task['friend_names']
+        if task['type'] == 'send_bulk':
+            return [task['receiver']]
+        return [task['chat_name']] if 'chat_name' in task else []
+
+    async def _process_bulk_task(self, task: dict):
+        """发送批量任务中同一接收者的一组消息，并报告每条消息的结果"""
+        job = self.bulk_jobs.get((task.get('client_id'), task['job_id']))
+        msgs = [WsSendMsg(receiver=task['receiver'], content=content) for _, content in task['items']]
+        started = time.monotonic()
+        wait_ms = (started - job.accepted_at) * 1000 if job is not None else None
+        results = await self.async_send_messages(msgs)
+        send_ms = (time.monotonic() - started) * 1000
+        self._complete_task(task, all(results), f"{results.count(False)}条发送失败")
+        for (index, _), msg, success in zip(task['items'], msgs, results):
+            if success:
+                self._record_sent(msg)
+            self.bulk_progress(task['job_id'], task.get('client_id'), 'sent' if success else 'failed',
+                                index=index, receiver=msg.receiver, wait_ms=wait_ms, send_ms=send_ms)
+
+    def bulk_progress(self, job_id: str, client_id: Optional[str], status: str, **fields):
+        """
+        记录批量任务的进度并通知客户端
+        status: queued / sent / failed，全部条目结束后再发送 done
+        """
+        job = self.bulk_jobs.get((client_id, job_id))
+        if job is not None:
+            if status == 'sent':
+                job.sent += 1
+            elif status == 'failed':
+                job.failed += 1
+            fields['elapsed_ms'] = job.elapsed_ms()
+        if client_id is not None:
+            self.reply_queue.put_nowait((client_id, {'type': 'bulk_progress', 'job_id': job_id,
+                                                     'status': status, **fields}))
+        if job is not None and status != 'queued' and job.done:
+            del self.bulk_jobs[(client_id, job_id)]
+            logging.info(f"批量发送 {job_id} 完成: 成功{job.sent}条，失败{job.failed}条")
+            if client_id is not None:
+                self.reply_queue.put_nowait((client_id, {
+                    'type': 'bulk_progress', 'job_id': job_id, 'status': 'done',
+                    'sent': job.sent, 'failed': job.failed, 'elapsed_ms': job.elapsed_ms()}))
+
+    def _take_pending_sends(self, receiver: str) -> List[dict]:
+        """
+        从任务队列中取出发给同一接收者的待发文本任务，其余任务保持不动
+        遇到发给该接收者的其他类型任务时停止合并，保证同一接收者的消息顺序
+        """
+        def match(task):
+            if receiver not in self._task_receivers(task):
+                return False
+            return True if task['type'] == 'send_text' else None
+
+        taken = self.task_queue.take_matching(match, self.max_send_batch - 1)
+        if taken:
+            logging.info(f"合并发送给 {receiver} 的 {len(taken) + 1} 条消息")
+        return taken
     async def find_favorite_and_send_to_friend(self, favorite_name, friend_name):
         """查找收藏项并直接发送给朋友"""
+        return await self.ui_worker.run(self._find_favorite_and_send_to_friend, favorite_name, friend_name)
+
+    def _find_favorite_and_send_to_friend(self, favorite_name, friend_name) -> bool:
+        return self._forward_favorite(favorite_name, [friend_name])[friend_name]
+
+    async def forward_favorite(self, favorite_name: str, friend_names: List[str]) -> Dict[str, bool]:
+        """在一个转发对话框中把收藏项发送给多个朋友，返回每个接收者是否成功"""
+        return await self.ui_worker.run(self._forward_favorite, favorite_name, friend_names)
+
+    def _forward_favorite(self, favorite_name: str, friend_names: List[str]) -> Dict[str, bool]:
+        results = {name: False for name in friend_names}
         try:
-            logging.info(f"开始查找收藏项并发送给朋友: {favorite_name} -> {friend_name}")
+            logging.info(f"开始查找收藏项并发送给朋友: {favorite_name} -> {', '.join(friend_names)}")
             # 先点击收藏按钮打开收藏列表
-            if not await self.click_button("Favorites"):
+            if not self._click_button("Favorites"):
                 logging.error("无法点击收藏按钮")
-                return False
-            
-            time.sleep(1)  # 等待收藏列表加载
+                return results
             
-            # 定义递归向上查找All Favorites列表的函数
-            def find_all_favorites_in_ancestors(control, depth=6):
-                try:
-                    # 先检查当前控件是否是All Favorites列表
-                    if (control.ControlType == auto.ControlType.ListControl and 
-                        control.Name == 'All Favorites' and control.Exists()):
-                        logging.info(f"找到All Favorites列表")
-                        return control
-                    
-                    # 搜索当前控件的子控件
-                    for child in control.GetChildren():
-                        list_control = find_all_favorites_in_ancestors(child, 0)
-                        if list_control:
-                            return list_control
-                    
-                    # 如果当前深度允许，向上递归查找
-                    if depth > 0:
-                        parent = control.GetParentControl()
-                        if parent:
-                            return find_all_favorites_in_ancestors(parent, depth - 1)
-                            
-                except Exception as e:
-                    logging.error(f"在递归查找All Favorites时出错: {str(e)}")
-                return None
-            
-            # 查找收藏列表
-            favorites_list = find_all_favorites_in_ancestors(self.wx_window)
+            # 查找收藏列表（click_button 已等待列表加载）
+            favorites_list = self._favorites_list()
             favorite_item = None
             
-            if favorites_list and favorites_list.Exists():
+            if favorites_list is not None:
                 logging.info(f"找到All Favorites列表，开始查找收藏项: {favorite_name}")
-                
-                # 查找特定收藏项目
-                list_items = favorites_list.GetChildren()
-                logging.info(f"收藏列表中有{len(list_items)}个项目")
-                
-                for item in list_items:
-                    try:
-                        item_name = item.Name if hasattr(item, 'Name') else '无名称'
-                        
-                        if item.ControlType == auto.ControlType.ListItemControl and favorite_name in item_name:
-                            logging.info(f"找到匹配的收藏项: {item_name}")
-                            favorite_item = item
-                            break
-                    except Exception as e:
-                        logging.error(f"检查列表项时出错: {str(e)}")
+                favorite_item = self._find_favorite_item(favorites_list, favorite_name)
             
             # 如果找到了收藏项，直接右键点击
             if favorite_item and favorite_item.Exists():
@@ -290,20 +865,20 @@ class WeChatRPA:
                 center_x = (rect.left + rect.right) // 2
                 center_y = (rect.top + rect.bottom) // 2
                 
-                # 移动到项目位置并右键点击
+                # 移动到项目位置并右键点击，等待右键菜单弹出后点击其中的转发
                 self.human_move_to(center_x, center_y)
-                time.sleep(0.3)
-                pyautogui.rightClick()
-                time.sleep(0.5)
+                self.ui.right_click()
+                forward_item = self._wait_for('context_menu', self._forward_menu_item, timeout=2.0)
+                if forward_item is None:
+                    logging.error("右键菜单中未找到转发")
+                    return results
                 logging.info(f"已右键点击收藏项: {favorite_item.Name}")
 
-                #向右和向下移动一点，然后左键点击
-                pyautogui.move(10, 10)
-                time.sleep(0.3)
-                pyautogui.click()
-                time.sleep(0.5)
+                forward_item.Click()
+                if not self._wait_for('forward_dialog', self._forward_dialog_open):
+                    logging.error("转发对话框未打开")
+                    return results
                 logging.info(f"已左键点击转发")
-                time.sleep(0.2)
 
                 
                 # 点击搜索框
@@ -312,214 +887,313 @@ class WeChatRPA:
                     logging.warning("未找到标准搜索框，尝试找到备选搜索框...")
                     # 尝试其他可能的搜索框属性
                     search_box = self.wx_window.EditControl(searchDepth=3)
-                if search_box.Exists():
-                    search_box.Click()
-                    # time.sleep(0.5)
-                    # 清空搜索框
-                    search_box.SendKeys('{Ctrl}a')
-                    # time.sleep(0.2)
-                    search_box.SendKeys('{Delete}')
-                    # time.sleep(0.2)
-
-                    # 输入联系人名称 - 使用SendKeys代替SetValue
-                    search_box.SendKeys(friend_name)
-                    # time.sleep(0.2)  # 增加等待时间
-                    # 判断是否找到联系人
-                    if search_box.Exists():
+                if not search_box.Exists():
+                    logging.error("未找到转发对话框的搜索框")
+                    self._cancel_forward_dialog()
+                    return results
+
+                # 依次搜索并勾选每个接收者
+                selected = []
+                for friend_name in friend_names[:self.max_forward_recipients]:
+                    if self._select_forward_recipient(search_box, friend_name):
                         logging.info(f"成功找到联系人: {friend_name}")
-                        search_box.SendKeys('{Enter}')
-                        time.sleep(1.5)  # 等待搜索结果
-
-                        logging.info("开始查找Send按钮")
-                        send_button = self.wx_window.ButtonControl(Name="Send", searchDepth=6)
-                        if not send_button.Exists():
-                            send_button = self.wx_window.ButtonControl(Name="发送", searchDepth=6)
-                        if send_button and send_button.Exists():
-                            logging.info("直接查找找到Send按钮")
-                            send_button.Click()
-                            time.sleep(0.5)
-                            return True
-                        else:
-                            logging.error("未找到Send按钮")
-                            return False
+                        selected.append(friend_name)
                     else:
                         logging.error(f"未找到联系人: {friend_name}")
-                        return False
+                if not selected:
+                    self._cancel_forward_dialog()
+                    return results
+
+                logging.info("开始查找Send按钮")
+                # 选中联系人后发送按钮才可用
+                send_button = self._wait_for('forward_ready', self._forward_send_button)
+                if send_button is not None:
+                    logging.info("直接查找找到Send按钮")
+                    send_button.Click()
+                    self._wait_for('forward_send', lambda: not self._forward_dialog_open())
+                    for friend_name in selected:
+                        results[friend_name] = True
+                else:
+                    logging.error("未找到Send按钮")
+                    self._cancel_forward_dialog()
+                return results
                 
             else:
                 logging.error(f"未找到收藏项: {favorite_name}")
-                return False
+                return results
         except Exception as e:
             import traceback
             logging.error(f"查找收藏项并发送给好友时出错: {str(e)}")
             logging.error(f"详细错误信息: {traceback.format_exc()}")
-            return False
+            return results
         finally:
             # 点击主页按钮，返回主页面
-            await self.click_button("Chats")
+            self._click_button("Chats")
+
+    def _select_forward_recipient(self, search_box, friend_name: str) -> bool:
+        """在转发对话框中搜索并勾选一个联系人，确认勾选后返回True"""
+        search_box.Click()
+        # 清空搜索框
+        search_box.SendKeys('{Ctrl}a')
+        search_box.SendKeys('{Delete}')
+        # 输入联系人名称 - 使用SendKeys代替SetValue
+        search_box.SendKeys(friend_name)
+        self._wait_for('forward_search', lambda: search_box.GetValuePattern().Value == friend_name)
+        search_box.SendKeys('{Enter}')
+
+        def selected() -> bool:
+            # “已选择”列表还没有在真实微信的转发对话框上核对过，对话框里没有该列表时
+            # 退回到原来的判断：勾选联系人后发送按钮变为可用
+            selected_list = self._forward_selected_list()
+            if selected_list.Exists(0, 0):
+                return selected_list.ListItemControl(Name=friend_name, searchDepth=1).Exists(0, 0)
+            return self._forward_send_button() is not None
+
+        return bool(self._wait_for('forward_select', selected, timeout=2.0))
+
+    def _cancel_forward_dialog(self):
+        """关闭转发对话框，不发送"""
+        cancel_button = self.wx_window.ButtonControl(Name='Cancel', searchDepth=6)
+        if cancel_button.Exists(0, 0):
+            cancel_button.Click()
+            self._wait_for('forward_cancel', lambda: not self._forward_dialog_open())
     
-    async def _sync_send(self, msg: WsSendMsg) -> bool:
+    def _sync_send(self, msg: WsSendMsg) -> bool:
         """实际发送逻辑"""
+        return self._sync_send_batch([msg])[0]
+
+    def _sync_send_batch(self, msgs: List[WsSendMsg]) -> List[bool]:
+        """打开一次聊天窗口，依次发送同一接收者的多条消息"""
+        results = [False] * len(msgs)
         try:
-            if not await self.search_and_open_chat(msg.receiver):
-                return False
-            
-            # 优化输入框查找逻辑
-            edit_box = self.wx_window.EditControl(ControlType=auto.ControlType.EditControl, 
-                                     IsKeyboardFocusable=True,
-                                     searchDepth=10)
+            receiver = msgs[0].receiver
+            if not self._search_and_open_chat(receiver):
+                return results
             
-            if edit_box.Exists():
+            edit_box = self._input_box()
+            if edit_box is None:
+                return results
+            for i, msg in enumerate(msgs):
                 edit_box.SendKeys(msg.content + "{Enter}")
-                logging.info(f"已发送至 {msg.receiver}: {msg.content}")
-                return True
-            return False
+                logging.info(f"已发送至 {receiver}: {msg.content}")
+                results[i] = True
+            return results
         except Exception as e:
             logging.error(f"发送异常: {str(e)}")
-            return False
+            return results
     
+    @staticmethod
+    def _get_item_preview(item, depth=5) -> Optional[str]:
+        """会话项的预览文本：沿最后一个子控件往下读到最深的一项，读取失败时返回None"""
+        try:
+            node = item
+            for _ in range(depth):
+                child = node.GetLastChildControl()
+                if child is None:
+                    break
+                node = child
+                if node.ControlType == ControlType.TextControl:
+                    break
+            return None if node is item else node.Name
+        except Exception as e:
+            logging.debug(f"读取会话项预览出错: {str(e)}")
+            return None
+
+    def _get_item_pane_texts(self, control, depth=5) -> List[str]:
+        """递归收集会话项各面板中的文本，找到打招呼提示后提前返回"""
+        texts = []
+        if depth <= 0:
+            return texts
+        try:
+            for child in control.GetChildren():
+                # 检查子控件的Name属性
+                if child.Name:
+                    texts.append(child.Name)
+                    if self.message_filter.ends_greeting(child.Name):
+                        return texts
+                
+                # 检查子控件是否是TextControl
+                if child.ControlType == ControlType.TextControl:
+                    text = child.GetWindowText()
+                    if text:
+                        texts.append(text)
+                        if self.message_filter.ends_greeting(text):
+                            return texts
+                
+                # 如果子控件是PaneControl，递归搜索其下的TextControl
+                if child.ControlType == ControlType.PaneControl:
+                    pane_texts = self._get_item_pane_texts(child, depth - 1)
+                    if pane_texts:
+                        texts.extend(pane_texts)
+                        if any(self.message_filter.ends_greeting(text) for text in pane_texts):
+                            return texts
+        except Exception as e:
+            logging.error(f"收集文本时出错: {str(e)}", exc_info=True)
+        return texts
+
     async def get_session_list(self):
-        """获取会话列表和新消息"""
+        """获取会话列表和新消息，并把需要处理的会话加入任务队列"""
+        new_messages, tasks, arrived = await self.ui_worker.run(self._get_session_list)
+        if arrived:
+            self.monitor.record_detection(arrived)
+        # 会话列表中出现的会话（包括群聊）都是有效的接收者
+        self.contacts.update(row.name if row.unread == 0 else self.message_filter.badge(row.name)[0]
+                             for row in self.session_rows.values())
+        # 在任务队列的执行协程中调用，不能等待队列腾出空间；队列已满时跳过，下一次检查会重新发现
+        for task in tasks:
+            try:
+                self.task_queue.put_nowait(task)
+            except asyncio.QueueFull:
+                logging.warning(f"任务队列已满，跳过: {task['type']} {task.get('chat_name')}")
+                if task['type'] == 'new_friend':
+                    # 新好友只在会话项变化时检测，记下来由下一次检查重新入队（不计入尝试次数）
+                    self.pending_welcomes[task['chat_name']] = task['attempt'] - 1
+        return new_messages
+
+    def _get_session_list(self):
+        """
+        扫描会话列表，返回 (新消息数量字典, 待加入队列的任务, 新到达的消息数)
+        每个会话项的快照（名称、未读数、面板文本）在两次检查之间保留，按 (名称, 预览文本) 复用：
+        预览文本沿各级最后一个子控件读取，只需几次UIA调用；名称或预览变化（包括同名会话）的会话项
+        才做深度面板文本遍历，每隔 full_session_scan_interval 次全量遍历一次
+        """
+        tasks = []
+        total_arrived = 0
         try:
-            chat_list = self.wx_window.ListControl(Name='会话')
-            if chat_list.Exists():
+            chat_list = self._session_list()
+            if chat_list is not None:
                 new_messages = {}  # 存储新消息数量的字典
+                unread = {}
+                self.session_scan_count += 1
+                full_scan = self.session_scan_count % self.full_session_scan_interval == 1
+                rows = {}
+                walked = 0
                 
                 for item in chat_list.GetChildren():
-                    if item.ControlType == auto.ControlType.ListItemControl:
-                        chat_name = item.Name
-                        
-                        # 获取当前会话项的所有面板文本
-                        def get_item_pane_texts(control, depth=5):
-                            texts = []
-                            try:
-                                # 如果深度为0，直接返回
-                                if depth <= 0:
-                                    logging.debug(f"达到最大搜索深度: {depth}")
-                                    return texts
-                                
-                                # 记录当前控件的类型和名称
-                                logging.debug(f"当前控件类型: {control.ControlType}, 名称: {control.Name}")
-                                
-                                # 获取当前控件下的所有子控件
-                                text_controls = control.GetChildren()
-                                logging.debug(f"找到 {len(text_controls)} 个子控件")
-                                
-                                for child in text_controls:
-                                    # 记录每个子控件的类型和名称
-                                    logging.debug(f"子控件类型: {child.ControlType}, 名称: {child.Name}")
-                                    
-                                    # 检查子控件的Name属性
-                                    if child.Name:
-                                        texts.append(child.Name)
-                                        logging.debug(f"找到控件Name: {child.Name}")
-                                        if any(f"以上是打招呼的内容" in text for text in texts):
-                                            logging.debug("找到目标文本，提前返回")
-                                            return texts
-                                    
-                                    # 检查子控件是否是TextControl
-                                    if child.ControlType == auto.ControlType.TextControl:
-                                        text = child.GetWindowText()
-                                        if text:
-                                            texts.append(text)
-                                            logging.debug(f"找到TextControl文本: {text}")
-                                            if any(f"以上是打招呼的内容" in text for text in texts):
-                                                logging.debug("找到目标文本，提前返回")
-                                                return texts
-                                        else:
-                                            logging.debug("TextControl没有文本内容")
-                                    
-                                    # 如果子控件是PaneControl，递归搜索其下的TextControl
-                                    if child.ControlType == auto.ControlType.PaneControl:
-                                        logging.debug(f"发现PaneControl，开始递归搜索，当前深度: {depth}")
-                                        pane_texts = get_item_pane_texts(child, depth - 1)
-                                        if pane_texts:
-                                            texts.extend(pane_texts)
-                                            logging.debug(f"从PaneControl中找到文本: {pane_texts}")
-                                            if any(f"以上是打招呼的内容" in text for text in texts):
-                                                logging.debug("找到目标文本，提前返回")
-                                                return texts
-                                        else:
-                                            logging.debug("PaneControl中没有找到文本")
-                                            
-                            except Exception as e:
-                                logging.error(f"收集文本时出错: {str(e)}", exc_info=True)
-                            return texts
-                        
+                    if item.ControlType != ControlType.ListItemControl:
+                        continue
+                    chat_name = item.Name
+                    badge = self.message_filter.badge(chat_name)  # (会话名称, 未读数)
+                    key = (chat_name, self._get_item_preview(item))
+                    previous = self.session_rows.get(key)
+                    if previous is not None and not full_scan:
+                        row = previous
+                    else:
                         # 获取当前会话项的面板文本
-                        item_texts = get_item_pane_texts(item)
-                        logging.debug(f"会话 {chat_name} 的面板文本: {item_texts}")
-                        
-                        # 检查是否是新好友验证消息
-                        expected_text = f"你已添加了{chat_name}，现在可以开始聊天了"
-                        if any(expected_text in text for text in item_texts):
+                        walked += 1
+                        row = SessionRow(
+                            name=chat_name,
+                            unread=badge[1] if badge else 0,
+                            texts=self._get_item_pane_texts(item),
+                            preview=key[1],
+                        )
+                    rows[key] = row
+                    
+                    # 检查是否是新好友验证消息（只在面板文本变化或欢迎消息待重试时检查，避免重复欢迎）
+                    changed = row is not previous and (previous is None or previous.texts != row.texts)
+                    if changed or chat_name in self.pending_welcomes:
+                        if self.message_filter.is_new_friend(chat_name, row.texts):
                             # 不回复名称为空的好友
                             if chat_name.strip() == "":
                                 logging.warning(f"检测到新好友验证消息: {chat_name}，但名称为空，跳过")
                                 continue
                             logging.info(f"检测到新好友验证消息: {chat_name}")
-                            await self.task_queue.put({
+                            tasks.append({
                                 'type': 'new_friend',
-                                'chat_name': chat_name
+                                'chat_name': chat_name,
+                                'attempt': self.pending_welcomes.pop(chat_name, 0) + 1
                             })
                             continue
-                        
-                        # 原有的新消息检测逻辑
-                        import re
-                        match = re.search(r'^(.*?)(\d+)条新消息$', chat_name)
-                        if match:
-                            original_name = match.group(1).strip()
-                            msg_count = int(match.group(2))
-                            new_messages[original_name] = msg_count
-                            logging.info(f"会话: {original_name} 有 {msg_count} 条新消息")
-                            await self.task_queue.put({
-                                'type': 'get_messages',
-                                'chat_name': original_name,
-                                'msg_count': msg_count
-                            })
+                        # 验证提示已不在会话项中（已经聊过或会话被删除），不再重试
+                        self.pending_welcomes.pop(chat_name, None)
+                    
+                    # 原有的新消息检测逻辑
+                    if badge:
+                        original_name, msg_count = badge
+                        new_messages[original_name] = msg_count
+                        unread[original_name] = msg_count
+                        arrived = msg_count - self.session_unread.get(original_name, 0)
+                        if arrived > 0:
+                            total_arrived += arrived
+                        logging.info(f"会话: {original_name} 有 {msg_count} 条新消息")
+                        tasks.append({
+                            'type': 'get_messages',
+                            'chat_name': original_name,
+                            'msg_count': msg_count
+                        })
                 
-                return new_messages
+                self.session_rows = rows
+                self.session_unread = unread
+                logging.debug(f"会话列表共 {len(rows)} 项，深度遍历 {walked} 项")
+                return new_messages, tasks, total_arrived
             else:
                 logging.error("未找到会话列表")
-                return {}
+                return {}, tasks, total_arrived
         except Exception as e:
             logging.error(f"获取会话列表出错: {str(e)}")
-            return {}
+            return {}, tasks, total_arrived
 
     async def click_chat(self, chat_name: str, msg_count: int):
         """点击指定会话并获取消息"""
+        success, messages = await self.ui_worker.run(self._click_chat, chat_name, msg_count)
+        await self._publish_messages(messages)
+        return success
+
+    def _click_chat(self, chat_name: str, msg_count: int):
+        """返回 (是否成功, 新消息列表)"""
         try:
-            chat_list = self.wx_window.ListControl(Name='会话')
-            if chat_list.Exists():
+            chat_list = self._session_list()
+            if chat_list is not None:
                 chat_item = chat_list.ListItemControl(Name=chat_name)
                 if chat_item.Exists():
                     chat_item.Click()
-                    time.sleep(0.5)
-                    await self.get_detailed_messages(chat_name, msg_count)
-                    return True
+                    self._wait_chat_opened(chat_item)
+                    return True, self._get_detailed_messages(chat_name, msg_count)
                 else:
                     for item in chat_list.GetChildren():
-                        if item.ControlType == auto.ControlType.ListItemControl and chat_name in item.Name:
+                        if item.ControlType == ControlType.ListItemControl and chat_name in item.Name:
                             item.Click()
-                            time.sleep(0.5)
-                            await self.get_detailed_messages(chat_name, msg_count)
-                            return True
+                            self._wait_chat_opened(item)
+                            return True, self._get_detailed_messages(chat_name, msg_count)
                     logging.error(f"未找到会话: {chat_name}")
-                    return False
+                    return False, []
             else:
                 logging.error("未找到会话列表")
-                return False
+                return False, []
         except Exception as e:
             logging.error(f"点击会话出错: {str(e)}")
-            return False
+            return False, []
+
+    def _wait_chat_opened(self, chat_item):
+        """打开会话后未读提示会从会话项名称中消失"""
+        self._wait_for('open_session', lambda: not self.message_filter.has_badge(chat_item.Name), timeout=2.0)
 
     async def get_detailed_messages(self, chat_name: str, msg_count: int):
-        """获取详细消息内容"""
+        """获取详细消息内容，新消息加入接收队列"""
+        messages = await self.ui_worker.run(self._get_detailed_messages, chat_name, msg_count)
+        await self._publish_messages(messages)
+        return messages
+
+    async def _publish_messages(self, messages: List[WsRecvMsg]):
+        """新消息写入历史并加入接收队列"""
+        for msg in messages:
+            if self.history is not None:
+                self.history.record(msg.sender, msg.content)
+            await self.recv_queue.put(msg)
+
+    def _record_sent(self, msg: WsSendMsg):
+        """已发送的消息写入历史"""
+        if self.history is not None:
+            self.history.record(msg.receiver, msg.content, SENT)
+
+    def _get_detailed_messages(self, chat_name: str, msg_count: int) -> List[WsRecvMsg]:
+        """读取当前聊天的消息列表，返回未处理过的新消息；有读取游标时只读取游标之后的项"""
+        new_messages = []
         try:
             def find_message_list_in_ancestors(control, depth=3):
                 try:
                     def search_in_children(parent_control):
-                        if (parent_control.ControlType == auto.ControlType.ListControl and 
+                        if (parent_control.ControlType == ControlType.ListControl and 
                             parent_control.Name == '消息' and parent_control.Exists()):
                             return parent_control
                         
@@ -542,42 +1216,59 @@ class WeChatRPA:
                     logging.debug(f"在某一层查找消息列表时出错: {str(e)}")
                 return None
 
-            chat_area = find_message_list_in_ancestors(self.wx_window)
-            if not chat_area or not chat_area.Exists():
+            chat_area = self.locators.get(
+                'message_list', lambda: find_message_list_in_ancestors(self.wx_window))
+            if chat_area is None:
                 logging.error("未找到消息列表")
-                return []
+                return new_messages
+
+            # 有游标时只读取游标之后的新项，游标丢失时全量读取
+            cursor = self.message_cursors.get(chat_name)
+            items, found = None, False
+            if cursor is not None and self.max_tail_items > 0:
+                items, found = read_tail(chat_area, cursor, self.max_tail_items, self.message_filter.classify)
+                if items is None:
+                    logging.info(f"会话 {chat_name} 的读取游标已失效，全量读取消息列表")
+            if items is None:
+                items = [(item.Name, item) for item in chat_area.GetChildren()
+                         if item.ControlType == ControlType.ListItemControl]
+            if found:
+                time_marker = cursor.time_marker  # 游标位置的时间分隔文本
+                occurrences = dict(cursor.occurrences)  # 同一时间分隔下相同内容的出现次数
+            else:
+                cursor, time_marker, occurrences = None, '', {}
 
-            valid_messages = []  # 存储有效的消息
+            valid_messages = []  # 存储有效的消息及其去重键
             
             # 先收集所有有效消息
-            for item in chat_area.GetChildren():
-                if item.ControlType == auto.ControlType.ListItemControl:
-                    content = item.Name
-
-                    if any(x in content.lower() for x in ['am', 'pm', 'yesterday', ':', '上午', '下午']):
-                        continue
-                    
-                    if any(x in content for x in ['[Location]', 'Voice Call', '[图片]', '[表情]', '[文件]']):
-                        continue
-                    
-                    if content.strip():
-                        valid_messages.append(content)
+            for content, _ in items:
+                kind = self.message_filter.classify(content)
+                if kind == TIME:
+                    time_marker = content
+                    occurrences.clear()
+                elif kind == MESSAGE:
+                    occurrence = occurrences.get(content, 0)
+                    occurrences[content] = occurrence + 1
+                    key = MessageDedup.make_key(chat_name, content, time_marker, occurrence)
+                    valid_messages.append((content, key))
+            next_cursor = advance(items, cursor, time_marker, occurrences)
+            if next_cursor is not None:
+                self.message_cursors[chat_name] = next_cursor
             
             # 只处理最新的msg_count条消息
-            for content in valid_messages[-msg_count:]:
-                message_id = f"{chat_name}_{content}"
-                if message_id not in self.processed_messages:  # 使用类级别的集合
-                    self.processed_messages.add(message_id)  # 添加到类级别的集合
-                    await self.recv_queue.put(WsRecvMsg(
+            for content, key in valid_messages[-msg_count:]:
+                if self.dedup.add(key):
+                    new_messages.append(WsRecvMsg(
                         sender=chat_name,
                         content=content
                     ))
-                    logging.debug(f"新消息已加入队列: {chat_name} -> {content}")  # 添加调试日志
+                    logging.debug(f"新消息: {chat_name} -> {content}")
+            self.dedup.maybe_snapshot()
 
-            return []
+            return new_messages
         except Exception as e:
             logging.error(f"获取详细消息出错: {str(e)}")
-            return []
+            return new_messages
 
     async def _monitor_messages(self):
         """监控新消息的内部方法"""
@@ -586,12 +1277,14 @@ class WeChatRPA:
         except Exception as e:
             logging.error(f"监控消息出错: {str(e)}")
     async def message_monitor(self):
-        """持续监控新消息"""
+        """持续监控新消息，检查间隔由 MonitorScheduler 自适应调整"""
         while True:
-            await self.task_queue.put({
-                'type': 'monitor'
-            })
-            await asyncio.sleep(5)  # 每2秒检查一次
+            # 上一个monitor任务还没执行时不再重复添加
+            if self.monitor.try_schedule():
+                await self.task_queue.put({
+                    'type': 'monitor'
+                })
+            await self.monitor.wait()
 
 class WsServer:
     def __init__(self, rpa: WeChatRPA):
@@ -601,42 +1294,264 @@ class WsServer:
         
         @self.app.websocket("/ws/{client_id}")
         async def websocket_endpoint(websocket: WebSocket, client_id: str):
-            await self.manager.connect(websocket, client_id)
+            # 订阅在连接时通过查询参数声明，如 ?senders=张三&keywords=订单
+            await self.manager.connect(websocket, client_id, Subscription.from_query(websocket.query_params))
             try:
                 while True:
                     data = await websocket.receive_text()
-                    await self.handle_message(data)
+                    await self.handle_message(data, client_id)
             except WebSocketDisconnect:
-                self.manager.disconnect(client_id)
+                pass
+            except RuntimeError:
+                # 服务端主动关闭（慢客户端被驱逐、被同 client_id 的新连接替换）后再读取会抛 RuntimeError
+                if websocket.application_state != WebSocketState.DISCONNECTED:
+                    raise
+            finally:
+                self.manager.disconnect(client_id, websocket)
+                self.rpa.admission.forget(client_id)
+
+        @self.app.get("/history")
+        async def history_endpoint(contact: Optional[str] = None, start: Optional[float] = None,
+                                   end: Optional[float] = None, limit: int = 50, cursor: Optional[str] = None):
+            """按联系人和时间范围分页查询消息历史，从新到旧，用返回的 next_cursor 取下一页"""
+            if self.rpa.history is None:
+                raise fastapi.HTTPException(status_code=404, detail="未启用消息历史")
+            try:
+                messages, next_cursor = await self.rpa.history.query(
+                    contact, start, end, max(1, min(limit, 500)), cursor)
+            except ValueError as e:
+                raise fastapi.HTTPException(status_code=400, detail=f"无效的游标: {str(e)}")
+            return {"messages": messages, "next_cursor": next_cursor}
+
+        @self.app.get("/metrics")
+        async def metrics_endpoint():
+            """Prometheus 文本格式的运行指标"""
+            return PlainTextResponse(self.render_metrics(), media_type="text/plain; version=0.0.4")
+
+        @self.app.get("/clients")
+        async def clients_endpoint():
+            """各客户端发送队列的深度、丢弃条数和发送延迟"""
+            return self.manager.client_stats()
     
-    async def handle_message(self, data: str):
-        """处理接收到的消息"""
+    def render_metrics(self) -> str:
+        """队列深度、各类任务耗时、消息检测延迟和UIA基础调用统计"""
+        rpa = self.rpa
+        writer = MetricsWriter()
+        queues = {'send': rpa.send_queue.qsize(), 'task': rpa.task_queue.qsize(),
+                  'recv': rpa.recv_queue.qsize(), 'reply': rpa.reply_queue.qsize()}
+        for queue, depth in queues.items():
+            writer.gauge('queue_depth', '队列中等待的条目数', depth, {'queue': queue})
+        for cls, stats in rpa.task_queue.stats().items():
+            writer.gauge('task_queue_pending', '任务队列中各优先级类别的待执行任务数', stats['pending'], {'class': cls})
+            writer.counter('tasks_expired_total', '超过截止时间被丢弃的任务数', stats['expired'], {'class': cls})
+        for task_type, histogram in sorted(rpa.task_latency.items()):
+            writer.histogram('task_duration_seconds', '各类任务的执行耗时（秒）', histogram, {'type': task_type})
+        writer.histogram('detection_lag_seconds', '消息从到达到被检测到的延迟（秒）', rpa.monitor.detection_histogram)
+        writer.counter('monitor_scans_total', '会话列表检查次数', rpa.monitor.scans)
+        writer.gauge('monitor_interval_seconds', '当前的检查间隔（秒）', rpa.monitor.interval)
+        # UI工作线程在渲染期间仍在写入，从副本渲染
+        uia_calls, uia_seconds = rpa.uia_stats.snapshot()
+        for primitive in sorted(uia_calls):
+            labels = {'primitive': primitive}
+            writer.counter('uia_calls_total', 'UIA基础调用次数', uia_calls[primitive], labels)
+            writer.counter('uia_call_seconds_total', 'UIA基础调用累计耗时（秒）', uia_seconds.get(primitive, 0.0), labels)
+        for task_type, units in sorted(rpa.admission.in_flight.items()):
+            writer.gauge('admission_in_flight', '已接受、尚未执行完的工作量', units, {'type': task_type})
+        for reason, count in sorted(rpa.admission.rejected.items()):
+            writer.counter('admission_rejected_total', '被准入控制拒绝的请求数', count, {'reason': reason})
+        writer.gauge('connected_clients', '已连接的客户端数', len(self.manager.active_connections))
+        for client_id, stats in sorted(self.manager.client_stats().items()):
+            writer.gauge('client_outbound_pending', '客户端发送队列中等待的消息数', stats['pending'], {'client': client_id})
+            writer.counter('client_outbound_dropped_total', '客户端发送队列丢弃的消息数', stats['dropped'],
+                           {'client': client_id})
+        return writer.text()
+
+    async def handle_message(self, data: str, client_id: Optional[str] = None):
+        """处理接收到的消息，接收者未知时拒绝并通知发送请求的客户端"""
+        msg_data = None
         try:
             msg_data = json.loads(data)
+            # 可选的超时时间（秒），超时仍未执行的任务会被丢弃
+            timeout = msg_data.get("timeout")
+            deadline = time.monotonic() + float(timeout) if timeout else None
+            # 可选的任务ID，生命周期事件带上它，不指定时自动生成
+            task_id = str(msg_data.get("task_id") or uuid.uuid4().hex[:12])
+            # 可选的模糊匹配：接收者名称与唯一的联系人相近时按该联系人发送，默认只在拒绝时给出建议
+            fuzzy = bool(msg_data.get("fuzzy"))
             if msg_data.get("type") == "send_text":
+                # 所有字段在准入之前校验，准入后不能再因为请求格式错误而失败（否则在途工作量不会释放）
+                requested = self._require_str(msg_data, "receiver")
+                content = self._require_str(msg_data, "content")
+                receiver = await self.rpa.resolve_receiver(requested, fuzzy)
+                if receiver is None:
+                    self.reject_unknown_receiver(requested, client_id, task_id)
+                    return
+                if not await self.admit(client_id, task_id, "send_text", 1, timeout, receiver=receiver):
+                    return
                 msg = WsSendMsg(
-                    receiver=msg_data["receiver"],
-                    content=msg_data["content"]
+                    receiver=receiver,
+                    content=content,
+                    deadline=deadline,
+                    client_id=client_id,
+                    task_id=task_id
                 )
                 await self.rpa.send_queue.put(msg)
             elif msg_data.get("type") == "send_favorite":
+                # friend_names 为接收者列表，兼容只有一个接收者的 friend_name
+                favorite_name = self._require_str(msg_data, "favorite_name")
+                if msg_data.get("friend_names"):
+                    requested = msg_data["friend_names"]
+                    if not isinstance(requested, list) or not all(isinstance(n, str) and n for n in requested):
+                        raise ValueError("friend_names 必须是非空字符串列表")
+                else:
+                    requested = [self._require_str(msg_data, "friend_name")]
+                friend_names = []
+                unknown = []
+                for name in requested:
+                    friend_name = await self.rpa.resolve_receiver(name, fuzzy)
+                    if friend_name is None:
+                        unknown.append(name)
+                    elif friend_name not in friend_names:
+                        friend_names.append(friend_name)
+                if unknown:
+                    # 任一接收者无法解析时整个请求不入队，同一 task_id 不会既有错误又有成功
+                    for name in unknown:
+                        self.reject_unknown_receiver(name, client_id, task_id)
+                    return
+                # 每个转发对话框计为一个单位
+                dialogs = -(-len(friend_names) // self.rpa.max_forward_recipients)
+                if not await self.admit(client_id, task_id, "send_favorite", dialogs, timeout,
+                                        favorite_name=favorite_name):
+                    return
                 msg = WsFavoriteMsg(
-                    favorite_name=msg_data["favorite_name"],
-                    friend_name=msg_data["friend_name"]
+                    favorite_name=favorite_name,
+                    friend_names=friend_names,
+                    deadline=deadline,
+                    client_id=client_id,
+                    task_id=task_id
                 )
                 await self.rpa.send_queue.put(msg)
+            elif msg_data.get("type") == "send_text_bulk":
+                await self.submit_bulk(msg_data, client_id, deadline)
             else:
                 logging.error(f"ws接受到未知消息类型: {msg_data.get('type')}")
+        except ValueError as e:
+            # 请求格式错误（JSON、字段缺失或类型不对）
+            logging.error(f"请求格式错误: {str(e)}")
+            if client_id is not None:
+                reply = {"type": "error", "error": "invalid_request", "detail": str(e)}
+                if isinstance(msg_data, dict):
+                    # 只回传客户端自己指定的ID，自动生成的ID客户端无从对应
+                    for field in ("task_id", "job_id"):
+                        if msg_data.get(field):
+                            reply[field] = str(msg_data[field])
+                # 与生命周期事件走同一个队列，保证回复顺序与提交顺序一致
+                self.rpa.reply_queue.put_nowait((client_id, reply))
         except Exception as e:
             logging.error(f"消息处理错误: {str(e)}")
+
+    @staticmethod
+    def _require_str(msg_data: dict, field: str) -> str:
+        """请求中必填的非空字符串字段，缺失或类型不对时抛出 ValueError"""
+        value = msg_data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"{field} 必须是非空字符串")
+        return value
     
+    async def submit_bulk(self, msg_data: dict, client_id: Optional[str], deadline: Optional[float]):
+        """渲染模板、解析接收者后提交批量发送，无法发送的条目立即报告失败"""
+        job_id = str(msg_data.get("job_id") or uuid.uuid4().hex[:12])
+        template = self._require_str(msg_data, "template")
+        if not isinstance(msg_data.get("receivers"), list) or not msg_data["receivers"]:
+            raise ValueError("receivers 必须是非空列表")
+        if (client_id, job_id) in self.rpa.bulk_jobs:
+            logging.error(f"批量发送任务ID重复: {job_id}")
+            if client_id is not None:
+                self.rpa.reply_queue.put_nowait((client_id, {"type": "error", "error": "duplicate_job", "job_id": job_id}))
+            return
+        # 先渲染再登记任务，请求格式错误时不会留下永远不会完成的任务
+        items, errors = render_bulk(template, msg_data["receivers"])
+        job = BulkJob(job_id=job_id, client_id=client_id, total=len(msg_data["receivers"]))
+        self.rpa.bulk_jobs[(client_id, job_id)] = job
+        for index, receiver, error in errors:
+            self.rpa.bulk_progress(job_id, client_id, 'failed', index=index, receiver=receiver, error=error)
+        resolved = []
+        for item in items:
+            receiver = await self.rpa.resolve_receiver(item.receiver, bool(msg_data.get("fuzzy")))
+            if receiver is None:
+                self.rpa.bulk_progress(job_id, client_id, 'failed', index=item.index, receiver=item.receiver,
+                                       error="unknown_receiver")
+                continue
+            item.receiver = receiver
+            resolved.append(item)
+        logging.info(f"批量发送 {job_id}: 共{job.total}条，可发送{len(resolved)}条")
+        if resolved:
+            if not await self.admit(client_id, job_id, "send_bulk", len(resolved), msg_data.get("timeout"),
+                                    request="send_text_bulk", job_id=job_id):
+                del self.rpa.bulk_jobs[(client_id, job_id)]
+                return
+            await self.rpa.send_queue.put(WsBulkMsg(job=job, items=resolved, deadline=deadline))
+
+    async def admit(self, client_id: Optional[str], task_id: str, task_type: str, units: int, timeout,
+                    request: Optional[str] = None, **fields) -> bool:
+        """
+        准入检查：接受时发送 accepted 事件，带排队位置和预计完成时间（秒）；拒绝时回复原因和建议的重试时间
+        :param units: 请求的工作量（消息条数或转发对话框次数）
+        """
+        request = request or task_type
+        if (client_id, task_id) in self.rpa.tracker:
+            admission = None
+            reply = {"type": "error", "error": "duplicate_task", "request": request}
+        else:
+            admission = self.rpa.admission.admit(client_id, task_type, units, float(timeout) if timeout else None)
+            if admission.accepted:
+                self.rpa.tracker.accept(task_id, client_id, request, position=admission.position,
+                                        eta=round(admission.eta, 1), **fields)
+                return True
+            reply = {"type": "error", "error": admission.reason, "request": request}
+            if admission.retry_after is not None:
+                reply["retry_after"] = round(admission.retry_after, 1)
+        logging.warning(f"拒绝请求 {request} {task_id} (客户端 {client_id}): {reply['error']}")
+        if client_id is not None:
+            # 与生命周期事件走同一个队列，保证同一客户端收到的回复顺序与提交顺序一致
+            self.rpa.reply_queue.put_nowait((client_id, {**reply, "task_id": task_id, **fields}))
+        return False
+
+    def reject_unknown_receiver(self, name: str, client_id: Optional[str], task_id: Optional[str] = None):
+        """接收者不在联系人目录中，不进入任务队列"""
+        suggestions = self.rpa.contacts.suggestions(name)
+        logging.warning(f"未知的接收者: {name}，相似联系人: {suggestions}")
+        if client_id is not None:
+            # 与生命周期事件走同一个队列，保证回复顺序与提交顺序一致
+            self.rpa.reply_queue.put_nowait((client_id, {
+                "type": "error",
+                "error": "unknown_receiver",
+                "task_id": task_id,
+                "receiver": name,
+                "suggestions": suggestions
+            }))
+
+    async def send_replies(self):
+        """把任务结果发送给发起请求的客户端"""
+        while True:
+            client_id, reply = await self.rpa.reply_queue.get()
+            try:
+                await self.manager.send_message(json.dumps(reply, ensure_ascii=False), client_id)
+            except Exception as e:
+                logging.error(f"回复客户端出错: {str(e)}")
+            finally:
+                self.rpa.reply_queue.task_done()
+
     async def broadcast_messages(self):
         """持续广播接收到的消息"""
         while True:
-            if not self.rpa.recv_queue.empty():
-                msg = await self.rpa.recv_queue.get()
+            msg = await self.rpa.recv_queue.get()
+            try:
                 await self.manager.broadcast(msg)
-            await asyncio.sleep(0.1)
+            except Exception as e:
+                logging.error(f"广播消息出错: {str(e)}")
+            finally:
+                self.rpa.recv_queue.task_done()
 
     async def start_server(self):
         """启动FastAPI服务器"""
@@ -651,38 +1566,98 @@ class WsServer:
         await server.serve()
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, max_pending: int = 1000, overflow: str = DROP_OLDEST):
+        """
+        :param max_pending: 每个客户端发送队列的容量
+        :param overflow: 发送队列满时的策略，drop_oldest 丢弃最旧的消息，disconnect 断开客户端
+        """
         self.active_connections: Dict[str, WebSocket] = {}
+        self.outboxes: Dict[str, ClientOutbox] = {}
+        self.subscriptions = SubscriptionIndex()
         self.message_queue: asyncio.Queue = asyncio.Queue()
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self._closing = set()  # 正在关闭的被断开连接
     
-    async def connect(self, websocket: WebSocket, client_id: str):
+    async def connect(self, websocket: WebSocket, client_id: str, subscription: Optional[Subscription] = None):
         await websocket.accept()
+        self.register(websocket, client_id, subscription)
+        logging.info(f"Client {client_id} connected, subscription: {subscription}")
+    
+    def register(self, websocket: WebSocket, client_id: str, subscription: Optional[Subscription] = None):
+        """登记已接受的连接并启动它的写任务，同一 client_id 重新连接时替换并关闭旧连接"""
+        self.disconnect(client_id, close_code=CLOSE_NORMAL)
+        outbox = ClientOutbox(client_id, websocket, self.max_pending, self.overflow,
+                              on_error=lambda _: self.disconnect(client_id, websocket, CLOSE_TRY_AGAIN_LATER))
+        outbox.start()
         self.active_connections[client_id] = websocket
-        logging.info(f"Client {client_id} connected")
+        self.outboxes[client_id] = outbox
+        self.subscriptions.add(client_id, subscription or Subscription())
     
-    def disconnect(self, client_id: str):
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None, close_code: Optional[int] = None):
+        """
+        :param websocket: 指定时只在它仍是该 client_id 的当前连接时断开（避免旧连接断开时移除重连后的新连接）
+        :param close_code: 服务端主动断开（发送队列溢出、写入出错、被新连接替换）时用该关闭码关闭连接；
+                           客户端已经断开时为None
+        """
+        if websocket is not None and self.active_connections.get(client_id) is not websocket:
+            return
         if client_id in self.active_connections:
-            del self.active_connections[client_id]
+            websocket = self.active_connections.pop(client_id)
+            self.outboxes.pop(client_id).close()
+            self.subscriptions.remove(client_id)
             logging.info(f"Client {client_id} disconnected")
+            if close_code is not None:
+                task = asyncio.get_running_loop().create_task(self._close(client_id, websocket, close_code))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(client_id: str, websocket: WebSocket, code: int):
+        try:
+            await websocket.close(code=code)
+        except Exception as e:
+            logging.error(f"Error closing connection to {client_id}: {str(e)}")
+    
+    def enqueue(self, message: str, client_id: str) -> bool:
+        """放入客户端的发送队列，不等待发送；按溢出策略需要断开时断开客户端"""
+        outbox = self.outboxes.get(client_id)
+        if outbox is None:
+            return False
+        if not outbox.put(message):
+            logging.warning(f"Client {client_id} outbound queue full ({outbox.max_pending}), disconnecting")
+            self.disconnect(client_id, close_code=CLOSE_TRY_AGAIN_LATER)
+            return False
+        return True
     
     async def send_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
-            logging.info(f"Sent message to {client_id}: {message}")
+        if self.enqueue(message, client_id):
+            # 每条回复和广播都经过这里，完整内容只在调试级别输出
+            logging.debug(f"Sent message to {client_id}: {message}")
+    
+    async def flush(self):
+        """等待所有客户端的发送队列发送完"""
+        await asyncio.gather(*(outbox.drain() for outbox in list(self.outboxes.values())))
+    
+    def client_stats(self) -> Dict[str, Dict[str, float]]:
+        """每个客户端的排队深度、已发送/丢弃条数和发送延迟"""
+        return {client_id: outbox.stats() for client_id, outbox in self.outboxes.items()}
     
     async def broadcast(self, recv_msg: WsRecvMsg):
-        for client_id, connection in self.active_connections.items():
-            try:
-                msg_json = json.dumps({
-                    "type": "receive",
-                    "sender": recv_msg.sender,
-                    "content": recv_msg.content
-                })
-                logging.info(f"Broadcasted message to {client_id}: {recv_msg.sender} -> {recv_msg.content}")
-                await connection.send_text(msg_json)
-            except Exception as e:
-                logging.error(f"Error broadcasting to {client_id}: {str(e)}")
-                self.disconnect(client_id)
+        # 只发给订阅了这条消息的客户端；会话列表中拿不到群成员名称，会话即发送者
+        client_ids = self.subscriptions.match("receive", recv_msg.sender, recv_msg.sender, recv_msg.content)
+        if not client_ids:
+            return
+        # 每条消息只序列化一次
+        msg_json = json.dumps({
+            "type": "receive",
+            "sender": recv_msg.sender,
+            "content": recv_msg.content
+        })
+        # 只入队，由各客户端的写任务发送，慢客户端不会拖慢其他客户端
+        for client_id in client_ids:
+            self.enqueue(msg_json, client_id)
+        logging.info(f"Broadcasted message from {recv_msg.sender} to {len(client_ids)} clients")
     
     async def process_messages(self):
         while True:
@@ -697,22 +1672,35 @@ class ConnectionManager:
                 logging.error(f"Error processing message: {str(e)}")
 async def main():
     # 初始化RPA
-    wechat_rpa = WeChatRPA()
+    wechat_rpa = WeChatRPA(dedup=MessageDedup(snapshot_path='dedup.snapshot'),
+                           journal=TaskJournal('tasks.db'), history=MessageHistory('history.db'),
+                           message_filter=MessageFilter(rules_path='message_rules.json'))
     if not await wechat_rpa.find_wechat_window():
         logging.error("微信窗口初始化失败")
+        wechat_rpa.journal.close()
+        wechat_rpa.history.close()
         return
+    # 设置环境变量 WECHAT_RPA_TRACE=目录 开启任务追踪，WECHAT_RPA_TRACE_SAMPLE 为追踪的任务比例(0~1)
+    trace_dir = os.environ.get('WECHAT_RPA_TRACE')
+    if trace_dir:
+        wechat_rpa.enable_tracing(Tracer(trace_dir, sample_rate=float(os.environ.get('WECHAT_RPA_TRACE_SAMPLE', '1'))))
+    # 恢复上次退出时未完成的外发任务
+    wechat_rpa.replay_journal()
     
     # 初始化WebSocket服务
     ws_server = WsServer(wechat_rpa)
 
     # 保证刚开始微信处于主页面
     await wechat_rpa.click_button("Chats")
+    # 读取通讯录，用于在入队前校验接收者
+    await wechat_rpa.refresh_contacts()
     # 创建任务列表
     tasks = [
         asyncio.create_task(wechat_rpa.process_task_queue()),  # 处理任务队列
         asyncio.create_task(wechat_rpa.process_send_queue()),  # 处理发送队列
         asyncio.create_task(wechat_rpa.message_monitor()),     # 监控新消息
         asyncio.create_task(ws_server.broadcast_messages()),    # 广播消息
+        asyncio.create_task(ws_server.send_replies()),          # 回复任务结果
         asyncio.create_task(ws_server.start_server())          # 启动服务器
     ]
     
@@ -723,6 +1711,11 @@ async def main():
         logging.error(f"运行时错误: {str(e)}")
         for task in tasks:
             task.cancel()
+    finally:
+        wechat_rpa.ui_worker.shutdown()
+        wechat_rpa.dedup.save_snapshot()
+        wechat_rpa.journal.close()
+        wechat_rpa.history.close()
 
 if __name__ == "__main__":
     logging.basicConfig(
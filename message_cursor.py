@@ -0,0 +1,125 @@
+"""
+消息列表读取游标
+
+原来每次读取消息都对整个"消息"列表调用 GetChildren() 并逐项过滤，最后只保留最新的 msg_count 条，
+群聊中已加载几百项时，绝大部分UIA调用都花在早已处理过的消息上。
+每个会话保存一个游标：上次读到的最后一项的运行时ID、最后几项名称组成的指纹，以及该位置的
+时间分隔文本和内容出现次数（去重键的上下文）。下次读取时从列表末尾用 GetLastChildControl /
+GetPreviousSiblingControl 往前读，遇到游标位置就停止，只处理之后的新项：
+- 游标有运行时ID时一直往前读到该项，新消息与上次最后几项内容相同也不会误判
+- 运行时ID不可用或没有找到（如重新打开会话后列表项被重建）时按名称指纹匹配，
+  并校验该位置的时间分隔文本和各内容出现次数与游标一致
+- 往前读超过上限仍未找到游标时返回None，由调用方全量读取；读到列表开头仍未找到时返回整个列表
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from message_filter import MESSAGE, TIME
+from ui_backend import ControlType
+
+FINGERPRINT_SIZE = 3  # 指纹包含的最后几项
+
+
+@dataclass
+class MessageCursor:
+    runtime_id: Optional[Tuple[int, ...]]  # 最后一项的运行时ID，取不到时为None
+    fingerprint: Tuple[str, ...]  # 最后几项的名称，最新的在前
+    time_marker: str = ''  # 最后一项所在的时间分隔
+    occurrences: Dict[str, int] = field(default_factory=dict)  # 该时间分隔下各内容已出现的次数
+
+
+def runtime_id(control) -> Optional[Tuple[int, ...]]:
+    try:
+        value = control.GetRuntimeId()
+    except Exception:
+        return None
+    return tuple(value) if value else None
+
+
+def read_tail(message_list, cursor: MessageCursor, max_items: int, classify: Callable[[str], str]):
+    """
+    从列表末尾往前读到游标位置
+    :param max_items: 最多往前读的列表项数
+    :param classify: 消息列表项的分类函数（MessageFilter.classify），用于校验指纹位置的时间分隔和出现次数
+    :return: (items, found)，items 为按列表顺序的 [(名称, 控件)]。
+             found 为True时 items 是游标之后的新项；为False时 items 是整个列表；
+             超过 max_items 仍未找到游标时返回 (None, False)
+    """
+    read: List[Tuple[str, object]] = []  # 最新的在前
+    last_name = cursor.fingerprint[0] if cursor.fingerprint else None
+    candidate = False  # 已经读到与指纹相同的位置
+    reached_start = True
+    item = message_list.GetLastChildControl()
+    while item is not None:
+        if item.ControlType == ControlType.ListItemControl:
+            if len(read) >= max_items:
+                reached_start = False
+                break
+            name = item.Name
+            read.append((name, item))
+            if cursor.runtime_id is not None:
+                # 有运行时ID时一直读到该项为止，只有名称相同时才读取运行时ID
+                if name == last_name and runtime_id(item) == cursor.runtime_id:
+                    return read[-2::-1], True
+            else:
+                if candidate and classify(name) == TIME:
+                    # 指纹位置所在的时间分隔已经读完，可以校验了；不一致时继续往前读
+                    position = _verified_position(read, cursor, classify, False)
+                    if position is not None:
+                        return read[position - 1::-1] if position else [], True
+                candidate = candidate or _fingerprint_at(read, len(read) - len(cursor.fingerprint), cursor)
+        item = item.GetPreviousSiblingControl()
+    # 运行时ID不可用或没有找到，按指纹匹配，并校验该位置的时间分隔和出现次数与游标一致
+    position = _verified_position(read, cursor, classify, reached_start)
+    if position is not None:
+        return read[position - 1::-1] if position else [], True
+    if not reached_start:
+        return None, False
+    return read[::-1], False
+
+
+def _fingerprint_at(read: List[Tuple[str, object]], position: int, cursor: MessageCursor) -> bool:
+    """read 中 position 处开始（往前）的几项名称是否与指纹相同"""
+    size = len(cursor.fingerprint)
+    if not size or position < 0 or position + size > len(read):
+        return False
+    return all(read[position + i][0] == cursor.fingerprint[i] for i in range(size))
+
+
+def _verified_position(read: List[Tuple[str, object]], cursor: MessageCursor,
+                       classify: Callable[[str], str], reached_start: bool) -> Optional[int]:
+    """
+    从最早读到的项往后计算每个位置的时间分隔和出现次数，返回与游标一致且指纹相同的最新位置（read 中的下标）
+    只读到一段时间分隔中间（没有读到分隔项也没有读到列表开头）的位置无法校验
+    """
+    known = reached_start
+    time_marker = ''
+    occurrences: Dict[str, int] = {}
+    result = None
+    for position in range(len(read) - 1, -1, -1):
+        name = read[position][0]
+        kind = classify(name)
+        if kind == TIME:
+            known = True
+            time_marker = name
+            occurrences = {}
+        elif kind == MESSAGE:
+            occurrences[name] = occurrences.get(name, 0) + 1
+        if (known and time_marker == cursor.time_marker and occurrences == cursor.occurrences
+                and _fingerprint_at(read, position, cursor)):
+            result = position
+    return result
+
+
+def advance(items: List[Tuple[str, object]], previous: Optional[MessageCursor],
+            time_marker: str, occurrences: Dict[str, int]) -> Optional[MessageCursor]:
+    """
+    处理完 items 后的新游标
+    :param previous: items 之前的游标，items 是整个列表时为None
+    """
+    if not items:
+        return previous
+    names = tuple(name for name, _ in items[:-FINGERPRINT_SIZE - 1:-1])
+    if previous is not None:
+        names = (names + previous.fingerprint)[:FINGERPRINT_SIZE]
+    return MessageCursor(runtime_id(items[-1][1]), names, time_marker, occurrences)
@@ -0,0 +1,119 @@
+"""
+消息过滤规则
+
+原来 get_detailed_messages 对每一项做两次 any(x in content ...) 关键字扫描，每项都调用 content.lower()，
+而且 ':' 规则会把任何带冒号的正常消息（"地址: xxx"、"12:30见"）当作时间分隔丢掉，
+'am'/'pm' 规则也会丢掉 "I am here" 这样的消息。MessageFilter 把规则编译成预编译的匹配器：
+- 时间分隔的各种格式合成一个整项匹配的正则，系统/媒体消息的关键字和正则合成一个正则，
+  每项最多匹配两次，不再逐个关键字扫描
+- 会话项名称中的 "N条新消息" 未读提示
+- 新好友的 "你已添加了xxx，现在可以开始聊天了" 提示和打招呼内容的结束标记
+规则可以写在JSON文件中（见 DEFAULT_RULES 的字段），文件中没有的字段使用默认值。
+"""
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+TIME = 'time'  # 时间分隔
+SKIP = 'skip'  # 系统/媒体消息，不转发
+MESSAGE = 'message'
+EMPTY = 'empty'
+
+DEFAULT_RULES = {
+    # 时间分隔的格式，整项匹配，不区分大小写
+    'time_patterns': [
+        r'\d{1,2}:\d{2}',
+        r'\d{1,2}:\d{2}\s*[AP]M',
+        r'(?:上午|下午|中午|凌晨|早上|晚上)\s*\d{1,2}:\d{2}',
+        r'(?:Yesterday|昨天|前天)\s*(?:(?:上午|下午|中午|凌晨|早上|晚上)\s*)?\d{1,2}:\d{2}(?:\s*[AP]M)?',
+        r'(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun)[a-z]*\s+\d{1,2}:\d{2}(?:\s*[AP]M)?',
+        r'星期[一二三四五六日天]\s*(?:(?:上午|下午|中午|凌晨|早上|晚上)\s*)?\d{1,2}:\d{2}',
+        r'(?:\d{4}年)?\d{1,2}月\d{1,2}日\s*(?:(?:上午|下午|中午|凌晨|早上|晚上)\s*)?\d{1,2}:\d{2}',
+        r'\d{1,4}[/-]\d{1,2}[/-]\d{1,4}\s+\d{1,2}:\d{2}(?:\s*[AP]M)?',
+    ],
+    # 包含这些文字的消息不转发（位置、通话、图片、表情、文件）
+    'skip_keywords': ['[Location]', 'Voice Call', '[图片]', '[表情]', '[文件]'],
+    # 匹配这些正则的消息不转发
+    'skip_patterns': [],
+    # 会话项名称中的未读提示，第1组为会话名称，第2组为未读数
+    'badge_pattern': r'^(.*?)(\d+)条新消息$',
+    # 添加好友后的系统提示，name 组为好友名称
+    'new_friend_patterns': [r'你已添加了(?P<name>.*?)，现在可以开始聊天了'],
+    # 会话项中打招呼内容的结束标记
+    'greeting_end': '以上是打招呼的内容',
+}
+
+
+class MessageFilter:
+    def __init__(self, rules: Optional[Dict] = None, rules_path: Optional[str] = None):
+        """
+        :param rules: 覆盖默认值的规则
+        :param rules_path: 规则JSON文件，文件不存在时使用默认规则
+        """
+        self.rules_path = rules_path
+        merged = dict(DEFAULT_RULES)
+        if rules_path and os.path.exists(rules_path):
+            try:
+                with open(rules_path, 'r', encoding='utf-8') as f:
+                    merged.update(json.load(f))
+                logging.info(f"已加载消息过滤规则: {rules_path}")
+            except (OSError, ValueError) as e:
+                logging.error(f"读取消息过滤规则出错，使用默认规则: {str(e)}")
+        merged.update(rules or {})
+        try:
+            self._compile(merged)
+        except (re.error, KeyError, TypeError, ValueError) as e:
+            if merged == DEFAULT_RULES:
+                raise
+            logging.error(f"消息过滤规则无效，使用默认规则: {str(e)}")
+            self._compile(dict(DEFAULT_RULES))
+
+    def _compile(self, rules: Dict):
+        # 时间格式整项匹配（不区分大小写），优先于关键字；系统/媒体消息的关键字和正则合成一个正则
+        time_patterns = rules['time_patterns']
+        self._time = (re.compile(r'(?i)\s*(?:' + '|'.join(f'(?:{p})' for p in time_patterns) + r')\s*$')
+                      if time_patterns else None)
+        skip = [re.escape(keyword) for keyword in rules['skip_keywords']] + list(rules['skip_patterns'])
+        self._skip = re.compile('|'.join(f'(?:{p})' for p in skip)) if skip else None
+        self._badge = re.compile(rules['badge_pattern'])
+        if self._badge.groups < 2:
+            raise ValueError(f"badge_pattern 需要两个分组（会话名称、未读数）: {rules['badge_pattern']}")
+        # 每个提示格式都有 name 组，分别编译
+        self._new_friend = [re.compile(p) for p in rules['new_friend_patterns']]
+        for pattern in self._new_friend:
+            if 'name' not in pattern.groupindex:
+                raise ValueError(f"new_friend_patterns 缺少 name 分组: {pattern.pattern}")
+        self.greeting_end: str = rules['greeting_end']
+        self.rules = rules
+
+    def classify(self, content: str) -> str:
+        """消息列表项的类别：time / skip / message / empty"""
+        if self._time is not None and self._time.match(content):
+            return TIME
+        if self._skip is not None and self._skip.search(content):
+            return SKIP
+        return MESSAGE if content.strip() else EMPTY
+
+    def badge(self, name: str) -> Optional[Tuple[str, int]]:
+        """会话项名称中的未读提示，返回 (会话名称, 未读数)，没有时返回None"""
+        match = self._badge.search(name)
+        if match is None:
+            return None
+        return match.group(1).strip(), int(match.group(2))
+
+    def has_badge(self, name: str) -> bool:
+        return self._badge.search(name) is not None
+
+    def is_new_friend(self, chat_name: str, texts: Iterable[str]) -> bool:
+        """会话项文本中是否有添加该好友后的系统提示"""
+        for text in texts:
+            for pattern in self._new_friend:
+                match = pattern.search(text)
+                if match is not None and match.group('name') == chat_name:
+                    return True
+        return False
+
+    def ends_greeting(self, text: str) -> bool:
+        return bool(self.greeting_end) and self.greeting_end in text
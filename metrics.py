@@ -0,0 +1,147 @@
+"""
+运行指标
+
+服务原来只有 logging.info 日志，没有任何可以用来规划容量的数字。这里提供：
+- Histogram: 累计分桶直方图，记录任务耗时、消息检测延迟等
+- PrimitiveStats / instrument: 在控件类上包装UIA基础调用（Exists、GetChildren、SendKeys、Click 等），
+  统计调用次数和耗时。包装在类上只做一次，每次调用只多两次 perf_counter 和一次加锁的两次字典更新
+- MetricsWriter: 输出 Prometheus 文本格式（/metrics），不依赖 prometheus_client
+"""
+import functools
+import math
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 任务执行耗时（秒）
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 消息从到达到被检测到的延迟（秒）
+DETECTION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+# 统计的UIA基础调用
+UIA_PRIMITIVES = ('Exists', 'GetChildren', 'GetFirstChildControl', 'GetLastChildControl', 'GetParentControl',
+                  'GetPreviousSiblingControl', 'SendKeys', 'Click')
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float] = TASK_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)  # 每个桶单独计数，输出时再累加
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """[(上界, 小于等于上界的样本数)]，最后一项为 +Inf"""
+        result, total = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((math.inf, self.count))
+        return result
+
+
+class PrimitiveStats:
+    """UIA基础调用的次数和累计耗时，由UI工作线程写入，其他线程通过 snapshot 读取"""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.seconds: Counter = Counter()
+        self.tracer = None  # 开启任务追踪时同时记录为 span（tracer.Tracer）
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, started: float = 0.0):
+        with self._lock:
+            self.calls[name] += 1
+            self.seconds[name] += seconds
+        if self.tracer is not None:
+            self.tracer.record(name, 'uia', started, seconds)
+
+    def snapshot(self) -> Tuple[Dict[str, int], Dict[str, float]]:
+        """调用次数和累计耗时的副本，遍历时不受UI工作线程写入新调用的影响"""
+        with self._lock:
+            return dict(self.calls), dict(self.seconds)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.seconds.clear()
+
+
+def instrument(cls, names: Iterable[str], stats: PrimitiveStats):
+    """
+    用计时包装替换 cls 上的方法，重复调用时替换为新的 stats（进程内同一个类只对应一个统计）
+    """
+    for name in names:
+        method = getattr(cls, name, None)
+        if method is None:
+            continue
+        method = getattr(method, '__wrapped__', method)
+
+        def wrapper(*args, __method=method, __name=name, **kwargs):
+            started = time.perf_counter()
+            try:
+                return __method(*args, **kwargs)
+            finally:
+                stats.record(__name, time.perf_counter() - started, started)
+
+        setattr(cls, name, functools.wraps(method)(wrapper))
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return ''
+    items = ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return '{' + items + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsWriter:
+    """按 Prometheus 文本格式写入指标，同名指标的样本按首次写入的顺序归为一组输出"""
+
+    def __init__(self, prefix: str = 'wechat_rpa_'):
+        self.prefix = prefix
+        self._families: Dict[str, List[str]] = {}  # 指标名 -> HELP/TYPE 行和样本行
+
+    def _family(self, name: str, kind: str, help_text: str) -> Tuple[str, List[str]]:
+        name = self.prefix + name
+        lines = self._families.get(name)
+        if lines is None:
+            lines = self._families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        return name, lines
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        name, lines = self._family(name, 'gauge', help_text)
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def counter(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        name, lines = self._family(name, 'counter', help_text)
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram,
+                  labels: Optional[Dict[str, str]] = None):
+        name, lines = self._family(name, 'histogram', help_text)
+        labels = labels or {}
+        for bound, count in histogram.cumulative():
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    def text(self) -> str:
+        return ''.join(line + '\n' for lines in self._families.values() for line in lines)
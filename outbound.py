@@ -0,0 +1,115 @@
+"""
+客户端发送队列
+
+原来 broadcast 依次 await 每个连接的 send_text，一个慢客户端或半断开的连接会拖慢所有人，
+而且在遍历 active_connections 时调用 disconnect 修改字典会直接抛出异常。
+每个连接现在有一个有界的发送队列和自己的写任务，广播只是不阻塞的入队：
+- 队列满时按溢出策略处理：drop_oldest 丢弃最旧的一条，disconnect 断开这个客户端
+- 每个客户端记录排队深度、已发送/丢弃条数和从入队到发送完成的延迟
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+DROP_OLDEST = 'drop_oldest'
+DISCONNECT = 'disconnect'
+OVERFLOW_POLICIES = (DROP_OLDEST, DISCONNECT)
+
+
+class ClientOutbox:
+    def __init__(self, client_id: str, websocket, max_pending: int = 1000, overflow: str = DROP_OLDEST,
+                 on_error: Optional[Callable[[str], None]] = None, lag_sample_size: int = 200):
+        """
+        :param max_pending: 队列中最多等待发送的消息数
+        :param overflow: 队列满时的策略，drop_oldest 或 disconnect
+        :param on_error: 发送失败或溢出需要断开时的回调，参数为 client_id
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢出策略: {overflow}")
+        self.client_id = client_id
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.on_error = on_error
+        self._pending: Deque[Tuple[float, str]] = deque()
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._lags: Deque[float] = deque(maxlen=lag_sample_size)
+        self.max_lag = 0.0
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer())
+
+    def put(self, message: str) -> bool:
+        """
+        入队，不等待发送；溢出策略为 disconnect 且队列已满时返回 False
+        """
+        if self.closed:
+            return False
+        if len(self._pending) >= self.max_pending:
+            if self.overflow == DISCONNECT:
+                return False
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append((time.monotonic(), message))
+        self.max_depth = max(self.max_depth, len(self._pending))
+        self._idle.clear()
+        self._ready.set()
+        return True
+
+    async def _writer(self):
+        while not self.closed:
+            if not self._pending:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            enqueued_at, message = self._pending.popleft()
+            try:
+                await self.websocket.send_text(message)
+            except Exception as e:
+                logging.error(f"Error sending to {self.client_id}: {str(e)}")
+                self.close()
+                if self.on_error is not None:
+                    self.on_error(self.client_id)
+                return
+            lag = time.monotonic() - enqueued_at
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.sent += 1
+
+    async def drain(self):
+        """等待队列中的消息全部发送完"""
+        if not self.closed:
+            await self._idle.wait()
+
+    def close(self):
+        """停止写任务，未发送的消息丢弃"""
+        if self.closed:
+            return
+        self.closed = True
+        self.dropped += len(self._pending)
+        self._pending.clear()
+        self._idle.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, float]:
+        lags = list(self._lags)
+        return {
+            'pending': len(self._pending),
+            'max_depth': self.max_depth,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'lag_ms_mean': sum(lags) / len(lags) * 1000 if lags else 0.0,
+            'lag_ms_max': self.max_lag * 1000,
+            'oldest_pending_ms': (time.monotonic() - self._pending[0][0]) * 1000 if self._pending else 0.0,
+        }
@@ -0,0 +1,324 @@
+"""
+任务调度
+
+TaskScheduler: RPA任务队列的优先级调度
+- 按任务类型分级：外发文本 > 收藏转发 > 新好友欢迎 > 读取消息 > 监控 > 批量发送
+  （收藏转发单个任务耗时数秒，单独分级，避免紧急文本消息排在一批转发后面；
+  批量发送一次上千条，是后台类别，只在其他类别都没有任务时执行，积压多少都不影响收发消息的延迟）
+- 类别距上次被调度的时间越长有效优先级越高（老化），低优先级任务不会饿死；
+  老化从该类别上次被调度时重新计算，而不是从队首任务入队时计算，
+  积压很久的低优先级任务每 级别差 x aging 秒最多插队一次，不会连续占用队列；
+  后台类别的老化不超过与上一级的差距，持续满载时只能等待截止时间
+- 任务可带截止时间，过期的任务直接丢弃而不是延迟执行
+- 统计各级别的排队等待时间百分位
+
+MonitorScheduler: 自适应的消息监控调度
+- 同一时间最多只有一个待执行的 monitor 任务，长任务占用队列时不会堆积
+- 检测到新消息或刚发送过消息后立即缩短检查间隔，空闲时按倍数退避
+- 退避上限由延迟目标决定：检查间隔 + 单次检查耗时不超过 latency_target
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import Counter, deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from metrics import DETECTION_BUCKETS, Histogram
+
+
+def percentile(samples, p: float) -> float:
+    """最近秩法百分位数，p取值0~100"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+class MonitorScheduler:
+    def __init__(self, min_interval: float = 1.0, max_interval: float = 10.0,
+                 latency_target: float = 5.0, backoff: float = 1.5, sample_size: int = 1000):
+        """
+        :param min_interval: 有活动时的检查间隔（秒）
+        :param max_interval: 空闲时的最长检查间隔（秒）
+        :param latency_target: 消息从到达到被检测到的目标延迟（秒）
+        :param backoff: 每次空闲检查后间隔的放大倍数
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.interval = min_interval
+        self.pending = False
+        self.scans = 0
+        self.detected = 0  # 累计检测到的新消息数
+        self.scan_duration = 0.0  # 单次检查耗时的指数移动平均
+        self.last_scan_at: Optional[float] = None
+        self.detection_lags: Deque[float] = deque(maxlen=sample_size)
+        self.detection_histogram = Histogram(DETECTION_BUCKETS)  # 全部检测延迟，用于 /metrics
+        self._wakeup = asyncio.Event()
+
+    @property
+    def interval_cap(self) -> float:
+        """当前允许的最长间隔"""
+        return max(self.min_interval, min(self.max_interval, self.latency_target - self.scan_duration))
+
+    def try_schedule(self) -> bool:
+        """没有待执行的 monitor 任务时登记一个并返回True"""
+        if self.pending:
+            return False
+        self.pending = True
+        return True
+
+    def scan_finished(self, started: float, activity: bool):
+        """
+        一次检查结束：有活动时回到最短间隔，否则退避
+        :param started: 检查开始时的 time.monotonic()
+        """
+        now = time.monotonic()
+        duration = now - started
+        self.scan_duration = duration if self.scans == 0 else 0.8 * self.scan_duration + 0.2 * duration
+        self.scans += 1
+        self.last_scan_at = now
+        self.pending = False
+        if activity:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.interval_cap)
+
+    def record_detection(self, count: int = 1):
+        """
+        记录检测到的新消息。消息在上一次检查之后到达，
+        以距上一次检查结束的时间作为等待时间的上界
+        """
+        self.detected += count
+        if self.last_scan_at is None:
+            return
+        lag = time.monotonic() - self.last_scan_at
+        self.detection_lags.extend([lag] * count)
+        for _ in range(count):
+            self.detection_histogram.observe(lag)
+
+    def notify_activity(self):
+        """外部活动（如刚发送消息）后尽快检查回复"""
+        self.interval = self.min_interval
+        self._wakeup.set()
+
+    async def wait(self):
+        """等待到下一次检查时间，notify_activity 会提前唤醒"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self) -> Dict[str, float]:
+        lags = list(self.detection_lags)
+        return {
+            'interval': self.interval,
+            'scans': self.scans,
+            'detected': self.detected,
+            'scan_duration': self.scan_duration,
+            'detection_lag_p50': percentile(lags, 50),
+            'detection_lag_p95': percentile(lags, 95),
+            'detection_lag_max': max(lags) if lags else 0.0,
+        }
+
+
+# 任务类型 -> 优先级类别，类别按优先级从高到低排列
+TASK_CLASSES = {
+    'send_text': 'outbound',
+    'send_favorite': 'forward',
+    'new_friend': 'welcome',
+    'get_messages': 'read',
+    'send_bulk': 'bulk',
+    'monitor': 'monitor',
+}
+CLASS_ORDER = ['outbound', 'forward', 'welcome', 'read', 'monitor', 'bulk']
+# 后台类别：老化提升的优先级小于与上一级的差距，不会插到其他类别前面
+BACKGROUND_CLASSES = {'bulk'}
+MAX_BACKGROUND_BOOST = 0.5
+
+
+class _Entry:
+    __slots__ = ('seq', 'enqueued_at', 'deadline', 'task')
+
+    def __init__(self, seq: int, enqueued_at: float, deadline: Optional[float], task: dict):
+        self.seq = seq
+        self.enqueued_at = enqueued_at
+        self.deadline = deadline
+        self.task = task
+
+
+class TaskScheduler:
+    """
+    带老化和截止时间的优先级任务队列，接口与 asyncio.Queue 的常用部分一致
+    任务为dict，按 task['type'] 分类；task['deadline'] 为 time.monotonic() 时间戳，可选
+    """
+
+    def __init__(self, aging: float = 10.0, on_drop: Callable[[dict], None] = None,
+                 sample_size: int = 1000, clock: Callable[[], float] = time.monotonic, maxsize: int = 0):
+        """
+        :param aging: 类别多少秒没有被调度相当于提升一个优先级
+        :param maxsize: 队列容量，满时 put 等待、put_nowait 抛出 asyncio.QueueFull；为0时不限制
+        :param on_drop: 任务因过期被丢弃时的回调
+        :param clock: 时钟函数，截止时间需使用同一时钟
+        """
+        self.aging = aging
+        self.clock = clock
+        self.on_drop = on_drop
+        self._queues: Dict[str, Deque[_Entry]] = {cls: deque() for cls in CLASS_ORDER}
+        self._rank = {cls: i for i, cls in enumerate(CLASS_ORDER)}
+        self._served_at: Dict[str, float] = {cls: float('-inf') for cls in CLASS_ORDER}  # 各类别上次被调度的时间
+        self._seq = itertools.count()
+        self._size = 0
+        self._unfinished = 0
+        self.maxsize = maxsize
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self.waits: Dict[str, Deque[float]] = {cls: deque(maxlen=sample_size) for cls in CLASS_ORDER}
+        self.expired: Counter = Counter()
+
+    @staticmethod
+    def task_class(task: dict) -> str:
+        return TASK_CLASSES.get(task.get('type'), 'read')
+
+    # ---- asyncio.Queue 兼容接口 ----
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self._size
+
+    def put_nowait(self, task: dict):
+        if self.full():
+            raise asyncio.QueueFull
+        entry = _Entry(next(self._seq), self.clock(), task.get('deadline'), task)
+        self._queues[self.task_class(task)].append(entry)
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._not_empty.set()
+
+    async def put(self, task: dict):
+        while self.full():
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.put_nowait(task)
+
+    def get_nowait(self) -> dict:
+        entry = self._pop()
+        if entry is None:
+            raise asyncio.QueueEmpty
+        return entry.task
+
+    async def get(self) -> dict:
+        while True:
+            entry = self._pop()
+            if entry is not None:
+                return entry.task
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+    def task_done(self):
+        if self._unfinished <= 0:
+            raise ValueError('task_done() called too many times')
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    # ---- 调度 ----
+    def _pop(self) -> Optional[_Entry]:
+        now = self.clock()
+        while self._size:
+            best, best_score = None, None
+            for cls, queue in self._queues.items():
+                if not queue:
+                    continue
+                head = queue[0]
+                # 同一类别内先进先出，只需比较各类别的队首；老化从队首入队和该类别上次被调度中较晚的时间算起
+                boost = (now - max(head.enqueued_at, self._served_at[cls])) / self.aging
+                if cls in BACKGROUND_CLASSES:
+                    boost = min(boost, MAX_BACKGROUND_BOOST)
+                score = (self._rank[cls] - boost, head.seq)
+                if best_score is None or score < best_score:
+                    best, best_score = cls, score
+            entry = self._queues[best].popleft()
+            self._size -= 1
+            self._not_full.set()
+            if entry.deadline is not None and now > entry.deadline:
+                self._drop(best, entry)
+                continue
+            self._served_at[best] = now
+            self.waits[best].append(now - entry.enqueued_at)
+            return entry
+        return None
+
+    def _drop(self, cls: str, entry: _Entry):
+        self.expired[cls] += 1
+        self.task_done()
+        logging.warning(f"任务已过截止时间，丢弃: {entry.task.get('type')}")
+        if self.on_drop is not None:
+            try:
+                self.on_drop(entry.task)
+            except Exception as e:
+                logging.error(f"处理过期任务回调出错: {str(e)}")
+
+    def take_matching(self, match: Callable[[dict], Optional[bool]], limit: int) -> List[dict]:
+        """
+        按提交顺序扫描待执行任务，取出 match 返回True的任务，match 返回None时停止扫描
+        取出的任务需要调用方在完成后调用 task_done()
+        """
+        now = self.clock()
+        entries = sorted((e for q in self._queues.values() for e in q), key=lambda e: e.seq)
+        taken, expired = [], []
+        for entry in entries:
+            if len(taken) >= limit:
+                break
+            result = match(entry.task)
+            if result is None:
+                break
+            if result:
+                if entry.deadline is not None and now > entry.deadline:
+                    expired.append(entry)
+                else:
+                    taken.append(entry)
+        for entry in taken + expired:
+            cls = self.task_class(entry.task)
+            self._queues[cls].remove(entry)
+            self._size -= 1
+            self._not_full.set()
+            if entry in expired:
+                self._drop(cls, entry)
+            else:
+                self.waits[cls].append(now - entry.enqueued_at)
+        return [entry.task for entry in taken]
+
+    def pending_count(self, task_type: str = None) -> int:
+        if task_type is None:
+            return self._size
+        return sum(1 for q in self._queues.values() for e in q if e.task.get('type') == task_type)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各优先级类别的排队等待时间百分位（秒）、当前队列长度和过期丢弃数"""
+        result = {}
+        for cls in CLASS_ORDER:
+            waits = list(self.waits[cls])
+            result[cls] = {
+                'pending': len(self._queues[cls]),
+                'expired': self.expired[cls],
+                'wait_p50': percentile(waits, 50),
+                'wait_p95': percentile(waits, 95),
+                'wait_p99': percentile(waits, 99),
+            }
+        return result
@@ -7,6 +7,7 @@ import random
 import keyboard  # 需要先安装: pip install keyboard
 import pyautogui  # 需要先安装: pip install pyautogui
 import sys
+from ui_wait import StepTimer, wait_until
 # 收藏名称，必须包含
 
 favorite_name = "黄旗山城市公园龙腾空间"
@@ -22,6 +23,7 @@ class WeChatAutomation:
     def __init__(self):
         self.wx_window = None
         self.running = True  # 添加运行状态标志
+        self.step_timer = StepTimer()  # 各UI步骤的实际等待耗时
     def human_click(self, x, y):
         """模拟人类点击"""
         try:
@@ -113,6 +115,26 @@ class WeChatAutomation:
             logging.error(f"启动微信时出错: {str(e)}")
             return False
 
+    def _wait_for(self, step, predicate, timeout=3.0):
+        """
+        等待UI条件满足并记录该步骤的耗时
+        :return: predicate 的返回值，超时返回None
+        """
+        started = time.perf_counter()
+        result = wait_until(predicate, timeout=timeout)
+        self.step_timer.record(step, time.perf_counter() - started, timed_out=result is None)
+        if result is None:
+            logging.warning(f"等待超时: {step} ({timeout}秒)")
+        return result
+
+    def _view_loaded(self, button_name):
+        """点击导航按钮后对应页面是否已加载"""
+        if button_name == 'Favorites':
+            return self.wx_window.ListControl(Name='All Favorites').Exists(0, 0)
+        if button_name == 'Chats':
+            return self.wx_window.ListControl(Name='会话').Exists(0, 0)
+        return True
+
     def human_move_to(self, x, y):
         """模拟人类移动鼠标"""
         try:
@@ -139,19 +161,16 @@ class WeChatAutomation:
             # 先确保微信窗口是激活的
             if self.wx_window and self.wx_window.Exists():
                 self.wx_window.SetActive()
-                time.sleep(0.5)
                 
                 # 方法1: 直接通过名称查找按钮控件
                 favorites_button = self.wx_window.ButtonControl(Name=button_name, searchDepth=5)
-                if favorites_button.Exists():
+                if self._wait_for('activate', lambda: favorites_button.Exists(0, 0), timeout=1.0):
                     logging.info("找到Favorites按钮 (方法1)")
                     favorites_button.Click()
-                    time.sleep(0.5)
-                    return True
-                
-                time.sleep(0.3)
-                pyautogui.click()
-                time.sleep(0.5)
+                else:
+                    pyautogui.click()
+                # 等待对应页面加载完成，不按固定时间等待
+                self._wait_for(f'{button_name}_view', lambda: self._view_loaded(button_name))
                 return True
                 
             else:
@@ -171,7 +190,6 @@ class WeChatAutomation:
                 logging.error("无法点击收藏按钮")
                 return False
             
-            time.sleep(1)  # 等待收藏列表加载
             
             # 定义递归向上查找All Favorites列表的函数
             def find_all_favorites_in_ancestors(control, depth=6):
@@ -198,8 +216,8 @@ class WeChatAutomation:
                     logging.error(f"在递归查找All Favorites时出错: {str(e)}")
                 return None
             
-            # 查找收藏列表
-            favorites_list = find_all_favorites_in_ancestors(self.wx_window)
+            # 等待收藏列表加载
+            favorites_list = self._wait_for('favorites_list', lambda: find_all_favorites_in_ancestors(self.wx_window))
             favorite_item = None
             
             if favorites_list and favorites_list.Exists():
@@ -227,20 +245,27 @@ class WeChatAutomation:
                 center_x = (rect.left + rect.right) // 2
                 center_y = (rect.top + rect.bottom) // 2
                 
-                # 移动到项目位置并右键点击
+                # 移动到项目位置并右键点击，等待右键菜单弹出后点击其中的转发
                 self.human_move_to(center_x, center_y)
-                time.sleep(0.3)
                 pyautogui.rightClick()
-                time.sleep(0.5)
+
+                def forward_menu_item():
+                    item = auto.WindowControl(ClassName='CMenuWnd', searchDepth=1).MenuItemControl(
+                        SubName='转发', searchDepth=3)
+                    return item if item.Exists(0, 0) else None
+                forward_item = self._wait_for('context_menu', forward_menu_item, timeout=2.0)
+                if forward_item is None:
+                    logging.error("右键菜单中未找到转发")
+                    return False
                 logging.info(f"已右键点击收藏项: {favorite_item.Name}")
 
-                #向右和向下移动一点，然后左键点击
-                pyautogui.move(10, 10)
-                time.sleep(0.3)
-                pyautogui.click()
-                time.sleep(0.5)
+                forward_item.Click()
+                # 等待转发对话框打开
+                if not self._wait_for('forward_dialog',
+                                      lambda: self.wx_window.ButtonControl(Name='Cancel', searchDepth=6).Exists(0, 0)):
+                    logging.error("转发对话框未打开")
+                    return False
                 logging.info(f"已左键点击转发")
-                time.sleep(0.2)
 
                 
                 # 点击搜索框
@@ -265,16 +290,21 @@ class WeChatAutomation:
                     if search_box.Exists():
                         logging.info(f"成功找到联系人: {friend_name}")
                         search_box.SendKeys('{Enter}')
-                        time.sleep(1.5)  # 等待搜索结果
 
                         logging.info("开始查找Send按钮")
-                        send_button = self.wx_window.ButtonControl(Name="Send", searchDepth=6)
-                        if not send_button.Exists():
-                            send_button = self.wx_window.ButtonControl(Name="发送", searchDepth=6)
-                        if send_button and send_button.Exists():
+                        # 选中联系人后发送按钮才可用
+                        def enabled_send_button():
+                            for name in ('Send', '发送'):
+                                button = self.wx_window.ButtonControl(Name=name, searchDepth=6)
+                                if button.Exists(0, 0) and button.IsEnabled:
+                                    return button
+                            return None
+                        send_button = self._wait_for('forward_ready', enabled_send_button)
+                        if send_button:
                             logging.info("直接查找找到Send按钮")
                             send_button.Click()
-                            time.sleep(0.5)
+                            self._wait_for('forward_send',
+                                           lambda: not self.wx_window.ButtonControl(Name='Cancel', searchDepth=6).Exists(0, 0))
                             return True
                         else:
                             logging.error("未找到Send按钮")
@@ -0,0 +1,92 @@
+"""
+客户端订阅
+
+原来每条消息对每个已连接的客户端都重新 json.dumps 一次并发送，不管客户端是否关心。
+客户端连接时通过查询参数声明订阅：
+    ws://localhost:8000/ws/{client_id}?senders=张三,李四&chats=工作群&keywords=订单,退款&types=receive
+同一项中的多个值为"或"，不同项之间为"与"，不填的项不限制。
+SubscriptionIndex 按发送者/会话建立倒排索引，一条消息只检查可能匹配的客户端，
+客户端数增加时广播的代价只随匹配的客户端数增长。
+"""
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Set
+
+
+def _split(value: str) -> List[str]:
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+@dataclass(frozen=True)
+class Subscription:
+    senders: FrozenSet[str] = frozenset()
+    chats: FrozenSet[str] = frozenset()
+    keywords: tuple = ()
+    types: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_query(cls, params: Mapping[str, str]) -> 'Subscription':
+        """从连接的查询参数解析订阅，多个值用逗号分隔"""
+        return cls(
+            senders=frozenset(_split(params.get('senders', ''))),
+            chats=frozenset(_split(params.get('chats', ''))),
+            keywords=tuple(_split(params.get('keywords', ''))),
+            types=frozenset(_split(params.get('types', ''))),
+        )
+
+    def matches(self, msg_type: str, sender: str, chat: str, content: str) -> bool:
+        if self.types and msg_type not in self.types:
+            return False
+        if self.senders and sender not in self.senders:
+            return False
+        if self.chats and chat not in self.chats:
+            return False
+        if self.keywords and not any(keyword in content for keyword in self.keywords):
+            return False
+        return True
+
+
+class SubscriptionIndex:
+    """client_id -> 订阅，按最有选择性的一项建立索引"""
+
+    def __init__(self):
+        self.subscriptions: Dict[str, Subscription] = {}
+        self._by_sender: Dict[str, Set[str]] = {}
+        self._by_chat: Dict[str, Set[str]] = {}
+        self._scan: Set[str] = set()  # 只按关键词或类型订阅、或不限制的客户端
+
+    def add(self, client_id: str, subscription: Subscription):
+        self.remove(client_id)
+        self.subscriptions[client_id] = subscription
+        if subscription.senders:
+            for sender in subscription.senders:
+                self._by_sender.setdefault(sender, set()).add(client_id)
+        elif subscription.chats:
+            for chat in subscription.chats:
+                self._by_chat.setdefault(chat, set()).add(client_id)
+        else:
+            self._scan.add(client_id)
+
+    def remove(self, client_id: str):
+        subscription = self.subscriptions.pop(client_id, None)
+        if subscription is None:
+            return
+        self._discard(self._by_sender, subscription.senders, client_id)
+        self._discard(self._by_chat, subscription.chats, client_id)
+        self._scan.discard(client_id)
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], keys: Iterable[str], client_id: str):
+        for key in keys:
+            clients = index.get(key)
+            if clients is not None:
+                clients.discard(client_id)
+                if not clients:
+                    del index[key]
+
+    def match(self, msg_type: str, sender: str, chat: str, content: str) -> List[str]:
+        """返回订阅了这条消息的客户端"""
+        candidates = set(self._scan)
+        candidates.update(self._by_sender.get(sender, ()))
+        candidates.update(self._by_chat.get(chat, ()))
+        return [client_id for client_id in candidates
+                if self.subscriptions[client_id].matches(msg_type, sender, chat, content)]
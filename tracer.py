@@ -0,0 +1,176 @@
+"""
+任务追踪
+
+一次 send_favorite 用了9秒，却分不清其中多少是 sleep、多少是控件查找、多少是输入。
+Tracer（默认关闭）在任务执行期间把以下调用记录为带时间的 span：
+- UIWorker 中执行的函数（_forward_favorite、_get_session_list 等）和 WeChatRPA 的主要步骤方法
+- _wait_for 的条件等待（wait:步骤名）
+- UI后端调用：移动、点击、sleep 等
+- UIA基础调用（Exists、GetChildren、SendKeys、Click 等，经 metrics.instrument 的包装）
+每个任务（可按比例采样、只保留慢任务）写出一个 Chrome trace-event JSON 文件，
+用 chrome://tracing 或 https://ui.perfetto.dev 打开；同时按任务类型累计 span 树
+（按时间包含关系还原父子关系），用于找出最值得优化的步骤。
+任务在 processing_lock 下串行执行，同一时间只追踪一个任务；任务执行期间
+事件循环另外提交给UI线程的调用（如解析接收者时读取通讯录）也会记在当前任务中。
+"""
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 追踪的UI后端方法
+BACKEND_CALLS = ('window_control', 'move_to', 'move', 'click', 'right_click', 'sleep')
+
+
+@dataclass
+class TaskTrace:
+    task_type: str
+    task_id: Optional[str]
+    started: float = field(default_factory=time.perf_counter)
+    # (名称, 类别, 线程ID, 开始时间, 耗时, 参数)
+    spans: List[Tuple[str, str, int, float, float, Optional[dict]]] = field(default_factory=list)
+    threads: Dict[int, str] = field(default_factory=dict)
+
+
+class Tracer:
+    def __init__(self, output_dir: Optional[str] = 'traces', sample_rate: float = 1.0, min_duration: float = 0.0,
+                 rng: Callable[[], float] = random.random):
+        """
+        :param output_dir: trace 文件目录，为None时只累计 span 树不写文件
+        :param sample_rate: 追踪的任务比例(0~1)
+        :param min_duration: 只写出耗时不少于该值（秒）的任务
+        """
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.min_duration = min_duration
+        self.rng = rng
+        self.current: Optional[TaskTrace] = None
+        # 任务类型 -> {span路径: [次数, 累计秒数]}
+        self.profiles: Dict[str, Dict[Tuple[str, ...], List[float]]] = {}
+        self.traced = 0
+        self.written = 0
+        self._seq = 0
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    # ---- 任务 ----
+    def begin(self, task: dict) -> Optional[TaskTrace]:
+        """任务开始执行，按采样比例决定是否追踪"""
+        if self.sample_rate < 1.0 and self.rng() >= self.sample_rate:
+            return None
+        self.current = TaskTrace(task.get('type', 'unknown'), task.get('task_id'))
+        return self.current
+
+    def end(self, trace: Optional[TaskTrace]):
+        """任务结束：记录根 span，累计 span 树，需要时写出文件"""
+        if trace is None:
+            return
+        if self.current is trace:
+            self.current = None
+        duration = time.perf_counter() - trace.started
+        self._append(trace, f"task:{trace.task_type}", 'task', trace.started, duration,
+                     {'task_id': trace.task_id} if trace.task_id else None)
+        self.traced += 1
+        profile = self.profiles.setdefault(trace.task_type, {})
+        for path, seconds in self.span_paths(trace):
+            entry = profile.setdefault(path, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+        if self.output_dir and duration >= self.min_duration:
+            try:
+                self._write(trace)
+            except OSError as e:
+                logging.error(f"写入追踪文件出错: {str(e)}")
+
+    # ---- span ----
+    def record(self, name: str, category: str, started: float, duration: float, args: Optional[dict] = None):
+        """记录一个已结束的 span，started 为 time.perf_counter()；没有正在追踪的任务时忽略"""
+        trace = self.current
+        if trace is not None:
+            self._append(trace, name, category, started, duration, args)
+
+    @staticmethod
+    def _append(trace: TaskTrace, name: str, category: str, started: float, duration: float,
+                args: Optional[dict]):
+        thread = threading.current_thread()
+        trace.threads.setdefault(thread.ident, thread.name)
+        trace.spans.append((name, category, thread.ident, started, duration, args))
+
+    def wrap(self, fn: Callable, name: Optional[str] = None, category: str = 'step') -> Callable:
+        """返回把每次调用记录为 span 的函数"""
+        if getattr(fn, '__traced__', False):
+            return fn
+        name = name or getattr(fn, '__name__', repr(fn))
+
+        @functools.wraps(fn)
+        def traced(*args, **kwargs):
+            if self.current is None:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, category, started, time.perf_counter() - started)
+
+        traced.__traced__ = True
+        return traced
+
+    def attach(self, obj, names, category: str = 'step'):
+        """把对象上的方法替换为追踪版本（只影响这个实例）"""
+        for name in names:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self.wrap(method, name, category))
+
+    def attach_backend(self, ui):
+        """追踪UI后端的移动、点击和 sleep"""
+        for name in BACKEND_CALLS:
+            method = getattr(ui, name, None)
+            if method is not None:
+                setattr(ui, name, self.wrap(method, name, 'sleep' if name == 'sleep' else 'backend'))
+
+    # ---- 输出 ----
+    @staticmethod
+    def span_paths(trace: TaskTrace) -> List[Tuple[Tuple[str, ...], float]]:
+        """按时间包含关系还原 span 树，返回每个 span 的 (从根开始的路径, 耗时)"""
+        ordered = sorted(trace.spans, key=lambda span: (span[3], -span[4]))
+        stack: List[Tuple[str, float]] = []  # (名称, 结束时间)
+        result = []
+        for name, _, _, started, duration, _ in ordered:
+            while stack and stack[-1][1] <= started:
+                stack.pop()
+            stack.append((name, started + duration))
+            result.append((tuple(entry[0] for entry in stack), duration))
+        return result
+
+    @staticmethod
+    def chrome_events(trace: TaskTrace) -> List[dict]:
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in trace.threads.items()]
+        for name, category, tid, started, duration, args in trace.spans:
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': tid,
+                     'ts': (started - trace.started) * 1e6, 'dur': duration * 1e6}
+            if args:
+                event['args'] = args
+            events.append(event)
+        return events
+
+    def _write(self, trace: TaskTrace):
+        self._seq += 1
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{self._seq:06d}-{trace.task_type}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.chrome_events(trace), 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        self.written += 1
+
+    def profile(self, task_type: str) -> List[dict]:
+        """某类任务累计的 span 树，按路径排列，每行带次数、累计和平均耗时（毫秒）"""
+        rows = []
+        for path, (count, seconds) in sorted(self.profiles.get(task_type, {}).items()):
+            rows.append({'span': '  ' * (len(path) - 1) + path[-1], 'depth': len(path), 'count': count,
+                         'total_ms': seconds * 1000, 'mean_ms': seconds / count * 1000})
+        return rows
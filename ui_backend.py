@@ -0,0 +1,784 @@
+"""
+UI自动化后端
+
+WeChatRPA 不再直接调用 uiautomation / pyautogui，而是通过 UIBackend 访问界面：
+- UIAutomationBackend: 基于 uiautomation + pyautogui 的真实后端（仅Windows）
+- FakeWeChatBackend: 内存中的模拟微信控件树，可配置每次调用的延迟，用于在Linux上做基准测试和回归
+"""
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Union
+
+from metrics import UIA_PRIMITIVES, instrument
+
+
+class ControlType:
+    """UIA控件类型ID，与 uiautomation.ControlType 的取值一致"""
+    ButtonControl = 50000
+    CheckBoxControl = 50002
+    EditControl = 50004
+    ListItemControl = 50007
+    MenuItemControl = 50011
+    ListControl = 50008
+    DocumentControl = 50030
+    GroupControl = 50026
+    TextControl = 50020
+    WindowControl = 50032
+    PaneControl = 50033
+
+
+class UIBackend:
+    """UI后端接口：查找窗口、鼠标操作和等待"""
+    ControlType = ControlType
+
+    def window_control(self, **kwargs):
+        """按条件查找顶层窗口，返回的控件需支持 Exists()"""
+        raise NotImplementedError
+
+    def move_to(self, x: int, y: int, duration: float = 0.0):
+        raise NotImplementedError
+
+    def move(self, dx: int, dy: int):
+        raise NotImplementedError
+
+    def click(self):
+        raise NotImplementedError
+
+    def right_click(self):
+        raise NotImplementedError
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+    def is_alive(self, control) -> bool:
+        """廉价地校验已解析的控件是否仍然有效"""
+        return control.Exists(0, 0)
+
+    def is_bound(self, control) -> bool:
+        """已解析的控件对应的元素是否仍然存在，不考虑是否可见（滚动到可见区域外的列表项也算存在）"""
+        return control.Exists(0, 0)
+
+    def thread_initializer(self):
+        """UI工作线程的初始化函数，不需要时返回None"""
+        return None
+
+    def instrument(self, stats):
+        """统计控件基础调用的次数和耗时（metrics.PrimitiveStats），不支持时忽略"""
+
+
+class UIAutomationBackend(UIBackend):
+    """真实后端，依赖 uiautomation 和 pyautogui（仅Windows可用）"""
+
+    def __init__(self):
+        import uiautomation
+        import pyautogui
+        self.auto = uiautomation
+        self.pyautogui = pyautogui
+
+    def window_control(self, **kwargs):
+        return self.auto.WindowControl(**kwargs)
+
+    def move_to(self, x: int, y: int, duration: float = 0.0):
+        self.pyautogui.moveTo(x, y, duration=duration)
+
+    def move(self, dx: int, dy: int):
+        self.pyautogui.move(dx, dy)
+
+    def click(self):
+        self.pyautogui.click()
+
+    def right_click(self):
+        self.pyautogui.rightClick()
+
+    def instrument(self, stats):
+        # 各种控件类都继承自 uiautomation.Control，包装基类即可
+        instrument(self.auto.Control, UIA_PRIMITIVES, stats)
+
+    def thread_initializer(self):
+        def init():
+            # 在UI工作线程中初始化COM，初始化对象随线程一直保留
+            threading.current_thread().uia_initializer = self.auto.UIAutomationInitializerInThread()
+        return init
+
+    def is_alive(self, control) -> bool:
+        # 只用于已缓存、已绑定元素的控件。uiautomation 的 Exists() 每次都会重新查找，这里直接读取元素属性，
+        # 元素失效时会抛出COM异常，控件隐藏时矩形为空
+        rect = control.BoundingRectangle
+        return rect.right > rect.left and rect.bottom > rect.top
+
+    def is_bound(self, control) -> bool:
+        # 虚拟化或滚动到可见区域外的列表项矩形为空，不能用 is_alive；元素已移除时读取属性会抛出COM异常
+        control.GetRuntimeId()
+        return True
+
+
+class Rect:
+    """与 uiautomation.Rect 相同的字段"""
+    __slots__ = ('left', 'top', 'right', 'bottom')
+
+    def __init__(self, left: int = 0, top: int = 0, right: int = 0, bottom: int = 0):
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+    def contains(self, x: int, y: int) -> bool:
+        return self.left <= x < self.right and self.top <= y < self.bottom
+
+    def __repr__(self):
+        return f"Rect({self.left}, {self.top}, {self.right}, {self.bottom})"
+
+
+_SEARCH_METHODS = {
+    'ButtonControl': ControlType.ButtonControl,
+    'EditControl': ControlType.EditControl,
+    'ListControl': ControlType.ListControl,
+    'ListItemControl': ControlType.ListItemControl,
+    'MenuItemControl': ControlType.MenuItemControl,
+    'PaneControl': ControlType.PaneControl,
+    'TextControl': ControlType.TextControl,
+    'WindowControl': ControlType.WindowControl,
+}
+
+_KEY_TOKEN = re.compile(r'\{([^{}]+)\}|([^{]+)')
+
+
+class FakeControl:
+    """模拟的UIA控件，接口与 uiautomation.Control 的常用子集一致"""
+
+    def __init__(self, backend: 'FakeWeChatBackend', control_type: int, name: str = '',
+                 class_name: str = '', children: Optional[List['FakeControl']] = None,
+                 rect: Optional[Rect] = None, text: str = '', focusable: bool = False,
+                 role: str = '', data=None):
+        self._backend = backend
+        self.ControlType = control_type
+        self.Name = name
+        self.ClassName = class_name
+        self.BoundingRectangle = rect or Rect()
+        self.IsKeyboardFocusable = focusable
+        self.IsEnabled = True
+        self.IsOffscreen = False
+        self.NativeWindowHandle = 0
+        self.parent: Optional[FakeControl] = None
+        self.children: List[FakeControl] = []
+        self.text = text
+        self.role = role  # 模拟器内部用来识别控件用途
+        self.data = data
+        for child in children or []:
+            self.append(child)
+
+    # ---- 树结构维护（模拟器内部使用，不计入调用统计） ----
+    def append(self, child: 'FakeControl', index: Optional[int] = None):
+        child.parent = self
+        if index is None:
+            self.children.append(child)
+        else:
+            self.children.insert(index, child)
+        return child
+
+    def remove(self, child: 'FakeControl'):
+        self.children.remove(child)
+        child.parent = None
+
+    def clear(self):
+        for child in self.children:
+            child.parent = None
+        self.children = []
+
+    def _attached(self) -> bool:
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node is self._backend.window or node is self._backend.menu
+
+    def _iter_descendants(self, max_depth: int):
+        stack = [(child, 1) for child in reversed(self.children)]
+        while stack:
+            node, depth = stack.pop()
+            yield node
+            if depth < max_depth:
+                stack.extend((child, depth + 1) for child in reversed(node.children))
+
+    def _matches(self, criteria: Dict) -> bool:
+        for key, value in criteria.items():
+            if key == 'SubName':
+                if value not in self.Name:
+                    return False
+            elif getattr(self, key, None) != value:
+                return False
+        return True
+
+    def _search(self, control_type: int, criteria: Dict):
+        criteria = dict(criteria)
+        max_depth = criteria.pop('searchDepth', 0xFFFFFFFF)
+        found_index = criteria.pop('foundIndex', 1)
+        criteria['ControlType'] = control_type
+        visited = 0
+        result = None
+        for node in self._iter_descendants(max_depth):
+            visited += 1
+            if node._matches(criteria):
+                found_index -= 1
+                if found_index == 0:
+                    result = node
+                    break
+        self._backend._call('search', nodes=visited)
+        return result if result is not None else _MissingControl(self._backend, criteria)
+
+    def __getattr__(self, attr):
+        if attr in _SEARCH_METHODS:
+            control_type = _SEARCH_METHODS[attr]
+            return lambda **criteria: self._search(control_type, criteria)
+        raise AttributeError(attr)
+
+    # ---- uiautomation.Control 接口 ----
+    def Exists(self, maxSearchSeconds: float = 5, searchIntervalSeconds: float = 0.5) -> bool:
+        self._backend._call('Exists')
+        return self._attached()
+
+    def GetChildren(self) -> List['FakeControl']:
+        self._backend._call('GetChildren', nodes=len(self.children))
+        return list(self.children)
+
+    def GetFirstChildControl(self) -> Optional['FakeControl']:
+        self._backend._call('GetFirstChildControl')
+        return self.children[0] if self.children else None
+
+    def GetLastChildControl(self) -> Optional['FakeControl']:
+        self._backend._call('GetLastChildControl')
+        return self.children[-1] if self.children else None
+
+    def GetParentControl(self) -> Optional['FakeControl']:
+        self._backend._call('GetParentControl')
+        return self.parent
+
+    def GetPreviousSiblingControl(self) -> Optional['FakeControl']:
+        self._backend._call('GetPreviousSiblingControl')
+        if self.parent is None:
+            return None
+        # 通常从列表末尾往前遍历，从后往前找自己的位置
+        siblings = self.parent.children
+        for index in range(len(siblings) - 1, 0, -1):
+            if siblings[index] is self:
+                return siblings[index - 1]
+        return None
+
+    def GetRuntimeId(self) -> List[int]:
+        self._backend._call('GetRuntimeId')
+        return [42, id(self)]
+
+    def GetWindowText(self) -> str:
+        self._backend._call('GetWindowText')
+        return self.text
+
+    def GetValuePattern(self) -> '_ValuePattern':
+        self._backend._call('GetValuePattern')
+        return _ValuePattern(self)
+
+    def GetScrollItemPattern(self) -> '_ScrollItemPattern':
+        self._backend._call('GetScrollItemPattern')
+        return _ScrollItemPattern(self)
+
+    def SetActive(self) -> bool:
+        self._backend._call('SetActive')
+        return self._attached()
+
+    def Click(self, *args, **kwargs):
+        self._backend._call('Click')
+        rect = self.BoundingRectangle
+        self._backend.mouse = ((rect.left + rect.right) // 2, (rect.top + rect.bottom) // 2)
+        self._backend._on_click(self)
+
+    def SendKeys(self, text: str, *args, **kwargs):
+        self._backend._call('SendKeys')
+        self._backend._on_keys(self, text)
+
+    def __repr__(self):
+        return f"FakeControl({self.ControlType}, {self.Name!r})"
+
+
+class _ValuePattern:
+    """ValuePattern，Value 为编辑框当前文本"""
+
+    def __init__(self, control: FakeControl):
+        self._control = control
+
+    @property
+    def Value(self) -> str:
+        return self._control.text
+
+
+class _ScrollItemPattern:
+    """ScrollItemPattern，把列表项滚动到可见区域"""
+
+    def __init__(self, control: FakeControl):
+        self._control = control
+
+    def ScrollIntoView(self) -> bool:
+        self._control._backend._call('ScrollIntoView')
+        return self._control._backend._scroll_into_view(self._control)
+
+
+class _MissingControl:
+    """查找失败时返回的控件，Exists() 为 False，其余操作与 uiautomation 一样抛出异常"""
+    ControlType = 0
+    Name = ''
+
+    def __init__(self, backend: 'FakeWeChatBackend', criteria: Dict):
+        self._backend = backend
+        self._criteria = criteria
+
+    def Exists(self, maxSearchSeconds: float = 5, searchIntervalSeconds: float = 0.5) -> bool:
+        self._backend._call('Exists')
+        return False
+
+    def __getattr__(self, attr):
+        raise LookupError(f"Find Control Timeout: {self._criteria}")
+
+
+class FakeSession:
+    """模拟会话：名称、未读数、最近一条预览和消息列表"""
+
+    def __init__(self, name: str, messages: Optional[List[str]] = None):
+        self.name = name
+        self.unread = 0
+        self.messages: List[str] = list(messages or [])
+        self.preview = self.messages[-1] if self.messages else ''
+        self.time_text = '10:00'
+
+    @property
+    def display_name(self) -> str:
+        if self.unread:
+            return f"{self.name}{self.unread}条新消息"
+        return self.name
+
+
+class FakeWeChatBackend(UIBackend):
+    """
+    内存中的模拟微信
+    :param sessions: 会话名称列表，或 {会话名称: [历史消息]}
+    :param favorites: 收藏项名称列表
+    :param nicknames: {会话名称(备注): 微信昵称}，通讯录中显示备注，搜索时昵称同样能找到
+    :param latency: 每次UIA调用的模拟延迟（秒），可以是数字或 {调用名: 秒}
+    :param search_node_latency: 树查找时每访问一个节点的额外延迟（秒）
+    :param sleep_scale: RPA中 sleep 的实际执行比例，0表示只记录不等待
+    """
+    ROW_HEIGHT = 64
+    FAVORITE_ROW_HEIGHT = 70
+    FAVORITES_VISIBLE = 12  # 收藏列表高度内可见的项数
+    FORWARD_LIMIT = 9  # 转发对话框一次最多选择的联系人数
+    WINDOW_RECT = Rect(0, 0, 1200, 900)
+
+    def __init__(self, sessions: Union[List[str], Dict[str, List[str]], None] = None,
+                 favorites: Optional[List[str]] = None,
+                 nicknames: Optional[Dict[str, str]] = None,
+                 latency: Union[float, Dict[str, float]] = 0.0,
+                 search_node_latency: float = 0.0,
+                 sleep_scale: float = 0.0):
+        self.latency = latency
+        self.search_node_latency = search_node_latency
+        self.sleep_scale = sleep_scale
+        self.calls: Counter = Counter()
+        self.nodes = 0  # 树查找和 GetChildren 经过的节点数
+        self.slept = 0.0
+        self.mouse = (0, 0)
+        self.sent: List[tuple] = []       # (接收者, 内容)
+        self.sent_at: List[float] = []    # 每条消息发出时的 perf_counter
+        self.delivered_at: Dict[tuple, float] = {}  # (会话, 内容) -> 收到时的 perf_counter
+        self.forwarded: List[tuple] = []  # (收藏名称, 接收者)
+        self.sessions: Dict[str, FakeSession] = {}
+        if isinstance(sessions, dict):
+            for name, messages in sessions.items():
+                self.sessions[name] = FakeSession(name, messages)
+        else:
+            for name in sessions or []:
+                self.sessions[name] = FakeSession(name)
+        self.favorites: List[str] = list(favorites or [])
+        self.nicknames: Dict[str, str] = dict(nicknames or {})
+        self.view = 'chats'
+        self.current_chat: Optional[str] = None
+        self.context_item: Optional[FakeControl] = None
+        self.menu: Optional[FakeControl] = None  # 右键菜单，独立的顶层窗口
+        self.forward: Optional[dict] = None
+        self._handle = 0x10000
+        self.window: Optional[FakeControl] = None
+        self._build_window()
+
+    @classmethod
+    def synthetic(cls, n_sessions: int = 50, n_favorites: int = 50, history: int = 20, **kwargs):
+        """生成指定规模的模拟数据：联系人0号..联系人N号、收藏_0..M（会话名不以数字结尾，避免与未读提示混淆），每个会话带history条历史消息"""
+        sessions = {
+            f"联系人{i}号": [f"历史消息 {i}-{j}" for j in range(history)]
+            for i in range(n_sessions)
+        }
+        favorites = [f"收藏_{i}" for i in range(n_favorites)]
+        return cls(sessions=sessions, favorites=favorites, **kwargs)
+
+    # ---- 统计 ----
+    def _call(self, name: str, nodes: int = 0):
+        self.calls[name] += 1
+        self.nodes += nodes
+        if isinstance(self.latency, dict):
+            delay = self.latency.get(name, 0.0)
+        else:
+            delay = self.latency
+        delay += nodes * self.search_node_latency
+        if delay > 0:
+            time.sleep(delay)
+
+    def reset_stats(self):
+        self.calls.clear()
+        self.nodes = 0
+        self.slept = 0.0
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    # ---- UIBackend 接口 ----
+    def window_control(self, **kwargs):
+        criteria = dict(kwargs)
+        criteria.pop('searchDepth', None)
+        self._call('search', nodes=1)
+        for window in (self.window, self.menu):
+            if window is not None and window._matches(criteria):
+                return window
+        return _MissingControl(self, criteria)
+
+    def move_to(self, x: int, y: int, duration: float = 0.0):
+        self._call('moveTo')
+        self.mouse = (x, y)
+        self.sleep(duration)
+
+    def move(self, dx: int, dy: int):
+        self._call('move')
+        self.mouse = (self.mouse[0] + dx, self.mouse[1] + dy)
+
+    def click(self):
+        self._call('click')
+        if self.menu is not None:
+            # 点在菜单第一项"转发"上时打开转发对话框，点在其他位置时关闭菜单
+            if self.menu.children[0].BoundingRectangle.contains(*self.mouse):
+                self._open_forward_dialog(self.context_item)
+            self._close_context_menu()
+
+    def right_click(self):
+        self._call('rightClick')
+        self._close_context_menu()
+        for item in self._favorites_list.children:
+            if item.BoundingRectangle.contains(*self.mouse) and self.view == 'favorites' and not item.IsOffscreen:
+                self._open_context_menu(item)
+                return
+
+    def sleep(self, seconds: float):
+        self.slept += seconds
+        if self.sleep_scale > 0:
+            time.sleep(seconds * self.sleep_scale)
+
+    def instrument(self, stats):
+        # 与真实后端一样包装在控件类上，同一进程中以最后一次调用的 stats 为准
+        instrument(FakeControl, UIA_PRIMITIVES, stats)
+        instrument(_MissingControl, ('Exists',), stats)
+
+    # ---- 模拟外部事件 ----
+    def deliver(self, chat_name: str, content: str):
+        """模拟收到一条消息"""
+        session = self.sessions.get(chat_name)
+        if session is None:
+            session = self.sessions[chat_name] = FakeSession(chat_name)
+        session.messages.append(content)
+        session.preview = content
+        self.delivered_at[(chat_name, content)] = time.perf_counter()
+        if self.current_chat != chat_name:
+            session.unread += 1
+        self._move_to_top(chat_name)
+        self._refresh_sessions()
+        if self.current_chat == chat_name:
+            self._refresh_messages()
+
+    def add_friend(self, name: str):
+        """模拟免验证添加的新好友"""
+        session = self.sessions.get(name) or FakeSession(name)
+        session.preview = f"你已添加了{name}，现在可以开始聊天了"
+        session.messages.append(session.preview)
+        self.sessions[name] = session
+        self._move_to_top(name)
+        self._refresh_sessions()
+
+    def add_favorite(self, name: str, index: int = 0):
+        """模拟新收藏，默认出现在列表最前"""
+        self.favorites.insert(index, name)
+        self._refresh_favorites()
+
+    def restart(self):
+        """模拟微信重启：窗口句柄变化，旧控件全部失效"""
+        self.view = 'chats'
+        self.current_chat = None
+        self.forward = None
+        self._close_context_menu()
+        self._build_window()
+
+    # ---- 控件树 ----
+    def _build_window(self):
+        self._handle += 1
+        win = FakeControl(self, ControlType.WindowControl, name='微信',
+                          class_name='WeChatMainWndForPC', rect=self.WINDOW_RECT)
+        win.NativeWindowHandle = self._handle
+        self._session_items: Dict[str, FakeControl] = {}
+        self._message_items: Dict[str, List[FakeControl]] = {}
+        self._favorite_items: Dict[Tuple[str, int], FakeControl] = {}
+        self._favorites_scroll = 0  # 收藏列表第一个可见项的位置
+        nav = win.append(FakeControl(self, ControlType.PaneControl, name='导航'))
+        for i, name in enumerate(['Chats', 'Contacts', 'Favorites']):
+            nav.append(FakeControl(self, ControlType.ButtonControl, name=name,
+                                   rect=Rect(0, 60 + i * 50, 60, 100 + i * 50), role='nav'))
+        self._content = win.append(FakeControl(self, ControlType.PaneControl))
+        self._session_pane = FakeControl(self, ControlType.PaneControl, children=[
+            FakeControl(self, ControlType.EditControl, name='Search',
+                        rect=Rect(70, 20, 300, 50), role='search'),
+        ])
+        self._session_list = self._session_pane.append(
+            FakeControl(self, ControlType.ListControl, name='会话', rect=Rect(60, 60, 310, 900)))
+        self._chat_pane = FakeControl(self, ControlType.PaneControl)
+        self._chat_title = self._chat_pane.append(FakeControl(self, ControlType.TextControl))
+        self._message_list = self._chat_pane.append(
+            FakeControl(self, ControlType.ListControl, name='消息', rect=Rect(310, 60, 1200, 700)))
+        self._chat_pane.append(FakeControl(self, ControlType.EditControl, focusable=True,
+                                           rect=Rect(310, 700, 1200, 850), role='input'))
+        self._chat_pane.append(FakeControl(self, ControlType.ButtonControl, name='Send',
+                                           rect=Rect(1100, 850, 1180, 890), role='chat_send'))
+        self._contacts_pane = FakeControl(self, ControlType.PaneControl)
+        self._contacts_list = self._contacts_pane.append(
+            FakeControl(self, ControlType.ListControl, name='联系人', rect=Rect(60, 60, 310, 900)))
+        self._favorites_pane = FakeControl(self, ControlType.PaneControl)
+        self._favorites_list = self._favorites_pane.append(
+            FakeControl(self, ControlType.ListControl, name='All Favorites', rect=Rect(60, 60, 1200, 900)))
+        self.window = win
+        self._refresh_sessions()
+        self._refresh_favorites()
+        self._show_view('chats')
+
+    def _show_view(self, view: str):
+        self.view = view
+        self._content.clear()
+        if view == 'favorites':
+            self._content.append(self._favorites_pane)
+        elif view == 'contacts':
+            self._refresh_contacts()
+            self._content.append(self._contacts_pane)
+        else:
+            self._content.append(self._session_pane)
+            self._content.append(self._chat_pane)
+
+    def _move_to_top(self, chat_name: str):
+        session = self.sessions.pop(chat_name)
+        self.sessions = {chat_name: session, **self.sessions}
+
+    def _refresh_sessions(self):
+        # 与真实UIA一样，会话项控件在列表中一直存在，只更新名称、位置和内容
+        items = []
+        for i, session in enumerate(self.sessions.values()):
+            top = 60 + i * self.ROW_HEIGHT
+            item = self._session_items.get(session.name)
+            if item is None:
+                item = self._session_items[session.name] = FakeControl(
+                    self, ControlType.ListItemControl, role='session', data=session.name)
+            item.Name = session.display_name
+            item.BoundingRectangle = Rect(60, top, 310, top + self.ROW_HEIGHT)
+            item.clear()
+            item.append(FakeControl(self, ControlType.PaneControl, children=[
+                FakeControl(self, ControlType.PaneControl, children=[
+                    FakeControl(self, ControlType.TextControl, name=session.name, text=session.name),
+                    FakeControl(self, ControlType.TextControl, name=session.time_text, text=session.time_text),
+                ]),
+                FakeControl(self, ControlType.PaneControl, children=[
+                    FakeControl(self, ControlType.TextControl, name=session.preview, text=session.preview),
+                ]),
+            ]))
+            items.append(item)
+        self._session_list.clear()
+        for item in items:
+            self._session_list.append(item)
+
+    def _refresh_messages(self):
+        self._message_list.clear()
+        session = self.sessions.get(self.current_chat)
+        if session is None:
+            return
+        self._chat_title.Name = session.name
+        # 已加载的消息项保持同一个控件，只追加新消息
+        controls = self._message_items.setdefault(session.name, [])
+        for content in session.messages[len(controls):]:
+            controls.append(FakeControl(self, ControlType.ListItemControl, name=content))
+        for control in controls:
+            self._message_list.append(control)
+
+    def _refresh_favorites(self):
+        # 收藏项控件保持不变，同名收藏按出现次数区分
+        self._favorites_list.clear()
+        occurrences = Counter()
+        for name in self.favorites:
+            key = (name, occurrences[name])
+            occurrences[name] += 1
+            item = self._favorite_items.get(key)
+            if item is None:
+                item = self._favorite_items[key] = FakeControl(
+                    self, ControlType.ListItemControl, name=name, role='favorite')
+            self._favorites_list.append(item)
+        self._layout_favorites()
+
+    def _layout_favorites(self):
+        """按滚动位置计算收藏项的位置，只有列表高度内的项可见"""
+        for i, item in enumerate(self._favorites_list.children):
+            row = i - self._favorites_scroll
+            top = 60 + row * self.FAVORITE_ROW_HEIGHT
+            item.BoundingRectangle = Rect(60, top, 1200, top + self.FAVORITE_ROW_HEIGHT)
+            item.IsOffscreen = not 0 <= row < self.FAVORITES_VISIBLE
+
+    def _scroll_into_view(self, control: FakeControl) -> bool:
+        if control.role != 'favorite' or control.parent is not self._favorites_list:
+            return False
+        index = self._favorites_list.children.index(control)
+        if index < self._favorites_scroll:
+            self._favorites_scroll = index
+        elif index >= self._favorites_scroll + self.FAVORITES_VISIBLE:
+            self._favorites_scroll = index - self.FAVORITES_VISIBLE + 1
+        self._layout_favorites()
+        return True
+
+    def _open_chat(self, chat_name: str):
+        session = self.sessions.get(chat_name)
+        if session is None:
+            return
+        self.current_chat = chat_name
+        if session.unread:
+            session.unread = 0
+            self._refresh_sessions()
+        self._refresh_messages()
+
+    def _refresh_contacts(self):
+        """通讯录：固定入口后按名称排序，有备注的联系人子项中带昵称"""
+        self._contacts_list.clear()
+        self._contacts_list.append(FakeControl(self, ControlType.ListItemControl, name='新的朋友'))
+        for name in sorted(self.sessions):
+            item = FakeControl(self, ControlType.ListItemControl, name=name, role='contact', data=name)
+            if name in self.nicknames:
+                item.append(FakeControl(self, ControlType.TextControl, name=self.nicknames[name]))
+            self._contacts_list.append(item)
+
+    def _match_contact(self, keyword: str) -> Optional[str]:
+        if keyword in self.sessions:
+            return keyword
+        for name, nickname in self.nicknames.items():
+            if keyword == nickname and name in self.sessions:
+                return name
+        for name in self.sessions:
+            if keyword and keyword in name:
+                return name
+        return None
+
+    def _open_context_menu(self, item: FakeControl):
+        x, y = self.mouse
+        menu = FakeControl(self, ControlType.WindowControl, class_name='CMenuWnd', rect=Rect(x, y, x + 120, y + 90))
+        for i, name in enumerate(['转发...', '编辑标签', '删除']):
+            menu.append(FakeControl(self, ControlType.MenuItemControl, name=name,
+                                    rect=Rect(x, y + i * 30, x + 120, y + (i + 1) * 30),
+                                    role='menu_forward' if i == 0 else 'menu'))
+        self.menu = menu
+        self.context_item = item
+
+    def _close_context_menu(self):
+        self.menu = None
+        self.context_item = None
+
+    def _open_forward_dialog(self, item: FakeControl):
+        dialog = FakeControl(self, ControlType.WindowControl, name='转发', role='forward')
+        dialog.append(FakeControl(self, ControlType.EditControl, name='Search', role='search'))
+        selected = dialog.append(FakeControl(self, ControlType.ListControl, name='已选择'))
+        send = dialog.append(FakeControl(self, ControlType.ButtonControl, name='Send', role='forward_send'))
+        send.IsEnabled = False  # 选择接收者后才可点击
+        dialog.append(FakeControl(self, ControlType.ButtonControl, name='Cancel', role='forward_cancel'))
+        # 模态对话框挂在窗口最前，查找时优先命中
+        self.window.append(dialog, 0)
+        self.forward = {'favorite': item.Name, 'selected': [], 'dialog': dialog, 'send': send,
+                        'selected_list': selected}
+
+    def _close_forward_dialog(self):
+        if self.forward is not None:
+            self.window.remove(self.forward['dialog'])
+            self.forward = None
+
+    # ---- 交互行为 ----
+    def _on_click(self, control: FakeControl):
+        if control.role == 'nav':
+            if self.view == 'chats' or control.Name != 'Chats':
+                self._close_forward_dialog()
+            self._show_view({'Favorites': 'favorites', 'Contacts': 'contacts'}.get(control.Name, 'chats'))
+        elif control.role in ('menu_forward', 'menu'):
+            if control.role == 'menu_forward':
+                self._open_forward_dialog(self.context_item)
+            self._close_context_menu()
+        elif control.role == 'session':
+            self._open_chat(control.data)
+        elif control.role == 'forward_send' and self.forward is not None and control.IsEnabled:
+            for receiver in self.forward['selected']:
+                self.forwarded.append((self.forward['favorite'], receiver))
+            self._close_forward_dialog()
+        elif control.role == 'forward_cancel':
+            self._close_forward_dialog()
+
+    def _on_keys(self, control: FakeControl, keys: str):
+        modifier = False
+        for token in _KEY_TOKEN.finditer(keys):
+            if token.group(1) is not None:
+                key = token.group(1)
+                if key == 'Ctrl':
+                    modifier = True
+                    continue
+                if modifier:
+                    modifier = False
+                    continue
+                if key == 'Enter':
+                    self._on_enter(control)
+                elif key in ('Delete', 'Back'):
+                    if control.data == 'selected':
+                        control.text = ''
+                    elif key == 'Back':
+                        control.text = control.text[:-1]
+                    control.data = None
+                continue
+            text = token.group(2)
+            if modifier:
+                modifier = False
+                if text[0].lower() == 'a':
+                    control.data = 'selected'
+                text = text[1:]
+            if text:
+                control.text = text if control.data == 'selected' else control.text + text
+                control.data = None
+
+    def _on_enter(self, control: FakeControl):
+        if control.role == 'search':
+            name = self._match_contact(control.text)
+            control.text = ''
+            if name is None:
+                return
+            if self.forward is not None:
+                # 搜索后回车勾选联系人，可以连续选择多个
+                selected = self.forward['selected']
+                if name not in selected and len(selected) < self.FORWARD_LIMIT:
+                    selected.append(name)
+                    self.forward['selected_list'].append(FakeControl(self, ControlType.ListItemControl, name=name))
+                self.forward['send'].IsEnabled = True
+            else:
+                self._open_chat(name)
+        elif control.role == 'input' and self.current_chat is not None and control.text:
+            session = self.sessions[self.current_chat]
+            session.messages.append(control.text)
+            session.preview = control.text
+            self.sent.append((self.current_chat, control.text))
+            self.sent_at.append(time.perf_counter())
+            control.text = ''
+            self._refresh_messages()
@@ -0,0 +1,333 @@
+"""
+控件树快照
+
+FakeWeChatBackend.synthetic 生成的控件树结构整齐、层级固定，和真实微信的树形状、规模都不一样，
+在它上面测得的 get_session_list、get_detailed_messages 和收藏查找耗时不一定能代表线上。
+这里提供：
+- record / record_views: 按RPA看到的样子（名称、控件类型、类名、矩形、子控件）把微信控件子树序列化，
+  真实的 uiautomation 控件和 FakeControl 都可以录制
+- save / load: 紧凑的JSON文件，文件名以 .gz 结尾时gzip压缩
+- parse_inspect: 解析 Inspect 工具复制出的属性文本（如 q.txt），得到一个节点和它的直接子控件
+- ReplayBackend: 把快照载入模拟后端，按录制时的树形状回放，导航按钮在录制的页面之间切换
+
+快照格式 {'version': 1, 'recorded_at': 时间戳, 'views': {页面: 根节点}}，页面为 chats / favorites / contacts。
+节点用短键保存，取默认值的字段省略：
+t 控件类型ID, n 名称, c 类名, r [left, top, right, bottom], x 文本控件的窗口文本（与名称不同时）,
+o 是否在屏幕外, f 是否可获得键盘焦点, h 窗口句柄, k 子节点列表
+"""
+import argparse
+import gzip
+import json
+import logging
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+from ui_backend import ControlType, FakeControl, FakeWeChatBackend, Rect
+
+SNAPSHOT_VERSION = 1
+# 导航按钮名称 -> 页面，与 FakeWeChatBackend._on_click 的对应关系一致
+VIEW_BUTTONS = {'Chats': 'chats', 'Favorites': 'favorites', 'Contacts': 'contacts'}
+# Inspect 的 LocalizedControlType -> 控件类型ID
+LOCALIZED_TYPES = {
+    'button': ControlType.ButtonControl,
+    'check box': ControlType.CheckBoxControl,
+    'edit': ControlType.EditControl,
+    'list item': ControlType.ListItemControl,
+    'menu item': ControlType.MenuItemControl,
+    'list': ControlType.ListControl,
+    'document': ControlType.DocumentControl,
+    'group': ControlType.GroupControl,
+    'text': ControlType.TextControl,
+    'window': ControlType.WindowControl,
+    'pane': ControlType.PaneControl,
+}
+
+_INSPECT_FIELD = re.compile(r'^([\w.]+):\t(.*)$')
+_INSPECT_CHILD = re.compile(r'^"(.*)" ([\w ]+)$')
+_INSPECT_RECT = re.compile(r'\{l:(-?\d+) t:(-?\d+) r:(-?\d+) b:(-?\d+)\}')
+_INSPECT_TYPE = re.compile(r'\(0x([0-9A-Fa-f]+)\)')
+
+
+# ---- 录制 ----
+def record(control, max_depth: int = 32) -> dict:
+    """
+    序列化控件及其子树，只使用 GetChildren 和属性读取
+    :param max_depth: 最多录制的层数，超出的子控件不录制
+    """
+    node = _record_node(control)
+    if max_depth > 0:
+        try:
+            children = control.GetChildren()
+        except Exception as e:
+            logging.error(f"录制子控件时出错: {str(e)}")
+            children = []
+        if children:
+            node['k'] = [record(child, max_depth - 1) for child in children]
+    return node
+
+
+def _record_node(control) -> dict:
+    node = {'t': control.ControlType}
+    if control.Name:
+        node['n'] = control.Name
+    if control.ClassName:
+        node['c'] = control.ClassName
+    rect = control.BoundingRectangle
+    if rect.right or rect.bottom or rect.left or rect.top:
+        node['r'] = [rect.left, rect.top, rect.right, rect.bottom]
+    if control.ControlType == ControlType.TextControl:
+        text = control.GetWindowText() or ''
+        if text != control.Name:
+            node['x'] = text
+    if control.IsOffscreen:
+        node['o'] = 1
+    if control.IsKeyboardFocusable:
+        node['f'] = 1
+    if control.ControlType == ControlType.WindowControl and control.NativeWindowHandle:
+        node['h'] = control.NativeWindowHandle
+    return node
+
+
+def record_views(rpa, views: List[str] = ('Favorites', 'Chats'), max_depth: int = 32) -> dict:
+    """
+    依次点击导航按钮切换页面，录制每个页面下的微信主窗口，需要在UI工作线程中执行
+    :param rpa: 已找到微信窗口的 WeChatRPA
+    :param views: 导航按钮名称，最后一个页面在录制后保持打开
+    """
+    snapshot = {'version': SNAPSHOT_VERSION, 'recorded_at': time.time(), 'views': {}}
+    for button in views:
+        if not rpa._click_button(button):
+            logging.error(f"切换到 {button} 页面失败，跳过录制")
+            continue
+        snapshot['views'][VIEW_BUTTONS.get(button, button.lower())] = record(rpa.wx_window, max_depth)
+    return snapshot
+
+
+def save(snapshot: dict, path: str):
+    data = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wb') as f:
+        f.write(data)
+
+
+def load(path: str) -> dict:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        snapshot = json.loads(f.read().decode('utf-8'))
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"不支持的快照版本: {snapshot.get('version')}")
+    return snapshot
+
+
+def stats(node: dict) -> Dict[str, int]:
+    """节点总数、最大深度和各控件类型的数量"""
+    result = {'nodes': 0, 'depth': 0}
+    names = {value: name for name, value in vars(ControlType).items() if isinstance(value, int)}
+    stack = [(node, 1)]
+    while stack:
+        current, depth = stack.pop()
+        result['nodes'] += 1
+        result['depth'] = max(result['depth'], depth)
+        kind = names.get(current['t'], str(current['t']))
+        result[kind] = result.get(kind, 0) + 1
+        stack.extend((child, depth + 1) for child in current.get('k', ()))
+    return result
+
+
+# ---- Inspect 文本 ----
+def parse_inspect(text: str) -> dict:
+    """
+    解析 Inspect 的属性文本：一个控件的属性，加上 Children 中列出的直接子控件（只有名称和类型）
+    """
+    node = {'t': ControlType.PaneControl}
+    children = []
+    in_children = False
+    for line in text.splitlines():
+        if in_children and line.startswith('\t'):
+            child = _parse_inspect_child(line[1:])
+            if child is not None:
+                children.append(child)
+            continue
+        in_children = False
+        match = _INSPECT_FIELD.match(line)
+        if match is None:
+            continue
+        key, value = match.groups()
+        if key == 'Name':
+            node['n'] = _unquote(value)
+        elif key == 'ControlType':
+            type_match = _INSPECT_TYPE.search(value)
+            if type_match:
+                node['t'] = int(type_match.group(1), 16)
+        elif key == 'ClassName':
+            node['c'] = _unquote(value)
+        elif key == 'BoundingRectangle':
+            rect_match = _INSPECT_RECT.search(value)
+            if rect_match:
+                node['r'] = [int(v) for v in rect_match.groups()]
+        elif key == 'IsOffscreen' and value == 'true':
+            node['o'] = 1
+        elif key == 'IsKeyboardFocusable' and value == 'true':
+            node['f'] = 1
+        elif key == 'NativeWindowHandle':
+            try:
+                node['h'] = int(value, 16)
+            except ValueError:
+                pass
+        elif key == 'Children':
+            in_children = True
+            child = _parse_inspect_child(value)
+            if child is not None:
+                children.append(child)
+    if node.get('n') == '':
+        del node['n']
+    if children:
+        node['k'] = children
+    return node
+
+
+def _parse_inspect_child(value: str) -> Optional[dict]:
+    match = _INSPECT_CHILD.match(value.strip())
+    if match is None:
+        return None
+    name, kind = match.groups()
+    child = {'t': LOCALIZED_TYPES.get(kind, ControlType.PaneControl)}
+    if name:
+        child['n'] = name
+    return child
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+# ---- 回放 ----
+class ReplayBackend(FakeWeChatBackend):
+    """
+    按快照回放的模拟后端：控件树与录制时一致，UIA调用的统计和延迟与 FakeWeChatBackend 相同。
+    树是静态的，点击导航按钮在录制的页面之间切换，收藏项可以滚动到可见区域，
+    其余交互（打开会话、发送消息、转发）没有效果，只适合测量读取路径。
+    """
+
+    def __init__(self, snapshot: dict, **kwargs):
+        if not snapshot.get('views'):
+            raise ValueError("快照中没有录制的页面")
+        self.snapshot = snapshot
+        super().__init__(**kwargs)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'ReplayBackend':
+        return cls(load(path), **kwargs)
+
+    def _build_window(self):
+        self._handle += 1
+        self._favorites_scroll = 0
+        self._favorites_visible = self.FAVORITES_VISIBLE
+        self._favorites_list = None
+        roots = {view: self._build(node) for view, node in self.snapshot['views'].items()}
+        # 窗口控件只有一个，切换页面时替换它的子控件，已解析的窗口引用一直有效
+        self.view = next(iter(roots))
+        self.window = roots[self.view]
+        if not self.window.NativeWindowHandle:
+            self.window.NativeWindowHandle = self._handle
+        self._view_children = {view: list(root.children) for view, root in roots.items()}
+        if self._favorites_list is not None:
+            items = self._favorites_list.children
+            self._favorites_visible = max(1, sum(not item.IsOffscreen for item in items))
+            self._favorites_scroll = next((i for i, item in enumerate(items) if not item.IsOffscreen), 0)
+
+    def _build(self, node: dict) -> FakeControl:
+        control_type = node['t']
+        name = node.get('n', '')
+        control = FakeControl(self, control_type, name=name, class_name=node.get('c', ''),
+                              rect=Rect(*node['r']) if 'r' in node else None,
+                              text=node.get('x', name) if control_type == ControlType.TextControl else '',
+                              focusable=bool(node.get('f')))
+        control.IsOffscreen = bool(node.get('o'))
+        control.NativeWindowHandle = node.get('h', 0)
+        # 按RPA查找控件的条件识别模拟器需要处理的控件
+        if control_type == ControlType.ButtonControl and name in VIEW_BUTTONS:
+            control.role = 'nav'
+        elif control_type == ControlType.EditControl and name == 'Search':
+            control.role = 'search'
+        elif control_type == ControlType.ListControl and name == 'All Favorites':
+            self._favorites_list = control
+        for child_node in node.get('k', ()):
+            child = control.append(self._build(child_node))
+            if control is self._favorites_list and child.ControlType == ControlType.ListItemControl:
+                child.role = 'favorite'
+        return control
+
+    def _show_view(self, view: str):
+        if view == self.view or view not in self._view_children:
+            return
+        self.window.clear()
+        for child in self._view_children[view]:
+            self.window.append(child)
+        self.view = view
+
+    def _layout_favorites(self):
+        """只按滚动位置更新可见性，矩形保持录制时的值"""
+        for i, item in enumerate(self._favorites_list.children):
+            item.IsOffscreen = not 0 <= i - self._favorites_scroll < self._favorites_visible
+
+    def _open_chat(self, chat_name: str):
+        pass
+
+    def _refresh_contacts(self):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='微信控件树快照')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record', help='录制微信主窗口（仅Windows）')
+    record_parser.add_argument('output', help='快照文件，.gz 结尾时压缩')
+    record_parser.add_argument('--views', nargs='+', default=['Favorites', 'Chats'], choices=list(VIEW_BUTTONS))
+    record_parser.add_argument('--max-depth', type=int, default=32)
+    inspect_parser = commands.add_parser('inspect', help='把 Inspect 属性文本转换为快照')
+    inspect_parser.add_argument('input')
+    inspect_parser.add_argument('output')
+    inspect_parser.add_argument('--view', default='chats')
+    show_parser = commands.add_parser('show', help='输出快照各页面的节点统计')
+    show_parser.add_argument('input')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        import asyncio
+        from main import WeChatRPA
+
+        async def run():
+            rpa = WeChatRPA()
+            try:
+                if not await rpa.find_wechat_window():
+                    return None
+                return await rpa.ui_worker.run(record_views, rpa, args.views, args.max_depth)
+            finally:
+                rpa.ui_worker.shutdown()
+
+        snapshot = asyncio.run(run())
+        if snapshot is None:
+            logging.error("未找到微信窗口")
+            return 1
+        save(snapshot, args.output)
+    elif args.command == 'inspect':
+        with open(args.input, 'r', encoding='utf-8') as f:
+            snapshot = {'version': SNAPSHOT_VERSION, 'recorded_at': time.time(),
+                        'views': {args.view: parse_inspect(f.read())}}
+        save(snapshot, args.output)
+    else:
+        snapshot = load(args.input)
+    for view, node in snapshot['views'].items():
+        print(view, json.dumps(stats(node), ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main())
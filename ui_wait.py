@@ -0,0 +1,65 @@
+"""
+条件等待
+
+RPA流程中原来的固定 sleep 按最坏情况设定，大部分时间都在空等。
+wait_until 以较短的间隔轮询条件（控件出现、列表非空、名称变化等），条件满足立即返回，
+超时返回None；StepTimer 记录每个步骤的实际等待时间，便于继续调优。
+"""
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict
+
+
+def wait_until(predicate: Callable[[], object], timeout: float = 5.0, interval: float = 0.05,
+               sleep: Callable[[float], None] = time.sleep):
+    """
+    轮询直到 predicate() 返回真值
+    :param timeout: 最长等待时间（秒）
+    :param interval: 轮询间隔（秒）
+    :param sleep: 等待函数，RPA中使用UI后端的 sleep
+    :return: predicate 的返回值，超时返回None
+    """
+    deadline = time.monotonic() + timeout
+    waited = 0.0  # 累计轮询间隔，sleep 被缩放或替换时同样能结束等待
+    while True:
+        try:
+            result = predicate()
+        except Exception as e:
+            logging.debug(f"等待条件检查出错: {str(e)}")
+            result = None
+        if result:
+            return result
+        if waited >= timeout or time.monotonic() >= deadline:
+            return None
+        sleep(interval)
+        waited += interval
+
+
+class StepTimer:
+    """记录每个步骤最近若干次的耗时和超时次数"""
+
+    def __init__(self, sample_size: int = 200):
+        self.sample_size = sample_size
+        self.samples: Dict[str, Deque[float]] = {}
+        self.timeouts: Dict[str, int] = {}
+
+    def record(self, step: str, seconds: float, timed_out: bool = False):
+        if step not in self.samples:
+            self.samples[step] = deque(maxlen=self.sample_size)
+            self.timeouts[step] = 0
+        self.samples[step].append(seconds)
+        if timed_out:
+            self.timeouts[step] += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for step, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[step] = {
+                'count': len(ordered),
+                'mean': sum(ordered) / len(ordered),
+                'max': ordered[-1],
+                'timeouts': self.timeouts[step],
+            }
+        return result
@@ -0,0 +1,39 @@
+"""
+UI自动化工作线程
+
+uiautomation 基于COM，阻塞的 sleep 和控件查找如果直接在事件循环里执行，
+转发一次收藏的几秒钟内 WebSocket 服务无法接受连接、读取消息或广播。
+UIWorker 把所有UI调用放到同一个专用线程中顺序执行（与COM单线程套间的要求一致），
+异步侧提交任务后 await 结果。
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class UIWorker:
+    def __init__(self, initializer: Optional[Callable[[], None]] = None, threaded: bool = True):
+        """
+        :param initializer: 工作线程启动时执行的初始化函数（如COM初始化）
+        :param threaded: 为False时直接在事件循环中执行，仅用于对比测试
+        """
+        self.threaded = threaded
+        self.tracer = None  # 开启任务追踪时把每次提交的函数记录为 span（tracer.Tracer）
+        self._executor = None
+        if threaded:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ui-worker',
+                                                initializer=initializer)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """在UI线程中执行 fn(*args, **kwargs) 并等待结果"""
+        if self.tracer is not None:
+            fn = self.tracer.wrap(fn)
+        if not self.threaded:
+            return fn(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)